@@ -0,0 +1,31 @@
+from fastapi import APIRouter, HTTPException, Header, Query, Request
+from app.services.image.callbacks import callback_registry, task_id_of
+
+# Вебхуки провайдеров: без API-ключа (его у провайдера нет), проверяется подпись адреса или общий секрет
+router = APIRouter()
+
+
+@router.post("/{provider}", summary="Вебхук провайдера о готовности картинки")
+async def provider_callback_endpoint(
+    provider: str,
+    request: Request,
+    nonce: str | None = Query(None, description="Случайная часть подписанного адреса"),
+    sig: str | None = Query(None, description="Подпись адреса (HMAC от IMAGE_CALLBACK_SECRET)"),
+    authorization: str | None = Header(None)
+):
+    # kie.ai вызывает подписанный адрес из callBackUrl, Leonardo передаёт секрет в Authorization: Bearer <секрет>
+    token = authorization[7:].strip() if authorization and authorization.lower().startswith("bearer ") else None
+    if not (callback_registry.check_signature(provider, nonce, sig) or callback_registry.check_secret(token)):
+        raise HTTPException(status_code=403, detail="Invalid callback signature")
+
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Callback body must be JSON")
+
+    task_id = task_id_of(provider, payload) if isinstance(payload, dict) else None
+    if not task_id:
+        raise HTTPException(status_code=400, detail=f"No task id in {provider} callback")
+
+    delivered = callback_registry.resolve(task_id, payload)
+    return {"ok": True, "delivered": delivered}
@@ -0,0 +1,32 @@
+import time
+
+from fastapi import APIRouter, HTTPException, Query, Header, Response
+from fastapi.responses import FileResponse
+from app.services.blobstore import result_store, content_type_of
+
+# Отдача результатов по подписанным ссылкам (return=url). Без API-ключа: доступ даёт подпись.
+# FileResponse отдаёт файл через sendfile и сам поддерживает Range (докачка, перемотка аудио)
+router = APIRouter()
+
+
+@router.api_route("/files/{name}", methods=["GET", "HEAD"], summary="Результат по подписанной ссылке")
+async def file_endpoint(
+    name: str,
+    expires: int = Query(..., description="Unix-время окончания действия ссылки"),
+    sig: str = Query(..., description="Подпись ссылки"),
+    filename: str = Query("", description="Имя файла для Content-Disposition (входит в подпись)"),
+    if_none_match: str | None = Header(None),
+):
+    if not result_store.verify(name, expires, sig, filename):
+        raise HTTPException(status_code=403, detail="Invalid or expired link")
+    path = result_store.locate(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="File is gone (retention period is over)")
+
+    # Имя — хэш содержимого, поэтому ETag постоянный, а повторная загрузка — 304 без тела
+    etag = f'"{name.split(".", 1)[0]}"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={max(expires - int(time.time()), 0)}"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(path, media_type=content_type_of(name), headers=headers, filename=filename or None)
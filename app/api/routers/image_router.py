@@ -1,6 +1,22 @@
-from fastapi import APIRouter, HTTPException, Query, Header, Response
-from fastapi.concurrency import run_in_threadpool
-from app.services.image import generate_image_sync
+import json
+import asyncio
+from typing import List, Literal
+from pydantic import BaseModel, Field
+from fastapi import APIRouter, HTTPException, Query, Header, Request, Response
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
+from app.services.image import generate_image_async, generate_image_stream, provider_stats
+from app.services.image.http_client import pool_stats
+from app.services.image.gradio_pool import gradio_pool
+from app.services.image.cache import image_cache, cached_generate, make_key
+from app.services.image.jobs import image_jobs, JobQueueFull, DONE, FAILED
+from app.services.image.callbacks import callback_registry
+from app.services.image.poller import poll_scheduler
+from app.services.image.batch import generate_batch, build_zip, MAX_BATCH_ITEMS
+from app.services.image.stream import ImageStream, remove_file
+from app.services.image.transform import OutputSpec, cached_transform, extension, sniff_type
+from app.services.blobstore import result_store
+from app.services.tracing import span
 
 router = APIRouter()
 
@@ -10,33 +26,314 @@ bokeh, bad anatomy, bad hands, missing fingers, extra digit, fewer digits, cropp
 saturated, disfigured, ugly, mutation, deformed, glitched, artifacts, tiling, poorly drawn face, bad proportions, gross proportions, malformed limbs, missing arms, 
 missing legs, extra arms, extra legs, fused fingers, too many fingers, long neck
 """
+
+
+def _image_response(image_bytes: bytes, cache_status: str, content_type: str | None = None) -> Response:
+    content_type = content_type or sniff_type(image_bytes)
+    return Response(
+        content=image_bytes,
+        media_type=content_type,
+        headers={"Content-Disposition": f"attachment; filename=generated_image.{extension(content_type)}",
+                 "X-Cache": cache_status}
+    )
+
+
+async def _output_response(image_bytes: bytes, cache_status: str, spec: OutputSpec,
+                           use_cache: bool, base_url: str | None = None):
+    """
+    Отдать картинку в запрошенном формате/размере; перекодированные варианты тоже кэшируются.
+    base_url задан (return=url) — вместо байтов JSON с подписанной ссылкой на файл в хранилище результатов.
+    """
+    image_bytes, content_type = await cached_transform(image_bytes, spec, use_cache)
+    if base_url is not None:
+        blob = await result_store.aput(image_bytes, extension(content_type))
+        return {**result_store.url(blob, base_url), "cache": cache_status}
+    return _image_response(image_bytes, cache_status, content_type)
+
+
+async def _streaming_image_response(params: dict, hedge_delay: float | None, use_cache: bool,
+                                    timeout: float | None = None) -> Response:
+    """
+    Отдать картинку по мере скачивания у провайдера (первый байт — сразу, без буфера на всю картинку).
+    При включённом кэше байты параллельно собираются и кладутся в кэш после отдачи.
+    """
+    cache_key = None
+    if image_cache is not None and use_cache:
+        cache_key = make_key(**params)
+        cached = await image_cache.aget(cache_key)
+        if cached is not None:
+            return _image_response(cached, "HIT")
+
+    image = await generate_image_stream(**params, hedge_delay=hedge_delay, timeout=timeout)
+    headers = {"Content-Disposition": f"attachment; filename=generated_image.{extension(image.content_type)}",
+               "X-Cache": "MISS" if cache_key is not None else "BYPASS"}
+    if image.path is not None:
+        return await _file_image_response(image, cache_key, headers)
+
+    async def body():
+        chunks = [] if cache_key is not None else None
+        async for chunk in image:
+            if chunks is not None:
+                chunks.append(chunk)
+            yield chunk
+        if chunks is not None:
+            await image_cache.aput(cache_key, b"".join(chunks))
+
+    if image.size is not None:
+        headers["Content-Length"] = str(image.size)
+    return StreamingResponse(body(), media_type=image.content_type, headers=headers)
+
+
+async def _file_image_response(image: ImageStream, cache_key: str | None, headers: dict) -> FileResponse:
+    """
+    Картинка уже лежит файлом (gradio-Space): отдаём через sendfile, не читая в память.
+    С кэшем файл переезжает в дисковый кэш переименованием и отдаётся оттуда,
+    без кэша — удаляется после отправки.
+    """
+    path = image.detach()
+    if cache_key is not None:
+        with span("cache_put"):
+            cached_path = await image_cache.aadopt(cache_key, path)
+        if cached_path is not None:
+            return FileResponse(cached_path, media_type=image.content_type, headers=headers)
+    return FileResponse(path, media_type=image.content_type, headers=headers,
+                        background=BackgroundTask(remove_file, path))
+
+
 @router.post("/generate", summary="Генерация изображения (Playground v2.5)")
 async def generate_image_endpoint(
+    request: Request,
     prompt: str = Query(..., description="Описание изображения на английском"),
     negative_prompt: str = Query(CREEPY_NEGATIVE_PROMPT, description="Чего не должно быть"),
     width: int = Query(1024, ge=256, le=2048, description="Ширина"),
     height: int = Query(680, ge=256, le=2048, description="Высота (3:2)"),
+    hedge_delay: float | None = Query(None, ge=0, le=120, description="Hedged-режим: через сколько секунд запускать следующего провайдера (0 — гонка всех сразу)"),
+    timeout: float | None = Query(None, ge=1, le=600, description="Бюджет запроса в секундах: провайдеры, которые не успеют, пропускаются; по истечении — 504"),
+    cache: bool = Query(True, description="Брать результат из кэша (false — сгенерировать заново)"),
+    stream: bool = Query(False, description="Отдавать картинку по мере скачивания у провайдера (без буферизации; не сочетается с format/fit)"),
+    format: Literal["png", "jpeg", "webp"] | None = Query(None, description="Формат ответа (по умолчанию — как отдал провайдер)"),
+    quality: int = Query(85, ge=1, le=100, description="Качество для jpeg/webp"),
+    fit: Literal["none", "resize", "crop"] = Query("none", description="Подогнать под width×height: resize — растянуть, crop — заполнить и обрезать по центру"),
+    return_mode: Literal["binary", "url"] = Query("binary", alias="return", description="binary — картинка в теле ответа, url — JSON с подписанной короткоживущей ссылкой"),
     x_token: str = Header(..., description="API Key") # Оставляем для явности в Swagger, хотя main.py проверяет
 ):
+    params = {"prompt": prompt, "negative_prompt": negative_prompt, "width": width, "height": height}
+    spec = OutputSpec(format, quality, fit, width, height)
+    base_url = str(request.base_url) if return_mode == "url" else None
     try:
-        # Запускаем тяжелую функцию в threadpool, чтобы не блокировать API
-        image_bytes = await run_in_threadpool(
-            generate_image_sync,
-            prompt=prompt,
-            negative_prompt=negative_prompt,
-            width=width,
-            height=height
+        # Перекодирование требует картинку целиком — с format/fit поток не используется
+        if stream and format is None and fit == "none" and base_url is None:
+            return await _streaming_image_response(params, hedge_delay, cache, timeout)
+
+        # Асинхронный оркестратор: REST-провайдеры ждут в корутинах,
+        # в потоки уходят только блокирующие gradio-провайдеры
+        image_bytes, cache_status = await cached_generate(
+            params,
+            lambda: generate_image_async(
+                prompt=prompt,
+                negative_prompt=negative_prompt,
+                width=width,
+                height=height,
+                hedge_delay=hedge_delay,
+                timeout=timeout
+            ),
+            use_cache=cache,
         )
 
         # Возвращаем картинку напрямую.
         # n8n увидит это как бинарный файл.
-        return Response(
-            content=image_bytes,
-            media_type="image/png",
-            headers={"Content-Disposition": "attachment; filename=generated_image.png"}
-        )
+        return await _output_response(image_bytes, cache_status, spec, cache, base_url)
 
     except TimeoutError:
         raise HTTPException(status_code=504, detail="Generation timed out (Space queue is too long)")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
+
+
+@router.get("/providers", summary="Здоровье провайдеров и текущий порядок цепочки")
+async def providers_endpoint():
+    return provider_stats()
+
+
+@router.get("/pool-stats", summary="Статистика пулов HTTP-соединений и gradio-клиентов")
+async def pool_stats_endpoint():
+    return {**pool_stats(), "gradio": gradio_pool.stats(), "callbacks": callback_registry.stats(),
+            "poller": poll_scheduler.stats()}
+
+
+@router.get("/cache-stats", summary="Статистика кэша картинок")
+async def cache_stats_endpoint():
+    return image_cache.stats() if image_cache is not None else {"enabled": False}
+
+
+# === Фоновые задачи: ответ с id сразу, картинка — отдельным запросом ===
+
+def _get_job(job_id: str):
+    job = image_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found (unknown id or expired)")
+    return job
+
+
+@router.post("/jobs", status_code=202, summary="Поставить генерацию в очередь (ответ сразу, без ожидания)")
+async def submit_job_endpoint(
+    prompt: str = Query(..., description="Описание изображения на английском"),
+    negative_prompt: str = Query(CREEPY_NEGATIVE_PROMPT, description="Чего не должно быть"),
+    width: int = Query(1024, ge=256, le=2048, description="Ширина"),
+    height: int = Query(680, ge=256, le=2048, description="Высота (3:2)"),
+    hedge_delay: float | None = Query(None, ge=0, le=120, description="Hedged-режим: через сколько секунд запускать следующего провайдера (0 — гонка всех сразу)"),
+    timeout: float | None = Query(None, ge=1, le=600, description="Бюджет запроса в секундах: провайдеры, которые не успеют, пропускаются; по истечении — 504"),
+    cache: bool = Query(True, description="Брать результат из кэша (false — сгенерировать заново)"),
+    preview: bool = Query(False, description="Прогрессивный режим: параллельно быстрый провайдер делает превью (событие preview, затем done)"),
+    x_token: str = Header(..., description="API Key")
+):
+    params = {"prompt": prompt, "negative_prompt": negative_prompt,
+              "width": width, "height": height, "hedge_delay": hedge_delay, "timeout": timeout}
+    try:
+        job = image_jobs.submit(params, use_cache=cache, preview=preview)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    base = f"/api/image/jobs/{job.id}"
+    response = {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": base,
+        "result_url": f"{base}/result",
+        "events_url": f"{base}/events",
+    }
+    if preview:
+        response["preview_url"] = f"{base}/preview"
+    return response
+
+
+@router.get("/jobs/{job_id}", summary="Статус фоновой генерации")
+async def job_status_endpoint(job_id: str):
+    return _get_job(job_id).summary()
+
+
+@router.get("/jobs/{job_id}/result", summary="Картинка фоновой генерации")
+async def job_result_endpoint(
+    job_id: str,
+    request: Request,
+    format: Literal["png", "jpeg", "webp"] | None = Query(None, description="Формат ответа (по умолчанию — как отдал провайдер)"),
+    quality: int = Query(85, ge=1, le=100, description="Качество для jpeg/webp"),
+    fit: Literal["none", "resize", "crop"] = Query("none", description="Подогнать под width×height: resize — растянуть, crop — заполнить и обрезать по центру"),
+    return_mode: Literal["binary", "url"] = Query("binary", alias="return", description="binary — картинка в теле ответа, url — JSON с подписанной короткоживущей ссылкой"),
+):
+    job = _get_job(job_id)
+    if job.status == DONE:
+        spec = OutputSpec(format, quality, fit, job.params["width"], job.params["height"])
+        base_url = str(request.base_url) if return_mode == "url" else None
+        return await _output_response(job.result, job.cache_status, spec, job.use_cache, base_url)
+    if job.status == FAILED:
+        if job.timed_out:
+            raise HTTPException(status_code=504, detail="Generation timed out (Space queue is too long)")
+        raise HTTPException(status_code=500, detail=f"Generation failed: {job.error}")
+    # Ещё в работе — клиент повторит запрос позже
+    raise HTTPException(status_code=409, detail=f"Job is {job.status}", headers={"Retry-After": "5"})
+
+
+@router.get("/jobs/{job_id}/preview", summary="Быстрое превью фоновой генерации (прогрессивный режим)")
+async def job_preview_endpoint(
+    job_id: str,
+    request: Request,
+    format: Literal["png", "jpeg", "webp"] | None = Query(None, description="Формат ответа (по умолчанию — как отдал провайдер)"),
+    quality: int = Query(85, ge=1, le=100, description="Качество для jpeg/webp"),
+    return_mode: Literal["binary", "url"] = Query("binary", alias="return", description="binary — картинка в теле ответа, url — JSON с подписанной короткоживущей ссылкой"),
+):
+    job = _get_job(job_id)
+    if not job.preview:
+        raise HTTPException(status_code=404, detail="Job was submitted without preview=true")
+    if job.preview_result is not None:
+        spec = OutputSpec(format, quality, "none", job.params["width"], job.params["height"])
+        base_url = str(request.base_url) if return_mode == "url" else None
+        # Сама картинка превью в кэш не попадает; перекодированный вариант — по ключу от её байтов
+        return await _output_response(job.preview_result, "BYPASS", spec, job.use_cache, base_url)
+    if job.status in (DONE, FAILED):
+        # Основная генерация успела раньше (или упала) — превью уже не будет
+        raise HTTPException(status_code=404, detail=f"No preview: job is {job.status}")
+    raise HTTPException(status_code=409, detail=f"Preview is not ready, job is {job.status}",
+                        headers={"Retry-After": "2"})
+
+
+@router.get("/jobs/{job_id}/events", summary="Прогресс фоновой генерации (Server-Sent Events)")
+async def job_events_endpoint(job_id: str):
+    job = _get_job(job_id)
+
+    async def stream():
+        async for event in image_jobs.events(job):
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            if event["phase"] == "preview":
+                event = {**event, "url": f"/api/image/jobs/{job.id}/preview"}
+            yield f"event: {event['phase']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+
+# === Пакетная генерация ===
+
+class BatchItem(BaseModel):
+    prompt: str = Field(..., description="Описание изображения на английском")
+    negative_prompt: str = Field(CREEPY_NEGATIVE_PROMPT, description="Чего не должно быть")
+    width: int = Field(1024, ge=256, le=2048, description="Ширина")
+    height: int = Field(680, ge=256, le=2048, description="Высота (3:2)")
+
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem] = Field(..., min_length=1, max_length=MAX_BATCH_ITEMS)
+    hedge_delay: float | None = Field(None, ge=0, le=120, description="Hedged-режим для каждой картинки")
+    timeout: float | None = Field(None, ge=1, le=600, description="Бюджет в секундах: для zip — на весь пакет, для jobs — на каждую задачу")
+    cache: bool = Field(True, description="Брать результаты из кэша")
+    format: Literal["png", "jpeg", "webp"] | None = Field(None, description="Формат картинок в архиве (по умолчанию — как отдал провайдер)")
+    quality: int = Field(85, ge=1, le=100, description="Качество для jpeg/webp")
+    fit: Literal["none", "resize", "crop"] = Field("none", description="Подогнать каждую картинку под её width×height")
+    mode: Literal["zip", "jobs"] = Field("zip", description="zip — дождаться и вернуть архив, jobs — вернуть id фоновых задач")
+
+
+@router.post("/batch", summary="Пакетная генерация: несколько картинок параллельно (ZIP или фоновые задачи)")
+async def batch_endpoint(
+    batch: BatchRequest,
+    x_token: str = Header(..., description="API Key")
+):
+    items = [item.model_dump() for item in batch.items]
+
+    if batch.mode == "jobs":
+        # Каждая картинка — отдельная фоновая задача; переполнение очереди не отменяет уже принятые
+        jobs = []
+        for index, params in enumerate(items):
+            try:
+                job = image_jobs.submit({**params, "hedge_delay": batch.hedge_delay,
+                                          "timeout": batch.timeout}, use_cache=batch.cache)
+                jobs.append({"index": index, "job_id": job.id, "status_url": f"/api/image/jobs/{job.id}",
+                             "result_url": f"/api/image/jobs/{job.id}/result"})
+            except JobQueueFull as e:
+                jobs.append({"index": index, "job_id": None, "error": str(e), "retry_after": e.retry_after})
+        return {"jobs": jobs}
+
+    results = await generate_batch(items, hedge_delay=batch.hedge_delay, use_cache=batch.cache,
+                                   timeout=batch.timeout, output=OutputSpec(batch.format, batch.quality, batch.fit))
+    succeeded = sum(1 for r in results if r.data is not None)
+    if not succeeded:
+        raise HTTPException(status_code=500, detail={
+            "message": "All batch items failed",
+            "errors": [{"index": r.index, "error": r.error} for r in results],
+        })
+
+    archive = await asyncio.to_thread(build_zip, results)
+    return Response(
+        content=archive,
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": "attachment; filename=images.zip",
+            "X-Batch-Succeeded": str(succeeded),
+            "X-Batch-Failed": str(len(results) - succeeded),
+        }
+    )
@@ -0,0 +1,51 @@
+import os
+import hmac
+
+from fastapi import APIRouter, HTTPException, Header, Query, Response
+from app.services.metrics import metrics, CONTENT_TYPE
+from app.services import tracing
+
+# Метрики и трассы раскрывают промпты и тайминги провайдеров, поэтому открытыми не бывают:
+# нужен x-token (API_KEY) или, для скрейпера, Authorization: Bearer <METRICS_TOKEN>
+router = APIRouter()
+
+_TOKEN = os.getenv("METRICS_TOKEN", "")
+_API_KEY = os.getenv("API_KEY", "")
+
+
+def _check_token(authorization: str | None, x_token: str | None) -> None:
+    if _API_KEY and x_token and hmac.compare_digest(x_token, _API_KEY):
+        return
+    if _TOKEN:
+        token = authorization[7:] if authorization and authorization.lower().startswith("bearer ") else ""
+        if hmac.compare_digest(token, _TOKEN):
+            return
+    raise HTTPException(status_code=401, detail="Invalid API Key or metrics token")
+
+
+@router.get("/metrics", summary="Метрики в формате Prometheus")
+async def metrics_endpoint(authorization: str | None = Header(None), x_token: str | None = Header(None)):
+    _check_token(authorization, x_token)
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
+
+
+# Трассы запросов (фазы с длительностями) — только при TRACE_DEBUG=1, id приходит в заголовке X-Trace-Id
+@router.get("/debug/traces", summary="Последние трассы запросов (TRACE_DEBUG)")
+async def traces_endpoint(limit: int = Query(20, ge=1, le=200), authorization: str | None = Header(None),
+                          x_token: str | None = Header(None)):
+    _check_token(authorization, x_token)
+    if not tracing.TRACE_DEBUG:
+        raise HTTPException(status_code=404, detail="Tracing debug mode is off (TRACE_DEBUG=1)")
+    return {"traces": tracing.recent_traces(limit)}
+
+
+@router.get("/debug/traces/{trace_id}", summary="Трасса запроса по X-Trace-Id (TRACE_DEBUG)")
+async def trace_endpoint(trace_id: str, authorization: str | None = Header(None),
+                         x_token: str | None = Header(None)):
+    _check_token(authorization, x_token)
+    if not tracing.TRACE_DEBUG:
+        raise HTTPException(status_code=404, detail="Tracing debug mode is off (TRACE_DEBUG=1)")
+    trace = tracing.get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (unknown id or evicted)")
+    return trace
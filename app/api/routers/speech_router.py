@@ -1,9 +1,11 @@
 import os
 
 from urllib.parse import quote
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Header, Response
+from typing import Literal
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Header, Request, Response
 
 from app.services.speech import speech_to_text, text_to_speech_edge
+from app.services.blobstore import result_store
 
 router = APIRouter()
 
@@ -42,10 +44,12 @@ async def speech_to_text_endpoint(
 # ----------------------------
 @router.post("/text-to-speech", summary="Синтез речи (Edge TTS - High Quality)")
 async def text_to_speech_endpoint(
+        request: Request,
         text: str = Query(..., description="Текст для озвучки"),
         voice: str = Query("ru-RU-DmitryNeural", description="Голос"),
         # Теперь можно писать по-русски: "История о вампире.mp3"
         filename: str = Query("audio.mp3", description="Имя файла (можно на русском)"),
+        return_mode: Literal["binary", "url"] = Query("binary", alias="return", description="binary — аудио в теле ответа, url — JSON с подписанной короткоживущей ссылкой"),
         x_token: str = Header(..., description="API Key")
 ):
     temp_path = None
@@ -53,6 +57,15 @@ async def text_to_speech_endpoint(
         # 1. Генерируем
         temp_path = await text_to_speech_edge(text, voice)
 
+        if not filename.endswith(".mp3"):
+            filename += ".mp3"
+
+        if return_mode == "url":
+            # Файл переезжает в хранилище результатов переименованием, без чтения в память
+            blob = await result_store.aadopt(temp_path, "mp3")
+            temp_path = None
+            return result_store.url(blob, str(request.base_url), filename=filename)
+
         # 2. Читаем
         with open(temp_path, "rb") as f:
             audio_bytes = f.read()
@@ -61,15 +74,11 @@ async def text_to_speech_endpoint(
         os.remove(temp_path)
         temp_path = None
 
-        # 4. Проверка расширения
-        if not filename.endswith(".mp3"):
-            filename += ".mp3"
-
-        # 5. КОДИРОВАНИЕ ИМЕНИ ФАЙЛА (Магия для поддержки русского языка)
+        # 4. КОДИРОВАНИЕ ИМЕНИ ФАЙЛА (Магия для поддержки русского языка)
         # Мы превращаем "Привет.mp3" в "%D0%9F%D1%80%D0%B8%D0%B2%D0%B5%D1%82.mp3"
         encoded_filename = quote(filename)
 
-        # 6. Формируем правильный заголовок
+        # 5. Формируем правильный заголовок
         # filename*=UTF-8''... — это стандарт, который понимают современные системы (включая n8n и браузеры)
         content_disposition = f"attachment; filename*=UTF-8''{encoded_filename}"
 
@@ -1,9 +1,21 @@
+import time
+_IMPORT_STARTED = time.perf_counter()  # до остальных импортов: замер времени старта воркера
+
 import os
+import asyncio
 import logging
 
 from fastapi import FastAPI, Header, HTTPException, Depends
 from fastapi.security.api_key import APIKeyHeader
-from app.api.routers import speech_router, image_router
+from app.api.routers import speech_router, image_router, callback_router, metrics_router, files_router
+from app.services.image import warm_up_providers
+from app.services.image.http_client import aclose_async_client
+from app.services.image.jobs import image_jobs
+from app.services.image import transform
+from app.services.metrics import track_executor
+from app.services.admission import AdmissionMiddleware, ADMISSION_ENABLED, header
+from app.services.startup import report_imports
+from app.services.tracing import TracingMiddleware, SERVER_TIMING_ENABLED, TRACE_DEBUG
 from dotenv import load_dotenv
 
 # --- 0. ПОДГОТОВКА ПАПОК ---
@@ -44,6 +56,11 @@ async def get_api_key(api_key: str = Depends(api_key_header)) -> str:
         raise HTTPException(status_code=401, detail="Invalid API Key")
     return api_key
 
+
+def has_api_key(scope: dict) -> bool:
+    """Та же проверка для middleware, до роутинга"""
+    return header(scope, b"x-token") == API_KEY
+
 # ---- Создаём FastAPI с Swagger ----
 app = FastAPI(
     title="AI Services API",
@@ -51,6 +68,16 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Ограниченные очереди перед генерацией и распознаванием: при перегрузке — сразу 503 + Retry-After.
+# Запросы без ключа слот не занимают — их отклонит get_api_key
+if ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware, authorized=has_api_key)
+
+# Фазы запроса в заголовке Server-Timing. Добавляется последним, то есть снаружи:
+# ожидание в очереди допуска тоже попадает в трассу
+if SERVER_TIMING_ENABLED or TRACE_DEBUG:
+    app.add_middleware(TracingMiddleware)
+
 # ---- Подключаем роутеры с авторизацией ----
 app.include_router(
     speech_router.router,
@@ -67,4 +94,38 @@ app.include_router(
     tags=["Image Generation"]
 )
 
-logger.info("Application started! Logs directory is ready.")
\ No newline at end of file
+# Вебхуки провайдеров (kie.ai, Leonardo) — без API Key, защищены секретом IMAGE_CALLBACK_SECRET
+app.include_router(
+    callback_router.router,
+    prefix="/api/image/callbacks",
+    tags=["Image Generation"]
+)
+
+# Результаты по подписанным ссылкам (return=url) — без API Key, доступ даёт подпись
+app.include_router(files_router.router, tags=["Files"])
+
+# Метрики Prometheus и /debug/traces — по API Key или METRICS_TOKEN
+app.include_router(metrics_router.router, tags=["Monitoring"])
+
+
+async def _track_default_executor():
+    # asyncio.to_thread (STT, blocking-провайдеры, диск кэша) работает в пуле потоков event loop
+    loop = asyncio.get_running_loop()
+    track_executor("asyncio_default", lambda: getattr(loop, "_default_executor", None))
+
+app.add_event_handler("startup", _track_default_executor)
+
+# Прогрев gradio-клиентов в фоне — по желанию: он импортирует gradio_client и ходит в каждый Space
+# на каждом старте воркера. Без него первый запрос к Space платит за импорт и создание клиента
+if os.getenv("IMAGE_PREWARM", "0") == "1":
+    app.add_event_handler("startup", warm_up_providers)
+
+# Закрываем общий httpx-клиент провайдеров при остановке
+app.add_event_handler("shutdown", aclose_async_client)
+# Останавливаем воркеры фоновых генераций
+app.add_event_handler("shutdown", image_jobs.shutdown)
+# и процессы перекодирования картинок
+app.add_event_handler("shutdown", transform.shutdown)
+
+logger.info("Application started! Logs directory is ready.")
+report_imports(_IMPORT_STARTED)
\ No newline at end of file
@@ -0,0 +1,212 @@
+import os
+import math
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+from starlette.responses import JSONResponse
+
+from app.services.metrics import metrics
+from app.services.tracing import record
+
+logger = logging.getLogger(__name__)
+
+# Допуск запросов к тяжёлым эндпоинтам: не больше max_concurrency одновременно и не больше
+# max_queue в очереди. Остальным — сразу 503 с Retry-After, а не тихая очередь в пуле потоков,
+# которую клиент всё равно не дождётся. Переопределение без правки кода, например:
+# ADMISSION_LIMITS={"image": {"max_concurrency": 8, "max_queue": 16}, "stt": {"max_concurrency": 1}}
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+_ENV_LIMITS = os.getenv("ADMISSION_LIMITS")
+# Дольше этого запрос в очереди не ждёт — отвечаем 503, пока клиент не отвалился сам
+_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "30"))
+_ALPHA = 0.2  # вес нового замера в EWMA времени обслуживания
+
+# Эндпоинт -> (max_concurrency, max_queue, оценка времени обслуживания до первых замеров, сек)
+_DEFAULTS = {
+    "image": (16, 32, 30.0),
+    "image_batch": (2, 4, 60.0),
+    "stt": (2, 8, 20.0),
+    "tts": (8, 16, 5.0),
+}
+
+# Какие пути под каким контролем (метод, путь) -> эндпоинт
+ROUTES = {
+    ("POST", "/api/image/generate"): "image",
+    ("POST", "/api/image/batch"): "image_batch",
+    ("POST", "/api/speech-to-text"): "stt",
+    ("POST", "/api/text-to-speech"): "tts",
+}
+
+QUEUE_WAIT_SECONDS = metrics.histogram(
+    "admission_queue_wait_seconds", "Time a request waited for an admission slot", ["endpoint"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60),
+)
+REJECTED = metrics.counter("admission_rejected_total", "Requests shed with 503", ["endpoint", "reason"])
+
+
+class Overloaded(Exception):
+    def __init__(self, endpoint: str, reason: str, retry_after: int):
+        super().__init__(f"{endpoint} is overloaded ({reason}), retry in {retry_after}s")
+        self.endpoint = endpoint
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Ограниченная очередь перед эндпоинтом. Живёт в одном event loop, поэтому без блокировок.
+    Освободившийся слот передаётся первому ждущему напрямую (FIFO), минуя новых.
+    """
+
+    def __init__(self, endpoint: str, max_concurrency: int, max_queue: int,
+                 service_time: float, max_wait: float = _MAX_WAIT):
+        self.endpoint = endpoint
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.service_ewma = service_time
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Через сколько секунд, судя по недавнему времени обслуживания, освободится место"""
+        estimate = self.service_ewma * (self.queued + 1) / self.max_concurrency
+        return min(max(math.ceil(estimate), 1), 600)
+
+    def _reject(self, reason: str) -> Overloaded:
+        REJECTED.inc(endpoint=self.endpoint, reason=reason)
+        error = Overloaded(self.endpoint, reason, self.retry_after())
+        logger.warning(f"🚦 [Admission] {error} (active={self.active}, queued={self.queued})")
+        return error
+
+    async def acquire(self) -> None:
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            QUEUE_WAIT_SECONDS.observe(0.0, endpoint=self.endpoint)
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Слот уже передали нам, а ждать перестали — отдаём следующему
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("wait_timeout") from None
+            raise
+        QUEUE_WAIT_SECONDS.observe(time.monotonic() - started, endpoint=self.endpoint)
+        record("admission_wait", started)
+
+    def release(self, service_time: Optional[float] = None) -> None:
+        if service_time is not None:
+            self.service_ewma = _ALPHA * service_time + (1 - _ALPHA) * self.service_ewma
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # слот переходит ждущему, active не меняется
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {"active": self.active, "queued": self.queued, "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue, "service_ewma": round(self.service_ewma, 2)}
+
+
+def _load_overrides() -> Dict[str, dict]:
+    if not _ENV_LIMITS:
+        return {}
+    try:
+        data = json.loads(_ENV_LIMITS)
+    except json.JSONDecodeError as e:
+        logger.error(f"❌ [Admission] ADMISSION_LIMITS is not valid JSON: {e}")
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _build_controllers() -> Dict[str, AdmissionController]:
+    overrides = _load_overrides()
+    controllers = {}
+    for endpoint, (concurrency, queue, service_time) in _DEFAULTS.items():
+        override = overrides.get(endpoint, {})
+        controllers[endpoint] = AdmissionController(
+            endpoint,
+            int(override.get("max_concurrency", concurrency)),
+            int(override.get("max_queue", queue)),
+            service_time,
+        )
+    return controllers
+
+
+controllers = _build_controllers()
+
+metrics.gauge("admission_in_flight", "Requests holding an admission slot", ["endpoint"],
+              lambda: {(name,): c.active for name, c in controllers.items()})
+metrics.gauge("admission_queued", "Requests waiting for an admission slot", ["endpoint"],
+              lambda: {(name,): c.queued for name, c in controllers.items()})
+
+
+def header(scope: dict, name: bytes) -> Optional[str]:
+    """Значение заголовка из ASGI scope (name — в нижнем регистре)"""
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class AdmissionMiddleware:
+    """
+    ASGI-middleware: слот держится до конца отправки ответа (включая потоковую отдачу картинки),
+    а отказ случается до чтения тела запроса — загрузка аудио при перегрузке не читается зря.
+    authorized(scope) — проверка API-ключа: запросы без него слот не занимают и не вытесняют
+    настоящих клиентов, а сразу идут дальше, где получат 401.
+    """
+
+    def __init__(self, app, routes: Optional[Dict[tuple, str]] = None,
+                 authorized: Optional[Callable[[dict], bool]] = None):
+        self.app = app
+        self.routes = ROUTES if routes is None else routes
+        self.authorized = authorized
+
+    async def __call__(self, scope, receive, send):
+        endpoint = self.routes.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        controller = controllers.get(endpoint) if endpoint else None
+        if controller is None or (self.authorized is not None and not self.authorized(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await controller.acquire()
+        except Overloaded as e:
+            response = JSONResponse({"detail": str(e)}, status_code=503,
+                                    headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        status = []
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Для Retry-After важно время успешных ответов: мгновенные 4xx оценку не занижают
+            ok = bool(status) and status[0] < 400
+            controller.release(time.monotonic() - started if ok else None)
@@ -0,0 +1,200 @@
+import os
+import re
+import hmac
+import time
+import shutil
+import asyncio
+import hashlib
+import logging
+import secrets
+import threading
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+# Готовые результаты (картинки, аудио) на диске, имя файла — sha256 содержимого.
+# Клиент получает подписанную короткоживущую ссылку, файл отдаётся с диска через sendfile,
+# а не копируется через память Python на каждом шаге.
+_DIR = os.getenv("RESULT_STORE_DIR", "cache/results")
+_MAX_BYTES = int(os.getenv("RESULT_STORE_MB", "1024")) * 1024 * 1024
+_TTL = int(os.getenv("RESULT_STORE_TTL", str(24 * 60 * 60)))  # сколько хранить файл, сек
+URL_TTL = int(os.getenv("RESULT_URL_TTL", "900"))  # сколько живёт ссылка, сек
+# Внешний адрес сервиса для ссылок (за прокси). Пусто — адрес, по которому пришёл запрос
+PUBLIC_BASE_URL = os.getenv("RESULT_PUBLIC_BASE_URL", "").rstrip("/")
+# Секрет подписи ссылок должен совпадать у всех воркеров: по умолчанию — API_KEY
+_SECRET = os.getenv("RESULT_URL_SECRET") or os.getenv("API_KEY") or secrets.token_hex(32)
+_SWEEP_INTERVAL = 60.0
+
+CONTENT_TYPES = {
+    "png": "image/png", "jpg": "image/jpeg", "webp": "image/webp", "gif": "image/gif",
+    "mp3": "audio/mpeg", "wav": "audio/wav",
+}
+_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]{1,5}$")
+
+
+def content_type_of(name: str) -> str:
+    return CONTENT_TYPES.get(name.rsplit(".", 1)[-1], "application/octet-stream")
+
+
+@dataclass(frozen=True)
+class StoredBlob:
+    name: str        # <sha256>.<ext>
+    size: int
+
+    @property
+    def digest(self) -> str:
+        return self.name.split(".", 1)[0]
+
+    @property
+    def content_type(self) -> str:
+        return content_type_of(self.name)
+
+
+class BlobStore:
+    """
+    Хранилище по содержимому: одинаковые результаты лежат одним файлом.
+    Вытеснение — как у дискового кэша картинок: просроченные, затем самые старые сверх лимита.
+    Потокобезопасно: запись идёт из потоков (asyncio.to_thread).
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: int, secret: str):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._secret = secret.encode("utf-8")
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._stats = {"stored": 0, "deduplicated": 0, "evictions": 0}
+        os.makedirs(self.directory, exist_ok=True)
+        self._bytes = sum(size for _, size, _ in self._scan())
+
+    # --- Файлы ---
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name[:2], name)
+
+    def _scan(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _place(self, tmp_path: str, name: str, size: int) -> StoredBlob:
+        """Перенести готовый временный файл на место (rename); такой же уже есть — продлить его"""
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            os.utime(path)  # продлеваем хранение
+            with self._lock:
+                self._stats["deduplicated"] += 1
+            return StoredBlob(name, size)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            # Другая файловая система — rename невозможен
+            shutil.move(tmp_path, path)
+        with self._lock:
+            self._bytes += size
+            self._stats["stored"] += 1
+        self._maybe_evict()
+        return StoredBlob(name, size)
+
+    def put(self, data: bytes, ext: str) -> StoredBlob:
+        name = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+        tmp_path = os.path.join(self.directory, f".{name}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        return self._place(tmp_path, name, len(data))
+
+    def adopt(self, source: str, ext: str) -> StoredBlob:
+        """Забрать уже готовый файл (временный файл TTS, результат Space) переименованием, без копии в память"""
+        digest = hashlib.sha256()
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return self._place(source, f"{digest.hexdigest()}.{ext}", os.path.getsize(source))
+
+    async def aput(self, data: bytes, ext: str) -> StoredBlob:
+        return await asyncio.to_thread(self.put, data, ext)
+
+    async def aadopt(self, source: str, ext: str) -> StoredBlob:
+        return await asyncio.to_thread(self.adopt, source, ext)
+
+    def locate(self, name: str) -> Optional[str]:
+        """Путь к файлу, None — имя некорректно, файла нет или он просрочен"""
+        if not _NAME.match(name):
+            return None
+        path = self.path(name)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _remove(self, path: str) -> None:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._bytes -= size
+
+    def _maybe_evict(self) -> None:
+        now = time.time()
+        if self._bytes <= self.max_bytes and now - self._last_sweep < _SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        for path, _, mtime in sorted(self._scan(), key=lambda f: f[2]):
+            if now - mtime <= self.ttl and self._bytes <= self.max_bytes:
+                break
+            if path.endswith(".tmp") and now - mtime < 60:
+                continue  # файл ещё пишется
+            self._remove(path)
+            with self._lock:
+                self._stats["evictions"] += 1
+
+    # --- Подписанные ссылки ---
+
+    def _signature(self, name: str, expires: int, filename: str) -> str:
+        message = f"{name}\n{expires}\n{filename}".encode("utf-8")
+        return hmac.new(self._secret, message, hashlib.sha256).hexdigest()[:32]
+
+    def signed_query(self, name: str, filename: str = "", ttl: int = URL_TTL) -> dict:
+        expires = int(time.time()) + ttl
+        query = {"expires": expires, "sig": self._signature(name, expires, filename)}
+        if filename:
+            query["filename"] = filename
+        return query
+
+    def url(self, blob: StoredBlob, base_url: str, filename: str = "", ttl: int = URL_TTL) -> dict:
+        """Ссылка на /files/<имя> и подробности для JSON-ответа"""
+        query = self.signed_query(blob.name, filename, ttl)
+        return {
+            "url": f"{(PUBLIC_BASE_URL or base_url).rstrip('/')}/files/{blob.name}?{urlencode(query)}",
+            "expires_at": query["expires"],
+            "content_type": blob.content_type,
+            "bytes": blob.size,
+            "sha256": blob.digest,
+        }
+
+    def verify(self, name: str, expires: int, sig: str, filename: str = "") -> bool:
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(sig, self._signature(name, expires, filename))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "bytes": self._bytes}
+
+
+# Общее хранилище на процесс
+result_store = BlobStore(_DIR, _MAX_BYTES, _TTL, _SECRET)
@@ -1,2 +1,2 @@
-# Экспортируем функцию наружу, чтобы роутер её видел
-from .orchestrator import generate_image_sync
\ No newline at end of file
+# Экспортируем функции наружу, чтобы роутер их видел
+from .orchestrator import generate_image_sync, generate_image_async, generate_image_stream, generate_image_preview, warm_up_providers, provider_stats
\ No newline at end of file
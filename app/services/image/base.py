@@ -1,12 +1,47 @@
+import os
+import asyncio
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Optional
+from .stream import ImageStream
+from .capabilities import Capabilities, ANY_SIZE
+from ..metrics import metrics
+from ..tracing import span
+
+PHASE_SECONDS = metrics.histogram(
+    "image_provider_phase_seconds", "Duration of provider steps: submit, poll, queue (gradio), download",
+    ["provider", "phase"]
+)
+THREAD_ATTEMPTS = metrics.gauge(
+    "image_thread_attempts_in_flight", "Blocking provider calls running in worker threads", ["provider"]
+)
 
 
 class ImageProvider(ABC):
     """
     Базовый абстрактный класс.
     Определяет правила: каждый провайдер ОБЯЗАН иметь имя и метод generate.
+    Асинхронный agenerate по умолчанию уводит generate в поток,
+    REST-провайдеры переопределяют его нативной реализацией на httpx.
     """
 
+    # Типичное время генерации (сек) — стартовая оценка для ранжирования, пока нет живой статистики
+    expected_latency: float = 30.0
+
+    # Допуск к провайдеру (см. limits.py): одновременных попыток и запросов в минуту, None — без лимита
+    max_concurrency: Optional[int] = None
+    rate_per_minute: Optional[float] = None
+    rate_burst: Optional[int] = None
+
+    # Геометрия и поддержка negative prompt (см. capabilities.py): по ней провайдер подгоняет размер,
+    # а оркестратор выбирает провайдеров под запрошенные пропорции
+    capabilities: Capabilities = ANY_SIZE
+
+    # Номер попытки в текущем запросе (для трассировки), выставляет оркестратор
+    attempt: Optional[int] = None
+    # Билет пробы half-open (см. HealthRegistry.try_acquire), 0 — обычная попытка; выставляет оркестратор
+    probe: float = 0.0
+
     @property
     @abstractmethod
     def name(self) -> str:
@@ -14,6 +49,84 @@ class ImageProvider(ABC):
         pass
 
     @abstractmethod
-    def generate(self, prompt: str, negative_prompt: str, width: int, height: int) -> bytes:
-        """Сгенерировать картинку и вернуть байты"""
-        pass
\ No newline at end of file
+    def generate(self, prompt: str, negative_prompt: str, width: int, height: int,
+                 deadline: Optional[float] = None) -> bytes:
+        """
+        Сгенерировать картинку и вернуть байты.
+        deadline — дедлайн всего запроса (time.monotonic()): таймауты шагов не должны его превышать.
+        """
+        pass
+
+    @contextmanager
+    def _phase(self, phase: str):
+        """Замер шага генерации для /metrics и Server-Timing: with self._phase("submit"): ..."""
+        provider = type(self).__name__
+        with PHASE_SECONDS.time(provider=provider, phase=phase), span(phase, provider, self.attempt):
+            yield
+
+    def warm(self) -> None:
+        """Заранее подготовить тяжёлые ресурсы (клиенты, соединения). По умолчанию ничего"""
+        pass
+
+    async def agenerate(self, prompt: str, negative_prompt: str, width: int, height: int,
+                        deadline: Optional[float] = None) -> bytes:
+        """Асинхронная версия generate (по умолчанию — blocking generate в отдельном потоке)"""
+        with THREAD_ATTEMPTS.track(provider=type(self).__name__):
+            return await asyncio.to_thread(self.generate, prompt, negative_prompt, width, height, deadline)
+
+    async def astream(self, prompt: str, negative_prompt: str, width: int, height: int,
+                      deadline: Optional[float] = None) -> ImageStream:
+        """
+        Вернуть картинку потоком, как только провайдер готов её отдавать.
+        По умолчанию — готовые байты agenerate одним чанком; REST-провайдеры
+        отдают скачивание по мере поступления.
+        """
+        data = await self.agenerate(prompt, negative_prompt, width, height, deadline)
+        return ImageStream.from_bytes(data, self.name)
+
+
+class FileImageProvider(ImageProvider):
+    """
+    Провайдер, у которого результат — уже скачанный локальный файл (gradio_client кладёт его во временную папку).
+    generate_file отдаёт путь, а не байты: в потоковом режиме роутер отдаёт файл через sendfile,
+    а кэш забирает его переименованием. generate (байты) — для путей, которым нужна картинка в памяти.
+    """
+
+    @abstractmethod
+    def generate_file(self, prompt: str, negative_prompt: str, width: int, height: int,
+                      deadline: Optional[float] = None) -> str:
+        """Сгенерировать картинку и вернуть путь к файлу. Файл переходит вызывающему — он его и удаляет"""
+        pass
+
+    def generate(self, prompt: str, negative_prompt: str, width: int, height: int,
+                 deadline: Optional[float] = None) -> bytes:
+        path = self.generate_file(prompt, negative_prompt, width, height, deadline)
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    async def astream(self, prompt: str, negative_prompt: str, width: int, height: int,
+                      deadline: Optional[float] = None) -> ImageStream:
+        """Файл отдаётся как есть, без чтения в память"""
+        def fetch() -> ImageStream:
+            path = self.generate_file(prompt, negative_prompt, width, height, deadline)
+            return ImageStream.from_file(path, self.name)
+
+        with THREAD_ATTEMPTS.track(provider=type(self).__name__):
+            fetching = asyncio.ensure_future(asyncio.to_thread(fetch))
+            try:
+                return await asyncio.shield(fetching)
+            except asyncio.CancelledError:
+                # Поток не отменить: файл, скачанный уже после отмены (проиграл гонку, дедлайн), удаляем
+                fetching.add_done_callback(_close_late_stream)
+                raise
+
+
+def _close_late_stream(fetching: asyncio.Future) -> None:
+    if not fetching.cancelled() and fetching.exception() is None:
+        asyncio.ensure_future(fetching.result().aclose())
@@ -0,0 +1,96 @@
+import io
+import os
+import json
+import time
+import asyncio
+import logging
+import zipfile
+from dataclasses import dataclass, replace
+from typing import List, Optional
+
+from .cache import cached_generate
+from .orchestrator import generate_image_async
+from .transform import OutputSpec, cached_transform, extension, sniff_type
+
+logger = logging.getLogger(__name__)
+
+# Сколько картинок пакета генерируется одновременно. Раскладка по провайдерам — за лимитами
+# провайдеров (limits.py): занятый провайдер пропускается, и картинка уходит следующему в цепочке
+_BATCH_CONCURRENCY = int(os.getenv("IMAGE_BATCH_CONCURRENCY", "8"))
+MAX_BATCH_ITEMS = int(os.getenv("IMAGE_BATCH_MAX_ITEMS", "50"))
+
+
+@dataclass
+class BatchItemResult:
+    index: int
+    params: dict
+    data: Optional[bytes] = None
+    cache_status: Optional[str] = None
+    error: Optional[str] = None
+    duration: float = 0.0
+
+    def manifest(self, filename: Optional[str]) -> dict:
+        return {
+            "index": self.index,
+            "prompt": self.params["prompt"],
+            "status": "ok" if self.data is not None else "failed",
+            "file": filename,
+            "bytes": len(self.data) if self.data is not None else None,
+            "cache": self.cache_status,
+            "error": self.error,
+            "duration": round(self.duration, 2),
+        }
+
+
+async def generate_batch(items: List[dict], hedge_delay: Optional[float] = None,
+                         use_cache: bool = True, timeout: Optional[float] = None,
+                         output: Optional[OutputSpec] = None) -> List[BatchItemResult]:
+    """
+    Сгенерировать пакет картинок параллельно. Ошибка одной картинки не валит пакет —
+    она попадает в её результат. Время пакета ≈ время самой медленной картинки.
+    timeout — бюджет всего пакета: картинки, ждущие своей очереди, получают его остаток.
+    output — формат/подгонка размера, размер берётся из параметров каждой картинки.
+    """
+    semaphore = asyncio.Semaphore(_BATCH_CONCURRENCY)
+    started = time.monotonic()
+    logger.info(f"📦 [Batch] {len(items)} images, up to {_BATCH_CONCURRENCY} in parallel")
+
+    async def run(index: int, params: dict) -> BatchItemResult:
+        result = BatchItemResult(index=index, params=params)
+        async with semaphore:
+            item_started = time.monotonic()
+            left = None if timeout is None else max(timeout - (item_started - started), 0)
+            try:
+                result.data, result.cache_status = await cached_generate(
+                    params, lambda: generate_image_async(**params, hedge_delay=hedge_delay, timeout=left), use_cache
+                )
+                if output is not None:
+                    spec = replace(output, width=params["width"], height=params["height"])
+                    result.data, _ = await cached_transform(result.data, spec, use_cache)
+            except Exception as e:
+                result.error = str(e)
+                logger.warning(f"⚠️ [Batch] Item {index} failed: {e}")
+            result.duration = time.monotonic() - item_started
+        return result
+
+    results = await asyncio.gather(*(run(i, params) for i, params in enumerate(items)))
+    failed = sum(1 for r in results if r.data is None)
+    logger.info(f"📦 [Batch] Done in {time.monotonic() - started:.1f}s: "
+                f"{len(results) - failed} ok, {failed} failed")
+    return results
+
+
+def build_zip(results: List[BatchItemResult]) -> bytes:
+    """ZIP с картинками (001.png, 002.jpg, ...) и manifest.json с итогом по каждой позиции"""
+    buffer = io.BytesIO()
+    manifest = []
+    # Картинки уже сжаты — без повторного сжатия
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        for result in results:
+            filename = None
+            if result.data is not None:
+                filename = f"{result.index + 1:03d}.{extension(sniff_type(result.data))}"
+                archive.writestr(filename, result.data)
+            manifest.append(result.manifest(filename))
+        archive.writestr("manifest.json", json.dumps({"items": manifest}, ensure_ascii=False, indent=2))
+    return buffer.getvalue()
@@ -0,0 +1,292 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+from ..tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Кэш выключен по умолчанию: генерации с одинаковыми параметрами часто ожидаемо разные (random seed)
+CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "0") == "1"
+_MEMORY_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MEMORY_MB", "128")) * 1024 * 1024
+_DISK_MAX_BYTES = int(os.getenv("IMAGE_CACHE_DISK_MB", "2048")) * 1024 * 1024
+_DISK_DIR = os.getenv("IMAGE_CACHE_DIR", "cache/images")
+_TTL = int(os.getenv("IMAGE_CACHE_TTL", str(7 * 24 * 60 * 60)))  # секунд
+# Как часто сверять индекс диска с папкой (файлы других uvicorn-воркеров), сек
+_RESCAN_INTERVAL = 600.0
+
+
+def make_key(prompt: str, negative_prompt: str, width: int, height: int) -> str:
+    """
+    Ключ кэша — sha256 от нормализованных параметров.
+    Лишние пробелы не влияют на картинку, поэтому схлопываются.
+    """
+    def norm(text: str) -> str:
+        return re.sub(r"\s+", " ", (text or "").strip())
+
+    params = {
+        "prompt": norm(prompt),
+        "negative_prompt": norm(negative_prompt),
+        "width": int(width),
+        "height": int(height),
+    }
+    raw = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """
+    Двухуровневый кэш картинок:
+      - память: LRU, ограниченный суммарным размером в байтах;
+      - диск: файлы по ключу, вытеснение по размеру (самые старые первыми) и по TTL.
+        Порядок файлов держит индекс, собранный при старте: запись не обходит папку.
+    Потокобезопасен: используется и из event loop, и из потоков.
+    """
+
+    def __init__(self, memory_max_bytes: int, disk_dir: str, disk_max_bytes: int, ttl: int):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl = ttl
+
+        self._memory: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._memory_bytes = 0
+        # Путь -> (размер, mtime), самые старые первыми
+        self._disk_index: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._disk_bytes = 0
+        self._last_scan = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        os.makedirs(self.disk_dir, exist_ok=True)
+        self._rescan()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    # --- Память ---
+
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None:
+                return None
+            data, created = item
+            if time.time() - created > self.ttl:
+                self._memory_drop(key)
+                return None
+            self._memory.move_to_end(key)
+            return data
+
+    def _memory_put(self, key: str, data: bytes, created: float) -> None:
+        if len(data) > self.memory_max_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_drop(key)
+            self._memory[key] = (data, created)
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.memory_max_bytes:
+                oldest = next(iter(self._memory))
+                self._memory_drop(oldest)
+                self._stats["evictions"] += 1
+
+    def _memory_drop(self, key: str) -> None:
+        data, _ = self._memory.pop(key)
+        self._memory_bytes -= len(data)
+
+    # --- Диск ---
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.bin")
+
+    def _scan_disk(self):
+        """(путь, размер, mtime) всех файлов дискового уровня"""
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _rescan(self) -> None:
+        """Собрать индекс диска обходом папки: при старте и изредка — подхватить файлы других воркеров"""
+        now = time.time()
+        # Свежие .tmp ещё пишутся — их не трогаем
+        files = sorted((f for f in self._scan_disk() if not (f[0].endswith(".tmp") and now - f[2] < 60)),
+                       key=lambda f: f[2])
+        with self._lock:
+            self._disk_index = OrderedDict((path, (size, mtime)) for path, size, mtime in files)
+            self._disk_bytes = sum(size for size, _ in self._disk_index.values())
+            self._last_scan = now
+
+    def _index_add(self, path: str, size: int) -> None:
+        with self._lock:
+            previous = self._disk_index.pop(path, None)
+            self._disk_index[path] = (size, time.time())
+            self._disk_bytes += size - (previous[0] if previous else 0)
+
+    def _disk_get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        path = self._path(key)
+        try:
+            mtime = os.path.getmtime(path)
+            if time.time() - mtime > self.ttl:
+                self._disk_remove(path)
+                return None
+            with open(path, "rb") as f:
+                return f.read(), mtime
+        except FileNotFoundError:
+            return None
+
+    def _disk_put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Пишем во временный файл и атомарно переименовываем — читатель не увидит половину файла
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._index_add(path, len(data))
+        if self._disk_bytes > self.disk_max_bytes:
+            self._disk_evict()
+
+    def _disk_adopt(self, key: str, source: str) -> str:
+        """Забрать готовый файл переименованием — без чтения в память и без второй копии на диске"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = os.path.getsize(source)
+        try:
+            os.replace(source, path)
+        except OSError:
+            # Другая файловая система (временная папка gradio на tmpfs) — rename невозможен
+            shutil.move(source, path)
+        self._index_add(path, size)
+        if self._disk_bytes > self.disk_max_bytes:
+            self._disk_evict()
+        return path
+
+    def _disk_remove(self, path: str) -> None:
+        with self._lock:
+            entry = self._disk_index.pop(path, None)
+            if entry is not None:
+                self._disk_bytes -= entry[0]
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _disk_evict(self) -> None:
+        """Удалить просроченные файлы, затем самые старые, пока не влезем в лимит — с головы индекса"""
+        now = time.time()
+        if now - self._last_scan > _RESCAN_INTERVAL:
+            self._rescan()
+        while True:
+            with self._lock:
+                if not self._disk_index:
+                    return
+                path, (_, mtime) = next(iter(self._disk_index.items()))
+                if now - mtime <= self.ttl and self._disk_bytes <= self.disk_max_bytes:
+                    return
+            self._disk_remove(path)
+            self._count("evictions")
+
+    # --- Публичное API ---
+
+    def get(self, key: str) -> Optional[bytes]:
+        data = self._memory_get(key)
+        if data is not None:
+            self._count("memory_hits")
+            return data
+
+        found = self._disk_get(key)
+        if found is None:
+            self._count("misses")
+            return None
+
+        data, created = found
+        self._count("disk_hits")
+        self._memory_put(key, data, created)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        self._memory_put(key, data, time.time())
+        try:
+            self._disk_put(key, data)
+        except OSError as e:
+            logger.warning(f"⚠️ [Cache] Disk write failed for {key[:12]}: {e}")
+
+    def adopt(self, key: str, source: str) -> Optional[str]:
+        """
+        Положить в кэш уже готовый файл (результат gradio-Space), забрав его переименованием.
+        Только дисковый уровень: в память картинка попадёт при первом попадании в кэш.
+        Возвращает новый путь файла; None — не вышло, файл остался на месте.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory_drop(key)  # устаревшая версия не должна перекрывать новую
+        try:
+            return self._disk_adopt(key, source)
+        except OSError as e:
+            logger.warning(f"⚠️ [Cache] Disk adopt failed for {key[:12]}: {e}")
+            return None
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        """Как get, но дисковый уровень читается в потоке, чтобы не блокировать event loop"""
+        data = self._memory_get(key)
+        if data is not None:
+            self._count("memory_hits")
+            return data
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, data: bytes) -> None:
+        await asyncio.to_thread(self.put, key, data)
+
+    async def aadopt(self, key: str, source: str) -> Optional[str]:
+        return await asyncio.to_thread(self.adopt, key, source)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+# Общий кэш на процесс (None — кэш выключен)
+image_cache: Optional[ImageCache] = (
+    ImageCache(_MEMORY_MAX_BYTES, _DISK_DIR, _DISK_MAX_BYTES, _TTL) if CACHE_ENABLED else None
+)
+
+
+async def cached_generate(cache_key_params: dict, generate: Callable[[], Awaitable[bytes]],
+                          use_cache: bool = True) -> Tuple[bytes, str]:
+    """
+    Сгенерировать через кэш. Возвращает (байты, статус для X-Cache: HIT / MISS / BYPASS).
+    cache_key_params — prompt, negative_prompt, width, height.
+    """
+    if image_cache is None or not use_cache:
+        return await generate(), "BYPASS"
+
+    key = make_key(**cache_key_params)
+    with span("cache_get"):
+        cached = await image_cache.aget(key)
+    if cached is not None:
+        return cached, "HIT"
+
+    data = await generate()
+    with span("cache_put"):
+        await image_cache.aput(key, data)
+    return data, "MISS"
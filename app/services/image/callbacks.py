@@ -0,0 +1,122 @@
+import os
+import hmac
+import time
+import hashlib
+import logging
+import secrets
+import threading
+from concurrent.futures import Future
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+# Публичный адрес этого сервиса: провайдеры шлют на него уведомление о готовности.
+# Пусто — вебхуки выключены, провайдеры работают на поллинге как раньше.
+_BASE_URL = os.getenv("IMAGE_CALLBACK_BASE_URL", "").rstrip("/")
+_SECRET = os.getenv("IMAGE_CALLBACK_SECRET", "")
+# Для каких провайдеров ждать вебхук. У Leonardo адрес вебхука задаётся в настройках
+# API-ключа, поэтому он включается явно
+_PROVIDERS = {p.strip() for p in os.getenv("IMAGE_CALLBACK_PROVIDERS", "kieai").split(",") if p.strip()}
+# С вебхуком поллинг остаётся страховкой (потерянный вебхук, другой uvicorn-воркер) — но редкий
+_FALLBACK_POLL = float(os.getenv("IMAGE_CALLBACK_FALLBACK_POLL", "15"))
+# Сколько хранить вебхук, пришедший раньше, чем мы узнали id задачи
+_EARLY_TTL = 300.0
+
+
+class CallbackRegistry:
+    """
+    Реестр задач, ждущих вебхук: task id -> Future с телом уведомления.
+    concurrent.futures.Future: его слушает планировщик опросов (poller.py),
+    который живёт в своём потоке.
+    """
+
+    def __init__(self, base_url: str, secret: str, providers: set):
+        self.base_url = base_url
+        self.secret = secret
+        self.providers = providers
+        self._waiters: Dict[str, Future] = {}
+        self._early: Dict[str, Tuple[dict, float]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"delivered": 0, "early": 0}
+
+    def enabled(self, provider: str) -> bool:
+        return bool(self.base_url and self.secret) and provider in self.providers
+
+    def _signature(self, provider: str, nonce: str) -> str:
+        message = f"{provider}\n{nonce}".encode("utf-8")
+        return hmac.new(self.secret.encode("utf-8"), message, hashlib.sha256).hexdigest()[:32]
+
+    def url(self, provider: str) -> str:
+        """
+        Адрес вебхука с подписью вместо самого секрета: секрет не уходит провайдеру и в его логи.
+        id задачи на момент создания ещё неизвестен, поэтому подписывается случайный nonce
+        """
+        nonce = secrets.token_hex(8)
+        query = urlencode({"nonce": nonce, "sig": self._signature(provider, nonce)})
+        return f"{self.base_url}/api/image/callbacks/{provider}?{query}"
+
+    def check_signature(self, provider: str, nonce: Optional[str], sig: Optional[str]) -> bool:
+        if not self.secret or nonce is None or sig is None:
+            return False
+        return hmac.compare_digest(sig, self._signature(provider, nonce))
+
+    def check_secret(self, token: Optional[str]) -> bool:
+        return bool(self.secret) and token is not None and hmac.compare_digest(token, self.secret)
+
+    def poll_interval(self, provider: str, default: float) -> float:
+        return _FALLBACK_POLL if self.enabled(provider) else default
+
+    # --- Ожидание ---
+
+    def register(self, provider: str, task_id: str) -> Optional[Future]:
+        """Начать ждать вебхук по задаче. None — вебхуки для провайдера выключены"""
+        if not self.enabled(provider):
+            return None
+        future: Future = Future()
+        with self._lock:
+            early = self._early.pop(task_id, None)
+            if early is not None:
+                future.set_result(early[0])
+            else:
+                self._waiters[task_id] = future
+        return future
+
+    def discard(self, task_id: str) -> None:
+        with self._lock:
+            self._waiters.pop(task_id, None)
+
+    def resolve(self, task_id: str, payload: dict) -> bool:
+        """Вызывается роутером вебхуков. False — задачу никто не ждёт (сохраним на случай гонки)"""
+        with self._lock:
+            future = self._waiters.pop(task_id, None)
+            if future is None:
+                now = time.time()
+                self._early = {k: v for k, v in self._early.items() if now - v[1] < _EARLY_TTL}
+                self._early[task_id] = (payload, now)
+                self._stats["early"] += 1
+                logger.info(f"📬 [Callbacks] Nobody waits for {task_id} yet, keeping the payload")
+                return False
+            self._stats["delivered"] += 1
+        if not future.done():
+            future.set_result(payload)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "waiting": len(self._waiters), "enabled": sorted(self.providers)
+                    if self.base_url and self.secret else []}
+
+
+def task_id_of(provider: str, payload: dict) -> Optional[str]:
+    """Достать id задачи из тела вебхука"""
+    data = payload.get("data") or {}
+    if provider == "kieai":
+        return data.get("taskId")
+    if provider == "leonardo":
+        return (data.get("object") or {}).get("id") or payload.get("generationId")
+    return None
+
+
+# Общий реестр на процесс
+callback_registry = CallbackRegistry(_BASE_URL, _SECRET, _PROVIDERS)
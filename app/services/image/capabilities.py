@@ -0,0 +1,166 @@
+import os
+import math
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+# Расхождение пропорций (относительное) до которого провайдер считается «родным» для размера
+_NATIVE_TOLERANCE = 0.02
+# Дальше этого провайдер исказит картинку — при маршрутизации по геометрии он уходит в конец цепочки
+# (перед последним рубежом): к нему обращаются, только если подходящие по пропорциям не справились
+_MAX_DISTORTION = float(os.getenv("IMAGE_MAX_DISTORTION", "0.1"))
+GEOMETRY_ROUTING = os.getenv("IMAGE_GEOMETRY_ROUTING", "1") == "1"
+
+
+def _log_ratio(width: float, height: float) -> float:
+    return math.log(width / height) if width and height else 0.0
+
+
+@dataclass(frozen=True)
+class Capabilities:
+    """
+    Что провайдер умеет по геометрии. Одно описание на провайдера:
+    по нему провайдер сам подгоняет размер, а оркестратор выбирает подходящих.
+
+      sizes  — фиксированные разрешения (берётся ближайшее по пропорциям)
+      ratios — именованные пропорции, разрешение выбирает сам сервис
+      иначе  — произвольный размер в пределах min_side..max_side, кратный multiple
+    """
+    sizes: Tuple[Tuple[int, int], ...] = ()
+    ratios: Tuple[Tuple[str, float], ...] = ()
+    min_side: int = 256
+    max_side: int = 2048
+    multiple: int = 1
+    max_pixels: Optional[int] = None
+    negative_prompt: bool = True
+
+    def nearest_size(self, width: int, height: int) -> Tuple[int, int]:
+        target = _log_ratio(width, height)
+        return min(self.sizes, key=lambda s: abs(_log_ratio(*s) - target))
+
+    def nearest_ratio(self, width: int, height: int) -> str:
+        target = _log_ratio(width, height)
+        return min(self.ratios, key=lambda r: abs(math.log(r[1]) - target))[0]
+
+    def native_size(self, width: int, height: int) -> Tuple[int, int]:
+        """Какого размера картинку провайдер вернёт на запрос width×height"""
+        if self.sizes:
+            return self.nearest_size(width, height)
+        if self.ratios:
+            # Точное разрешение решает сервис — оцениваем с той же площадью
+            ratio = dict(self.ratios)[self.nearest_ratio(width, height)]
+            area = width * height
+            return round(math.sqrt(area * ratio)), round(math.sqrt(area / ratio))
+
+        if self.max_pixels and width * height > self.max_pixels:
+            scale = math.sqrt(self.max_pixels / (width * height))
+            width, height = int(width * scale), int(height * scale)
+
+        def clamp(value: int) -> int:
+            value = max(self.min_side, min(self.max_side, value))
+            return (value // self.multiple) * self.multiple
+
+        return clamp(width), clamp(height)
+
+    def distortion(self, width: int, height: int) -> float:
+        """Относительное расхождение пропорций результата с запрошенными (0 — совпадают)"""
+        native = self.native_size(width, height)
+        return abs(math.exp(abs(_log_ratio(*native) - _log_ratio(width, height))) - 1)
+
+    def describe(self) -> dict:
+        return {
+            "sizes": [f"{w}x{h}" for w, h in self.sizes] or None,
+            "ratios": [name for name, _ in self.ratios] or None,
+            "sides": None if self.sizes or self.ratios else [self.min_side, self.max_side],
+            "multiple": self.multiple,
+            "max_pixels": self.max_pixels,
+            "negative_prompt": self.negative_prompt,
+        }
+
+
+def ratios(*names: str) -> Tuple[Tuple[str, float], ...]:
+    """ratios("1:1", "16:9") -> (("1:1", 1.0), ("16:9", 1.777...))"""
+    result = []
+    for name in names:
+        w, h = name.split(":")
+        result.append((name, int(w) / int(h)))
+    return tuple(result)
+
+
+# Провайдер без описания — произвольный размер
+ANY_SIZE = Capabilities()
+
+
+@dataclass(frozen=True)
+class GeometryFit:
+    native: Tuple[int, int]
+    distortion: float
+
+    @property
+    def exact(self) -> bool:
+        return self.distortion <= _NATIVE_TOLERANCE
+
+
+class CapabilityIndex:
+    """
+    Индекс возможностей провайдеров цепочки. Описания собираются один раз при создании,
+    оценка для конкретного размера кэшируется: в запросах повторяется горстка размеров.
+    """
+
+    _MAX_FITS = 1024
+
+    def __init__(self, classes: Iterable[Type]):
+        self._caps: Dict[str, Capabilities] = {
+            cls.__name__: getattr(cls, "capabilities", None) or ANY_SIZE for cls in classes
+        }
+        self._fits: Dict[Tuple[str, int, int], GeometryFit] = {}
+
+    def capabilities(self, cls: Type) -> Capabilities:
+        return self._caps.get(cls.__name__) or getattr(cls, "capabilities", None) or ANY_SIZE
+
+    def fit(self, name: str, width: int, height: int) -> GeometryFit:
+        key = (name, width, height)
+        fit = self._fits.get(key)
+        if fit is None:
+            caps = self._caps.get(name, ANY_SIZE)
+            fit = GeometryFit(caps.native_size(width, height), caps.distortion(width, height))
+            if len(self._fits) >= self._MAX_FITS:
+                self._fits.clear()  # размеров в запросах немного — переполнение значит мусорные размеры
+            self._fits[key] = fit
+        return fit
+
+    def route(self, chain: List[Type], width: int, height: int,
+              keep: Iterable[Type] = (), negative_prompt: bool = False) -> Tuple[List[Type], List[Type]]:
+        """
+        Упорядочить цепочку под размер: сначала провайдеры, которые выдают нужные пропорции,
+        затем приближённые, затем искажающие (ближайший размер лучше, чем никакой), keep (последний рубеж) —
+        в самом конце. negative_prompt — в запросе есть negative prompt: внутри каждой группы
+        провайдеры, которые его молча отбрасывают, идут после тех, кто его учитывает.
+        В остальном порядок внутри групп сохраняется. Возвращает (цепочка, отодвинутые в конец искажающие).
+        """
+        keep = set(keep)
+        exact, approximate, demoted = [], [], []
+        for cls in chain:
+            if cls in keep:
+                continue
+            fit = self.fit(cls.__name__, width, height)
+            if fit.exact:
+                exact.append(cls)
+            elif fit.distortion <= _MAX_DISTORTION:
+                approximate.append(cls)
+            else:
+                demoted.append(cls)
+
+        def honouring_first(group: List[Type]) -> List[Type]:
+            if not negative_prompt:
+                return group
+            return ([cls for cls in group if self.capabilities(cls).negative_prompt]
+                    + [cls for cls in group if not self.capabilities(cls).negative_prompt])
+
+        ordered = honouring_first(exact) + honouring_first(approximate) + honouring_first(demoted)
+        return ordered + [cls for cls in chain if cls in keep], demoted
+
+    def stats(self) -> dict:
+        return {name: caps.describe() for name, caps in self._caps.items()}
@@ -0,0 +1,43 @@
+import time
+import asyncio
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Дедлайн запроса — абсолютное время по time.monotonic(). None — без общего ограничения,
+# каждый шаг провайдера живёт со своим штатным таймаутом.
+
+
+class DeadlineExceeded(TimeoutError):
+    """Бюджет запроса кончился — попытку оборвали мы, а не провайдер"""
+
+
+def make_deadline(timeout: Optional[float]) -> Optional[float]:
+    return time.monotonic() + timeout if timeout is not None else None
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Сколько секунд осталось до дедлайна (None — дедлайна нет)"""
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def budget(deadline: Optional[float], default: float) -> float:
+    """Таймаут одного шага (submit, опрос, скачивание): штатный, но не дольше остатка бюджета"""
+    if deadline is None:
+        return default
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return min(default, left)
+
+
+async def within(aw: Awaitable[T], deadline: Optional[float]) -> T:
+    """Дождаться корутину, но не дольше дедлайна"""
+    if deadline is None:
+        return await aw
+    try:
+        return await asyncio.wait_for(aw, timeout=max(remaining(deadline), 0))
+    except asyncio.TimeoutError:
+        if remaining(deadline) <= 0:
+            raise DeadlineExceeded("Request deadline exceeded") from None
+        raise
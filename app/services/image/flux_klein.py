@@ -1,13 +1,21 @@
 import os
 import logging
+from typing import Optional
 
-from gradio_client import Client
-from .base import ImageProvider
+from .base import FileImageProvider
+from .gradio_pool import gradio_pool
+from .progress import report
+from .deadline import budget, DeadlineExceeded
+from .capabilities import Capabilities
 
 # Инициализируем логгер для этого файла
 logger = logging.getLogger(__name__)
 
-class FluxKleinProvider(ImageProvider):
+class FluxKleinProvider(FileImageProvider):
+    expected_latency = 25.0
+    max_concurrency = 2
+    capabilities = Capabilities(negative_prompt=False)
+
     def __init__(self):
         # Официальный (или полуофициальный) спейс
         self.space_id = "black-forest-labs/FLUX.2-klein-9B"
@@ -17,13 +25,14 @@ class FluxKleinProvider(ImageProvider):
     def name(self):
         return "Flux.2 Klein (9B Distilled)"
 
-    def generate(self, prompt: str, negative_prompt: str, width: int, height: int) -> bytes:
+    def warm(self) -> None:
+        gradio_pool.warm(self.space_id, self.token)
+
+    def generate_file(self, prompt: str, negative_prompt: str, width: int, height: int,
+                      deadline: Optional[float] = None) -> str:
         logger.info(f"🎯 [Flux] Starting generation. Prompt: '{prompt[:50]}...', Size: {width}x{height}")
-        headers = {"Authorization": f"Bearer {self.token}"} if self.token else None
         logger.debug(f"🔑 [Flux] Token present: {bool(self.token)}, Space: {self.space_id}")
-        client = Client(self.space_id, headers=headers)
-
-        try:
+        with gradio_pool.lease(self.space_id, self.token) as client:
             logger.info(f"⏳ [Flux] Submitting job (Timeout: 30s)...")
 
             job = client.submit(
@@ -31,10 +40,15 @@ class FluxKleinProvider(ImageProvider):
                 api_name="/generate"
             )
             logger.debug(f"📤 [Flux] Job submitted, waiting for result...")
+            report("submitted", provider=self.name)
 
             try:
-                result = job.result(timeout=30)
+                with self._phase("queue"):
+                    result = job.result(timeout=budget(deadline, 30))
                 logger.info(f"✅ [Flux] Job result received. Type: {type(result).__name__}, Value: {result}")
+            except DeadlineExceeded:
+                # Бюджет запроса кончился — это не медленный Space, пусть оркестратор учтёт как deadline
+                raise
             except Exception as e:
                 logger.warning(f"⚠️ [Flux] Timeout: {e}")
                 raise TimeoutError("Flux Queue timeout (30s limit)")
@@ -61,19 +75,8 @@ class FluxKleinProvider(ImageProvider):
             logger.debug(f"📂 [Flux] Resolved image_path: {image_path}")
 
             if image_path and os.path.exists(image_path):
-                logger.info(f"📖 [Flux] Reading file: {image_path}")
-                with open(image_path, "rb") as img_file:
-                    image_bytes = img_file.read()
-                logger.info(f"✅ [Flux] File read OK. Size: {len(image_bytes)} bytes")
-                try:
-                    os.remove(image_path)
-                    logger.debug(f"🗑️ [Flux] Temp file deleted: {image_path}")
-                except:
-                    pass
-                return image_bytes
+                logger.info(f"✅ [Flux] File ready: {image_path} ({os.path.getsize(image_path)} bytes)")
+                return image_path
 
             logger.error(f"❌ [Flux] Image path not found or doesn't exist. Path: {image_path}")
             raise ValueError(f"Flux Klein не вернул файл. Ответ: {result}")
-        finally:
-            client.close()
-            logger.debug(f"🔌 [Flux] Client closed")
\ No newline at end of file
@@ -0,0 +1,268 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple, Callable, Any
+from urllib.parse import urljoin
+
+import httpx
+
+from ..tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Раз в сколько секунд проверять живость Space и как долго держать тёплым неиспользуемый клиент
+_PROBE_INTERVAL = float(os.getenv("GRADIO_PROBE_INTERVAL", "60"))
+_KEEP_WARM_TTL = float(os.getenv("GRADIO_KEEP_WARM_TTL", str(6 * 60 * 60)))
+_PROBE_TIMEOUT = float(os.getenv("GRADIO_PROBE_TIMEOUT", "10"))
+
+PoolKey = Tuple[str, Optional[str]]  # (space id / url, HF token)
+
+
+def _headers(token: Optional[str]) -> Optional[dict]:
+    return {"Authorization": f"Bearer {token}"} if token else None
+
+
+def _default_factory(src: str, token: Optional[str]):
+    # gradio_client тянет за собой huggingface_hub — импортируем только когда реально нужен клиент
+    from gradio_client import Client
+    return Client(src, headers=_headers(token))
+
+
+class _Entry:
+    """
+    Тёплый клиент одного Space + отпечаток его конфига для распознавания рестарта.
+    leases — сколько запросов сейчас работают с клиентом: выведенный из пула (retired) клиент
+    закрывается, только когда закончится последний из них, иначе оборвались бы их задачи.
+    """
+
+    def __init__(self, client: Any, fingerprint: Any):
+        self.client = client
+        self.fingerprint = fingerprint
+        self.last_used = time.time()
+        self.rebuilding = False
+        self.leases = 0
+        self.retired = False
+
+
+class GradioClientPool:
+    """
+    Пул инициализированных gradio Client, по одному на Space.
+
+    Конструктор Client ходит в сеть за конфигом и схемой API, поэтому клиент
+    создаётся один раз и переиспользуется между запросами (gradio Client сам умеет
+    вести несколько задач параллельно). Фоновый поток периодически дёргает /config:
+    если Space недоступен или перезапустился (сменился отпечаток конфига),
+    клиент пересоздаётся в фоне, не задерживая запросы.
+    """
+
+    def __init__(self, factory: Callable[[str, Optional[str]], Any] = _default_factory):
+        self._factory = factory
+        self._entries: Dict[PoolKey, _Entry] = {}
+        self._build_locks: Dict[PoolKey, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._suspects: set = set()
+        self._maintainer: Optional[threading.Thread] = None
+        self._stats = {"leases": 0, "builds": 0, "rebuilds": 0, "probe_failures": 0}
+
+    def set_factory(self, factory: Callable[[str, Optional[str]], Any]) -> None:
+        """Подменить способ создания клиентов (бенчмарки, локальные заглушки)"""
+        self.close_all()
+        self._factory = factory
+
+    # --- Публичное API ---
+
+    @contextmanager
+    def lease(self, src: str, token: Optional[str] = None):
+        """
+        Выдать тёплый клиент для Space. При ошибке внутри блока клиент
+        помечается подозрительным и внеочередно проверяется фоновым потоком.
+        """
+        key = (src, token)
+        entry = self._acquire(key)
+        entry.last_used = time.time()
+        self._stats["leases"] += 1
+        try:
+            yield entry.client
+        except TimeoutError:
+            # Длинная очередь — не повод пересоздавать клиент
+            raise
+        except Exception:
+            self._suspects.add(key)
+            self._wakeup.set()
+            raise
+        finally:
+            self._release(entry)
+
+    def warm(self, src: str, token: Optional[str] = None) -> None:
+        """Создать клиент заранее в фоне (например, на старте приложения)"""
+        key = (src, token)
+        threading.Thread(target=self._safe_build, args=(key,), daemon=True,
+                         name="gradio-warm").start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            spaces = {
+                src: {"idle_for": round(time.time() - e.last_used, 1), "rebuilding": e.rebuilding,
+                      "leases": e.leases}
+                for (src, _), e in self._entries.items()
+            }
+        return {**self._stats, "spaces": spaces}
+
+    def close_all(self) -> None:
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._retire(entry)
+
+    # --- Внутренняя кухня ---
+
+    def _acquire(self, key: PoolKey) -> _Entry:
+        while True:
+            entry = self._get_or_build(key)
+            with self._lock:
+                # Между поиском и захватом клиент могли вывести из пула — тогда берём новый
+                if not entry.retired:
+                    entry.leases += 1
+                    return entry
+
+    def _release(self, entry: _Entry) -> None:
+        with self._lock:
+            entry.leases -= 1
+            close = entry.retired and entry.leases == 0
+        if close:
+            self._close(entry.client)
+
+    def _retire(self, entry: _Entry) -> None:
+        """Вывести клиент из пула: закрыть сейчас, если он свободен, иначе — после последней аренды"""
+        with self._lock:
+            entry.retired = True
+            close = entry.leases == 0
+        if close:
+            self._close(entry.client)
+        else:
+            logger.info(f"⏳ [GradioPool] Old client stays open for {entry.leases} running job(s)")
+
+    def _get_or_build(self, key: PoolKey) -> _Entry:
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+
+        # Отдельный замок на Space, чтобы параллельные запросы не строили по клиенту каждый
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._build(key)
+                with self._lock:
+                    self._entries[key] = entry
+                self._ensure_maintainer()
+        return entry
+
+    def _build(self, key: PoolKey) -> _Entry:
+        src, token = key
+        started = time.time()
+        with span("gradio_client_build", space=src):
+            client = self._factory(src, token)
+        self._stats["builds"] += 1
+        logger.info(f"🔥 [GradioPool] Client for {src} ready in {time.time() - started:.1f}s")
+        return _Entry(client, self._fingerprint(getattr(client, "config", None)))
+
+    def _safe_build(self, key: PoolKey) -> None:
+        try:
+            self._get_or_build(key)
+        except Exception as e:
+            logger.warning(f"⚠️ [GradioPool] Warm-up for {key[0]} failed: {e}")
+
+    @staticmethod
+    def _fingerprint(config: Optional[dict]) -> Any:
+        if not isinstance(config, dict):
+            return None
+        # app_id генерируется при каждом запуске gradio-приложения
+        return config.get("app_id") or (config.get("version"), len(config.get("dependencies", [])))
+
+    def _probe(self, key: PoolKey, entry: _Entry) -> bool:
+        """True — клиент годен, False — Space перезапустился или недоступен"""
+        client = entry.client
+        src = getattr(client, "src", None)
+        if not src:
+            return True
+        try:
+            r = httpx.get(urljoin(src, "config"), headers=_headers(key[1]), timeout=_PROBE_TIMEOUT)
+            if not r.is_success:
+                logger.warning(f"⚠️ [GradioPool] Probe {key[0]}: HTTP {r.status_code}")
+                return False
+            fingerprint = self._fingerprint(r.json())
+        except Exception as e:
+            logger.warning(f"⚠️ [GradioPool] Probe {key[0]} failed: {e}")
+            return False
+
+        if entry.fingerprint is not None and fingerprint != entry.fingerprint:
+            logger.info(f"♻️ [GradioPool] Space {key[0]} restarted (config changed)")
+            return False
+        return True
+
+    def _rebuild(self, key: PoolKey, old: _Entry) -> None:
+        old.rebuilding = True
+        try:
+            new = self._build(key)
+        except Exception as e:
+            # Space ещё лежит — оставляем старый клиент, попробуем на следующем круге
+            logger.warning(f"⚠️ [GradioPool] Rebuild of {key[0]} failed: {e}")
+            old.rebuilding = False
+            return
+
+        new.last_used = old.last_used
+        with self._lock:
+            self._entries[key] = new
+        self._stats["rebuilds"] += 1
+        self._retire(old)
+
+    def _maintain(self) -> None:
+        while True:
+            # По таймеру проверяем все Space, по будильнику — только подозрительные
+            woken = self._wakeup.wait(_PROBE_INTERVAL)
+            self._wakeup.clear()
+
+            suspects, self._suspects = self._suspects, set()
+            with self._lock:
+                entries = list(self._entries.items())
+
+            for key, entry in entries:
+                if entry.rebuilding:
+                    continue
+                if time.time() - entry.last_used > _KEEP_WARM_TTL:
+                    # Давно не нужен — не держим соединения и потоки зря
+                    with self._lock:
+                        if self._entries.get(key) is entry:
+                            del self._entries[key]
+                    self._retire(entry)
+                    logger.info(f"💤 [GradioPool] Dropped idle client for {key[0]}")
+                    continue
+                if woken and key not in suspects:
+                    continue
+                if not self._probe(key, entry):
+                    self._stats["probe_failures"] += 1
+                    self._rebuild(key, entry)
+
+    def _ensure_maintainer(self) -> None:
+        with self._lock:
+            if self._maintainer is None or not self._maintainer.is_alive():
+                self._maintainer = threading.Thread(target=self._maintain, daemon=True,
+                                                    name="gradio-pool")
+                self._maintainer.start()
+
+    @staticmethod
+    def _close(client: Any) -> None:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+# Общий пул на процесс
+gradio_pool = GradioClientPool()
@@ -0,0 +1,256 @@
+import os
+import time
+import logging
+from dataclasses import dataclass, asdict, fields
+from typing import Any, Callable, Dict, List, Type, Optional, Iterable
+from .health_store import HealthStore, create_store
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сглаживание EWMA: чем больше, тем быстрее статистика реагирует на свежие попытки
+_ALPHA = float(os.getenv("IMAGE_HEALTH_ALPHA", "0.2"))
+
+# Circuit breaker: после скольких ошибок подряд провайдер выключается,
+# стартовый и максимальный cool-down (он удваивается при каждом повторном открытии)
+_FAILURE_THRESHOLD = int(os.getenv("IMAGE_BREAKER_THRESHOLD", "2"))
+_BASE_COOLDOWN = float(os.getenv("IMAGE_BREAKER_BASE_COOLDOWN", "60"))
+_MAX_COOLDOWN = float(os.getenv("IMAGE_BREAKER_MAX_COOLDOWN", str(24 * 60 * 60)))
+# Квота/429 — это перегрузка, а не поломка: короткая фиксированная пауза без эскалации
+_QUOTA_COOLDOWN = float(os.getenv("IMAGE_BREAKER_QUOTA_COOLDOWN", "30"))
+# Сколько ждать зависшую пробную попытку в half-open, прежде чем пустить следующую
+_PROBE_TIMEOUT = float(os.getenv("IMAGE_BREAKER_PROBE_TIMEOUT", "300"))
+
+# Нижняя граница вероятности успеха в формуле ранжирования, чтобы не делить на ноль
+_MIN_SUCCESS = 0.05
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+BREAKER_OPENED = metrics.counter(
+    "image_breaker_opened_total", "Provider breaker openings (failures in a row, or a quota pause)", ["provider", "reason"]
+)
+
+
+@dataclass
+class ProviderHealth:
+    """Живая статистика одного провайдера + состояние его circuit breaker"""
+    attempt_ewma: Optional[float] = None   # сколько секунд в среднем занимает попытка (любой исход)
+    latency_ewma: Optional[float] = None   # сколько секунд занимает успешная генерация
+    success_rate: float = 1.0
+    timeout_rate: float = 0.0
+    attempts: int = 0
+    state: str = CLOSED
+    consecutive_failures: int = 0
+    open_count: int = 0                    # сколько раз подряд открывался (для экспоненты)
+    open_until: float = 0.0
+    probe_started: float = 0.0             # когда ушла пробная попытка в half-open
+
+    def cooldown(self) -> float:
+        return min(_BASE_COOLDOWN * (2 ** max(self.open_count - 1, 0)), _MAX_COOLDOWN)
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> "ProviderHealth":
+        if not data:
+            return cls()
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+
+def _ewma(old: Optional[float], value: float) -> float:
+    return value if old is None else old + _ALPHA * (value - old)
+
+
+class HealthRegistry:
+    """
+    Реестр здоровья провайдеров.
+
+    Вместо бана на сутки — circuit breaker:
+      closed    → работаем, считаем ошибки подряд;
+      open      → провайдер пропускается до истечения cool-down (растёт экспоненциально);
+      half_open → пропускаем ровно одну пробную попытку: успех закрывает breaker, ошибка — снова open.
+
+    Порядок цепочки — по ожидаемому времени до картинки: среднее время попытки / вероятность успеха.
+
+    Само состояние лежит в HealthStore (память процесса или общий SQLite-файл),
+    каждое изменение — атомарный read-modify-write.
+    """
+
+    def __init__(self, store: Optional[HealthStore] = None):
+        self._store = store or create_store()
+        # Провайдеры, которых breaker никогда не выключает (статистика по ним всё равно копится)
+        self.never_open: set[str] = set()
+
+    @property
+    def blocking(self) -> bool:
+        """Изменения ходят в файл под блокировкой — из event loop их нужно вызывать в потоке"""
+        return self._store.blocking
+
+    def _read(self, name: str) -> ProviderHealth:
+        return ProviderHealth.from_dict(self._store.get(name))
+
+    def _update(self, name: str, mutate: Callable[[ProviderHealth], Any]) -> Any:
+        result = None
+
+        def apply(data: Optional[dict]) -> dict:
+            nonlocal result
+            health = ProviderHealth.from_dict(data)
+            result = mutate(health)
+            return asdict(health)
+
+        self._store.update(name, apply)
+        return result
+
+    # --- Допуск к попытке ---
+
+    def is_available(self, name: str) -> bool:
+        """Можно ли планировать провайдера в цепочку (без резервирования пробы)"""
+        health = self._read(name)
+        now = time.time()
+        if health.state == CLOSED or name in self.never_open:
+            return True
+        if health.state == OPEN:
+            return now >= health.open_until
+        return now - health.probe_started >= _PROBE_TIMEOUT
+
+    def try_acquire(self, name: str) -> Optional[float]:
+        """
+        Вызывается прямо перед запуском попытки. None — запускать нельзя.
+        В half-open пропускает только одну пробную попытку на все запросы.
+        Возвращает билет пробы — время её старта (0 — обычная попытка): по нему release
+        узнаёт, что отменённая попытка и есть текущая проба.
+        """
+        def acquire(health: ProviderHealth) -> Optional[float]:
+            now = time.time()
+            if health.state == CLOSED or name in self.never_open:
+                return 0.0
+            if health.state == OPEN:
+                if now < health.open_until:
+                    return None
+                health.state = HALF_OPEN
+                health.probe_started = now
+                logger.info(f"🟡 [Health] {name} half-open: sending probe request")
+                return now
+            # HALF_OPEN: проба уже идёт; если она зависла — пускаем новую
+            if now - health.probe_started >= _PROBE_TIMEOUT:
+                health.probe_started = now
+                return now
+            return None
+
+        # Быстрый путь без записи: закрытый breaker — самый частый случай
+        if self._read(name).state == CLOSED:
+            return 0.0
+        return self._update(name, acquire)
+
+    def release(self, name: str, probe: float = 0.0) -> None:
+        """
+        Попытку отменили, не дождавшись исхода — освобождаем слот пробы.
+        Только если эта попытка его и держала (probe — её билет из try_acquire):
+        отмена обычной попытки не должна сбрасывать чужую пробу
+        """
+        if not probe:
+            return
+
+        def free(health: ProviderHealth) -> None:
+            if health.state == HALF_OPEN and health.probe_started == probe:
+                health.state = OPEN
+                health.open_until = 0.0
+
+        self._update(name, free)
+
+    # --- Учёт исходов ---
+
+    def record_success(self, name: str, duration: float) -> None:
+        def apply(health: ProviderHealth) -> None:
+            health.attempts += 1
+            health.attempt_ewma = _ewma(health.attempt_ewma, duration)
+            health.latency_ewma = _ewma(health.latency_ewma, duration)
+            health.success_rate = _ewma(health.success_rate, 1.0)
+            health.timeout_rate = _ewma(health.timeout_rate, 0.0)
+            if health.state != CLOSED:
+                logger.info(f"🟢 [Health] {name} recovered, breaker closed")
+            health.state = CLOSED
+            health.consecutive_failures = 0
+            health.open_count = 0
+
+        self._update(name, apply)
+
+    def record_failure(self, name: str, duration: float, kind: str) -> None:
+        """kind: 'timeout' | 'quota' | 'error'. Квота ставит короткую паузу вместо эскалирующего cool-down"""
+        def apply(health: ProviderHealth) -> None:
+            health.attempts += 1
+            health.attempt_ewma = _ewma(health.attempt_ewma, duration)
+            health.success_rate = _ewma(health.success_rate, 0.0)
+            health.timeout_rate = _ewma(health.timeout_rate, 1.0 if kind == "timeout" else 0.0)
+            health.consecutive_failures += 1
+
+            # Уже открыт: это запоздавшие попытки (другие воркеры, проигравшие hedge) — не продлеваем
+            if name in self.never_open or health.state == OPEN:
+                return
+            if kind == "quota":
+                self._pause(name, health)
+            elif health.state == HALF_OPEN or health.consecutive_failures >= _FAILURE_THRESHOLD:
+                self._open(name, health)
+
+        self._update(name, apply)
+
+    def _open(self, name: str, health: ProviderHealth) -> None:
+        BREAKER_OPENED.inc(provider=name, reason="failures")
+        health.open_count += 1
+        health.state = OPEN
+        health.open_until = time.time() + health.cooldown()
+        logger.warning(f"🚫 [Health] {name} breaker OPEN for {health.cooldown():.0f}s "
+                       f"(failures in a row: {health.consecutive_failures})")
+
+    def _pause(self, name: str, health: ProviderHealth) -> None:
+        # open_count не растёт: следующая настоящая поломка начнёт с базового cool-down
+        BREAKER_OPENED.inc(provider=name, reason="quota")
+        health.state = OPEN
+        health.open_until = time.time() + _QUOTA_COOLDOWN
+        logger.warning(f"⏸️ [Health] {name} hit quota, pausing for {_QUOTA_COOLDOWN:.0f}s")
+
+    # --- Ранжирование ---
+
+    @staticmethod
+    def _expected_time(cls: Type, health: ProviderHealth) -> float:
+        """Ожидаемое время до картинки, если начать с этого провайдера"""
+        attempt = health.attempt_ewma if health.attempt_ewma is not None else cls.expected_latency
+        return attempt / max(health.success_rate, _MIN_SUCCESS)
+
+    def typical_latency(self, cls: Type) -> float:
+        """Сколько обычно длится успешная генерация у провайдера (живая статистика или оценка класса)"""
+        health = self._read(cls.__name__)
+        return health.latency_ewma if health.latency_ewma is not None else cls.expected_latency
+
+    def expected_time(self, cls: Type) -> float:
+        return self._expected_time(cls, self._read(cls.__name__))
+
+    def rank(self, classes: Iterable[Type], pinned_last: Iterable[Type] = ()) -> List[Type]:
+        """
+        Отсортировать цепочку по ожидаемому времени до картинки.
+        pinned_last всегда идут в конце (платный «последний рубеж»),
+        при равенстве сохраняется исходный порядок.
+        """
+        pinned = set(pinned_last)
+        snapshot = self._store.all()
+        indexed = list(enumerate(classes))
+        indexed.sort(key=lambda item: (
+            item[1] in pinned,
+            self._expected_time(item[1], ProviderHealth.from_dict(snapshot.get(item[1].__name__))),
+            item[0],
+        ))
+        return [cls for _, cls in indexed]
+
+    def stats(self) -> dict:
+        return {name: asdict(ProviderHealth.from_dict(data)) for name, data in self._store.all().items()}
+
+
+# Общий реестр на процесс
+provider_health = HealthRegistry()
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+metrics.gauge(
+    "image_breaker_state", "Provider breaker state: 0 closed, 1 half-open, 2 open", ["provider"],
+    lambda: {(name,): _STATE_VALUES.get(h["state"], 0) for name, h in provider_health.stats().items()}
+)
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# memory — состояние живёт в процессе; sqlite — общий файл для всех uvicorn-воркеров хоста,
+# переживает рестарт (воркер, увидевший мёртвого провайдера, экономит таймаут остальным)
+_BACKEND = os.getenv("IMAGE_HEALTH_BACKEND", "sqlite")
+# По умолчанию — во временной папке системы: общий для воркеров хоста и не зависит от рабочего каталога
+_DB_PATH = os.path.abspath(os.getenv("IMAGE_HEALTH_DB")
+                           or os.path.join(tempfile.gettempdir(), "image-api", "provider_health.db"))
+_BUSY_TIMEOUT = float(os.getenv("IMAGE_HEALTH_DB_TIMEOUT", "1.0"))  # сек ожидания чужой транзакции
+
+
+class HealthStore(ABC):
+    """
+    Хранилище состояния провайдеров (статистика + circuit breaker).
+    Значения — JSON-совместимые словари, ключ — имя класса провайдера.
+    """
+
+    # update может ждать блокировку (файл, другой процесс) — из event loop его вызывают в потоке
+    blocking: bool = False
+
+    @abstractmethod
+    def get(self, name: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def all(self) -> Dict[str, dict]:
+        pass
+
+    @abstractmethod
+    def update(self, name: str, fn: Callable[[Optional[dict]], dict]) -> None:
+        """Атомарно прочитать состояние, применить fn и записать результат"""
+        pass
+
+
+class MemoryHealthStore(HealthStore):
+    def __init__(self):
+        self._data: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[dict]:
+        with self._lock:
+            return self._data.get(name)
+
+    def all(self) -> Dict[str, dict]:
+        with self._lock:
+            return dict(self._data)
+
+    def update(self, name: str, fn: Callable[[Optional[dict]], dict]) -> None:
+        with self._lock:
+            self._data[name] = fn(self._data.get(name))
+
+
+class SQLiteHealthStore(HealthStore):
+    """
+    SQLite-файл в WAL-режиме. Запись — через BEGIN IMMEDIATE, так что
+    read-modify-write сериализуется между потоками и процессами.
+    Ошибки базы не должны ронять генерацию: логируем и работаем дальше без состояния.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS provider_health ("
+            " name TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3-соединение нельзя делить между потоками — держим по одному на поток
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=_BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, name: str) -> Optional[dict]:
+        try:
+            row = self._conn().execute(
+                "SELECT data FROM provider_health WHERE name = ?", (name,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ [HealthStore] Read failed: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def all(self) -> Dict[str, dict]:
+        try:
+            rows = self._conn().execute("SELECT name, data FROM provider_health").fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ [HealthStore] Read failed: {e}")
+            return {}
+        return {name: json.loads(data) for name, data in rows}
+
+    def update(self, name: str, fn: Callable[[Optional[dict]], dict]) -> None:
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ [HealthStore] Update of {name} skipped: {e}")
+            return
+
+        try:
+            row = conn.execute("SELECT data FROM provider_health WHERE name = ?", (name,)).fetchone()
+            data = fn(json.loads(row[0]) if row else None)
+            conn.execute(
+                "INSERT INTO provider_health (name, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (name, json.dumps(data), time.time()),
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self._rollback(conn)
+            logger.warning(f"⚠️ [HealthStore] Update of {name} failed: {e}")
+        except BaseException:
+            self._rollback(conn)
+            raise
+
+    @staticmethod
+    def _rollback(conn: sqlite3.Connection) -> None:
+        try:
+            conn.execute("ROLLBACK")
+        except sqlite3.Error:
+            pass
+
+
+def create_store() -> HealthStore:
+    if _BACKEND == "sqlite":
+        try:
+            store = SQLiteHealthStore(_DB_PATH)
+            logger.info(f"🗄️ [HealthStore] Shared provider health in {_DB_PATH}")
+            return store
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"⚠️ [HealthStore] SQLite unavailable ({e}), falling back to memory")
+    return MemoryHealthStore()
@@ -0,0 +1,141 @@
+import os
+import asyncio
+import logging
+import threading
+from typing import Optional, Dict
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Пул соединений на процесс: keep-alive соединения переиспользуются всеми
+# REST-провайдерами (Leonardo, kie.ai, Pixazo) — и в потоках, и в корутинах.
+_MAX_CONNECTIONS = int(os.getenv("IMAGE_HTTP_MAX_CONNECTIONS", "100"))
+_MAX_KEEPALIVE = int(os.getenv("IMAGE_HTTP_MAX_KEEPALIVE", "20"))
+_KEEPALIVE_EXPIRY = float(os.getenv("IMAGE_HTTP_KEEPALIVE_EXPIRY", "30"))  # 0 — без keep-alive
+_POOL_SIZE = int(os.getenv("IMAGE_HTTP_POOL_SIZE", "20"))  # соединений на хост для requests
+_CONNECT_RETRIES = int(os.getenv("IMAGE_HTTP_CONNECT_RETRIES", "2"))
+
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Хост -> requests.Session. Session потокобезопасна для обычных запросов,
+# urllib3-пул внутри неё сам раздаёт соединения потокам.
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(url: str) -> requests.Session:
+    """Вернуть общую Session для хоста из url (создаётся при первом обращении)"""
+    host = urlsplit(url).netloc
+
+    session = _sessions.get(host)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            # Повторяем только ошибки соединения: запрос ещё не ушёл, поэтому это безопасно и для POST
+            retry = Retry(total=None, connect=_CONNECT_RETRIES, read=0, status=0, other=0,
+                          backoff_factor=0.3, raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=_POOL_SIZE, max_retries=retry)
+
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            if _KEEPALIVE_EXPIRY <= 0:
+                session.headers["Connection"] = "close"
+
+            _sessions[host] = session
+            logger.info(f"🌐 [HTTP] Session created for {host} (pool_maxsize={_POOL_SIZE})")
+    return session
+
+
+def create_async_client() -> httpx.AsyncClient:
+    """Новый AsyncClient с общими настройками пула (для циклов, живущих в своём потоке)"""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=_MAX_CONNECTIONS,
+            max_keepalive_connections=_MAX_KEEPALIVE if _KEEPALIVE_EXPIRY > 0 else 0,
+            keepalive_expiry=_KEEPALIVE_EXPIRY or None,
+        ),
+        transport=httpx.AsyncHTTPTransport(retries=_CONNECT_RETRIES),
+        timeout=httpx.Timeout(60.0),
+        follow_redirects=True,
+    )
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Вернуть общий AsyncClient.
+    Клиент привязан к event loop, поэтому при смене цикла (тесты, скрипты) создаётся заново.
+    """
+    global _async_client, _async_client_loop
+
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.is_closed or _async_client_loop is not loop:
+        _async_client = create_async_client()
+        _async_client_loop = loop
+        logger.info(f"🌐 [HTTP] Shared AsyncClient created (max_connections={_MAX_CONNECTIONS})")
+    return _async_client
+
+
+async def aclose_async_client() -> None:
+    """Закрыть общий клиент (вызывается на shutdown приложения)"""
+    global _async_client, _async_client_loop
+
+    if _async_client is not None and not _async_client.is_closed:
+        await _async_client.aclose()
+        logger.info("🔌 [HTTP] Shared AsyncClient closed")
+    _async_client = None
+    _async_client_loop = None
+
+
+def pool_stats() -> dict:
+    """
+    Статистика пулов: сколько соединений открыто и сколько запросов ушло
+    по уже открытым (reused = requests - opened).
+    """
+    hosts = {}
+    with _sessions_lock:
+        sessions = list(_sessions.items())
+
+    for host, session in sessions:
+        opened = served = 0
+        adapter = session.get_adapter("https://")
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            served += pool.num_requests
+        hosts[host] = {"opened": opened, "requests": served, "reused": max(served - opened, 0)}
+
+    async_stats = None
+    if _async_client is not None and not _async_client.is_closed:
+        async_stats = _async_pool_state(_async_client)
+
+    return {"sessions": hosts, "async_client": async_stats}
+
+
+def _async_pool_state(client: httpx.AsyncClient) -> dict:
+    """
+    Текущее состояние пула httpx. Счётчиков у httpx нет, а пул — внутренности httpcore,
+    поэтому читаем их осторожно: после смены версии статистика станет None, а не упадёт.
+    """
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if not isinstance(connections, (list, tuple)):
+        return {"connections": None, "idle": None}
+    idle = 0
+    for connection in connections:
+        is_idle = getattr(connection, "is_idle", None)
+        if callable(is_idle) and is_idle():
+            idle += 1
+    return {"connections": len(connections), "idle": idle}
@@ -0,0 +1,313 @@
+import os
+import math
+import time
+import uuid
+import asyncio
+import logging
+import contextvars
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from .cache import cached_generate
+from .orchestrator import generate_image_async, generate_image_preview
+from .progress import listen
+from ..metrics import metrics
+from .. import tracing
+
+logger = logging.getLogger(__name__)
+
+# Сколько генераций идёт одновременно, сколько задач может ждать в очереди
+# и сколько хранить готовый результат (картинка лежит в памяти процесса).
+# Память под готовые результаты ограничена ещё и объёмом: сверх него старые задачи забываются раньше TTL
+_WORKERS = int(os.getenv("IMAGE_JOB_WORKERS", "4"))
+_QUEUE_SIZE = int(os.getenv("IMAGE_JOB_QUEUE", "100"))
+_TTL = float(os.getenv("IMAGE_JOB_TTL", "3600"))
+_MAX_BYTES = int(os.getenv("IMAGE_JOB_RESULTS_MB", "256")) * 1024 * 1024
+_PURGE_INTERVAL = 60.0
+# Начальная оценка длительности задачи для Retry-After, пока нет замеров; дальше — EWMA
+_JOB_TIME = float(os.getenv("IMAGE_JOB_TIME", "30"))
+_ALPHA = 0.2
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+_TERMINAL = {DONE, FAILED}
+
+QUEUE_WAIT_SECONDS = metrics.histogram("image_job_queue_wait_seconds", "Time a background job waited for a worker")
+
+
+class JobQueueFull(Exception):
+    """Очередь фоновых генераций заполнена; retry_after — оценка, когда освободится место"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class ImageJob:
+    id: str
+    params: dict                              # аргументы generate_image_async
+    use_cache: bool = True
+    preview: bool = False                     # прогрессивный режим: сначала быстрое превью, потом картинка
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[bytes] = field(default=None, repr=False)
+    cache_status: Optional[str] = None
+    preview_result: Optional[bytes] = field(default=None, repr=False)
+    error: Optional[str] = None
+    trace_id: Optional[str] = None
+    timed_out: bool = False
+    events: List[dict] = field(default_factory=list, repr=False)
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def add_event(self, event: dict) -> None:
+        """Только из потока event loop. Будит всех, кто ждёт новых событий"""
+        self.events.append({"ts": round(time.time(), 3), **event})
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    @property
+    def size(self) -> int:
+        """Сколько байт результатов задача держит в памяти"""
+        return len(self.result or b"") + len(self.preview_result or b"")
+
+    def _preview_state(self) -> Optional[str]:
+        if not self.preview:
+            return None
+        if self.preview_result is not None:
+            return "ready"
+        return "none" if self.status in _TERMINAL else "pending"
+
+    def summary(self) -> dict:
+        providers = [e["provider"] for e in self.events if e["phase"] == "attempt" and e.get("stage") != "preview"]
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "attempts": providers,
+            "last_event": self.events[-1] if self.events else None,
+            "cache": self.cache_status,
+            "preview": self._preview_state(),
+            "error": self.error,
+            **({"trace_id": self.trace_id} if tracing.TRACE_DEBUG else {}),
+        }
+
+
+class JobManager:
+    """
+    Фоновые генерации: задача ставится в очередь и сразу получает id,
+    ограниченный пул воркеров (asyncio-задачи) прогоняет её через оркестратор.
+    Время жизни HTTP-соединения больше не связано со временем генерации,
+    а число одновременных генераций ограничено явно.
+    """
+
+    def __init__(self, workers: int, queue_size: int, ttl: float, max_bytes: int = _MAX_BYTES,
+                 job_time: float = _JOB_TIME):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.job_ewma = job_time
+        self._jobs: Dict[str, ImageJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_workers(self) -> None:
+        # Воркеры живут в том event loop, где пришла первая задача
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        # Пустой контекст: воркеры переживают запрос, который их запустил, и не должны
+        # наследовать его трассу и подписчика на прогресс
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"image-job-{i}", context=contextvars.Context())
+            for i in range(self.workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._janitor(), name="image-job-janitor",
+                                               context=contextvars.Context()))
+        logger.info(f"🧵 [Jobs] Started {self.workers} workers (queue size {self.queue_size})")
+
+    def _purge(self) -> None:
+        """Забыть задачи с истёкшим TTL, затем самые давние готовые — пока результаты не влезут в max_bytes"""
+        now = time.time()
+        finished = sorted((job for job in self._jobs.values() if job.status in _TERMINAL),
+                          key=lambda job: job.finished_at)
+        kept = sum(job.size for job in finished)
+        for job in finished:
+            if now - job.finished_at <= self.ttl and kept <= self.max_bytes:
+                break
+            del self._jobs[job.id]
+            kept -= job.size
+
+    async def _janitor(self) -> None:
+        # Без новых задач память под результаты освобождается по таймеру
+        while True:
+            await asyncio.sleep(max(min(self.ttl, _PURGE_INTERVAL), 0.1))
+            self._purge()
+
+    # --- Публичное API ---
+
+    def submit(self, params: dict, use_cache: bool = True, preview: bool = False) -> ImageJob:
+        self._ensure_workers()
+        self._purge()
+        if self._queue.full():
+            retry_after = self.retry_after()
+            raise JobQueueFull(f"Job queue is full ({self.queue_size} jobs waiting), retry in {retry_after}s",
+                               retry_after)
+
+        job = ImageJob(id=uuid.uuid4().hex, params=params, use_cache=use_cache, preview=preview)
+        self._jobs[job.id] = job
+        job.add_event({"phase": QUEUED, "position": self._queue.qsize() + 1})
+        self._queue.put_nowait(job)
+        logger.info(f"📥 [Jobs] Job {job.id} queued: '{params['prompt'][:40]}...'")
+        return job
+
+    def retry_after(self) -> int:
+        """Через сколько секунд освободится место в очереди: глубина очереди × время задачи / воркеры"""
+        queued = self._queue.qsize() if self._queue else 0
+        estimate = self.job_ewma * (queued + 1) / max(self.workers, 1)
+        return min(max(math.ceil(estimate), 1), 600)
+
+    def get(self, job_id: str) -> Optional[ImageJob]:
+        return self._jobs.get(job_id)
+
+    async def events(self, job: ImageJob, keepalive: float = 15.0) -> AsyncIterator[Optional[dict]]:
+        """
+        События задачи: сначала накопленные, потом новые по мере появления,
+        до терминального статуса. None — пора отправить keep-alive.
+        """
+        sent = 0
+        while True:
+            while sent < len(job.events):
+                yield job.events[sent]
+                sent += 1
+            if job.status in _TERMINAL:
+                return
+            changed = job._changed
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield None
+
+    def stats(self) -> dict:
+        by_status: Dict[str, int] = {}
+        for job in self._jobs.values():
+            by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {"workers": self.workers, "queued": self._queue.qsize() if self._queue else 0,
+                "job_ewma": round(self.job_ewma, 2), "result_bytes": sum(job.size for job in self._jobs.values()),
+                "jobs": by_status}
+
+    async def shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # --- Воркеры ---
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                # У каждой задачи своя трасса (в /debug/traces — как JOB /api/image/jobs/<id>)
+                with tracing.traced("JOB", f"/api/image/jobs/{job.id}") as trace:
+                    job.trace_id = trace.id
+                    await self._run(job)
+            except Exception as e:
+                logger.error(f"❌ [Jobs] Worker crashed on job {job.id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: ImageJob) -> None:
+        loop = asyncio.get_running_loop()
+
+        def on_progress(event: dict) -> None:
+            # gradio-провайдеры сообщают фазы из потока — переносим событие в event loop
+            try:
+                current = asyncio.get_running_loop()
+            except RuntimeError:
+                current = None
+            if current is loop:
+                job.add_event(event)
+            else:
+                loop.call_soon_threadsafe(job.add_event, event)
+
+        job.status = RUNNING
+        job.started_at = time.time()
+        QUEUE_WAIT_SECONDS.observe(job.started_at - job.created_at)
+        job.add_event({"phase": RUNNING})
+
+        params = dict(job.params)
+        if params.get("timeout") is not None:
+            # Бюджет считается от постановки в очередь: время ожидания воркера тоже в него входит
+            params["timeout"] = max(params["timeout"] - (time.time() - job.created_at), 0)
+        cache_params = {k: params[k] for k in ("prompt", "negative_prompt", "width", "height")}
+        preview_task = None
+        try:
+            with listen(on_progress):
+                if job.preview:
+                    preview_task = asyncio.create_task(self._run_preview(job, cache_params, params.get("timeout"),
+                                                                        on_progress))
+                data, cache_status = await cached_generate(
+                    cache_params, lambda: generate_image_async(**params), job.use_cache
+                )
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            job.timed_out = isinstance(e, TimeoutError)
+            job.finished_at = time.time()
+            job.add_event({"phase": FAILED, "error": job.error[:500]})
+            logger.warning(f"❌ [Jobs] Job {job.id} failed in {job.finished_at - job.started_at:.1f}s")
+            return
+        finally:
+            # Готовая картинка (или ошибка) делает превью ненужным
+            if preview_task is not None and not preview_task.done():
+                preview_task.cancel()
+
+        job.result = data
+        job.cache_status = cache_status
+        job.status = DONE
+        job.finished_at = time.time()
+        job.add_event({"phase": DONE, "bytes": len(data), "cache": cache_status})
+        # Пропускная способность воркеров — по успешным задачам: мгновенные отказы её не завышают
+        self.job_ewma = _ALPHA * (job.finished_at - job.started_at) + (1 - _ALPHA) * self.job_ewma
+        logger.info(f"✅ [Jobs] Job {job.id} done in {job.finished_at - job.started_at:.1f}s")
+        self._purge()
+
+    async def _run_preview(self, job: ImageJob, cache_params: dict, timeout: Optional[float],
+                           forward: Callable[[dict], None]) -> None:
+        """Прогрессивный режим: быстрое превью параллельно с основной генерацией. В кэш превью не попадает"""
+        def on_progress(event: dict) -> None:
+            # События попыток превью помечаем, чтобы не путать их с основной генерацией
+            forward({**event, "stage": "preview"})
+
+        started = time.monotonic()
+        try:
+            with listen(on_progress):
+                data = await generate_image_preview(**cache_params, timeout=timeout)
+        except Exception as e:
+            logger.warning(f"⚠️ [Jobs] Preview for job {job.id} failed: {e}")
+            return
+        if data is None or job.status in _TERMINAL:
+            return
+        job.preview_result = data
+        job.add_event({"phase": "preview", "bytes": len(data)})
+        logger.info(f"👀 [Jobs] Preview for job {job.id} ready in {time.monotonic() - started:.1f}s")
+
+
+# Общий менеджер на процесс
+image_jobs = JobManager(_WORKERS, _QUEUE_SIZE, _TTL)
+
+metrics.gauge("image_jobs", "Background jobs kept in memory, by status", ["status"],
+              lambda: {(status,): count for status, count in image_jobs.stats()["jobs"].items()})
+metrics.gauge("image_job_queue_depth", "Background jobs waiting for a worker",
+              collect=lambda: image_jobs.stats()["queued"])
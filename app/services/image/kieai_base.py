@@ -1,15 +1,26 @@
 import os
-import time
 import json
+import asyncio
 import logging
-import requests
+from concurrent.futures import Future
 from abc import abstractmethod
+from typing import Optional
 from .base import ImageProvider
+from .http_client import get_async_client, get_session
+from .progress import report
+from .deadline import budget
+from .stream import ImageStream, check_size
+from .callbacks import callback_registry
+from .poller import poll_scheduler
+from .health import provider_health
 
 logger = logging.getLogger(__name__)
 
-_CREATE_URL = "https://api.kie.ai/api/v1/jobs/createTask"
-_POLL_URL = "https://api.kie.ai/api/v1/jobs/recordInfo"
+# Адрес API переопределяется для локальных заглушек (bench/)
+_BASE_URL = os.getenv("KIEAI_BASE_URL", "https://api.kie.ai").rstrip("/")
+_CREATE_URL = f"{_BASE_URL}/api/v1/jobs/createTask"
+_POLL_URL = f"{_BASE_URL}/api/v1/jobs/recordInfo"
+_CALLBACK_KEY = "kieai"  # имя провайдера в URL вебхука: /api/image/callbacks/kieai
 
 
 class KieAIProvider(ImageProvider):
@@ -23,7 +34,10 @@ class KieAIProvider(ImageProvider):
       - _build_input(prompt, negative_prompt, width, height) -> dict
     """
 
+    expected_latency = 60.0
+    max_concurrency = 4
     poll_timeout: int = 120  # секунд, можно переопределить в подклассе
+    poll_interval: int = 3  # минимальный интервал опроса, дальше он растёт (см. poller.py)
 
     def __init__(self):
         self.api_key = os.getenv("KIEAI_API_KEY")
@@ -39,24 +53,23 @@ class KieAIProvider(ImageProvider):
         """Сформировать словарь 'input' специфичный для модели"""
         pass
 
-    def generate(self, prompt: str, negative_prompt: str, width: int, height: int) -> bytes:
-        if not self.api_key:
-            raise ValueError("KIEAI_API_KEY not set")
-
-        logger.info(f"🎯 [{self.name}] Starting. Prompt: '{prompt[:50]}...'")
-
-        headers = {
+    def _headers(self) -> dict:
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
 
-        # 1. Создаём задачу
+    def _build_payload(self, prompt: str, negative_prompt: str, width: int, height: int) -> dict:
         payload = {
             "model": self.model_id,
             "input": self._build_input(prompt, negative_prompt, width, height),
         }
+        if callback_registry.enabled(_CALLBACK_KEY):
+            # kie.ai сам пришлёт результат на наш вебхук — поллинг остаётся страховкой
+            payload["callBackUrl"] = callback_registry.url(_CALLBACK_KEY)
+        return payload
 
-        resp = requests.post(_CREATE_URL, json=payload, headers=headers, timeout=30)
+    def _parse_task_id(self, resp) -> str:
         if resp.status_code != 200:
             raise Exception(f"[{self.name}] Create error {resp.status_code}: {resp.text}")
 
@@ -66,42 +79,116 @@ class KieAIProvider(ImageProvider):
             raise ValueError(f"[{self.name}] No taskId in response: {data}")
 
         logger.info(f"🆔 [{self.name}] Task created: {task_id}")
+        report("submitted", provider=self.name, task_id=task_id)
+        return task_id
+
+    def _parse_poll(self, poll_resp) -> Optional[str]:
+        """URL результата, None если задача ещё в работе"""
+        if poll_resp.status_code != 200:
+            logger.warning(f"⚠️ [{self.name}] Poll error {poll_resp.status_code}")
+            return None
+
+        return self._parse_record(poll_resp.json().get("data") or {})
+
+    def _parse_record(self, poll_data: dict) -> Optional[str]:
+        """Разобрать запись задачи (ответ recordInfo и тело вебхука устроены одинаково)"""
+        state = poll_data.get("state")
+        logger.debug(f"🔄 [{self.name}] State: {state}")
+
+        if state == "success":
+            result_json = poll_data.get("resultJson", "{}")
+            urls = json.loads(result_json).get("resultUrls", [])
+            if not urls:
+                raise ValueError(f"[{self.name}] Success but no resultUrls")
+            logger.info(f"✅ [{self.name}] Done. Downloading...")
+            report("downloading", provider=self.name)
+            return urls[0]
+
+        if state == "fail":
+            raise Exception(f"[{self.name}] Generation failed: {poll_data.get('failMsg', 'unknown')}")
+
+        return None
+
+    async def _poll_once(self, client, task_id: str, headers: dict) -> Optional[str]:
+        poll_resp = await client.get(_POLL_URL, params={"taskId": task_id}, headers=headers, timeout=15)
+        return self._parse_poll(poll_resp)
+
+    def _schedule_poll(self, task_id: str, headers: dict, deadline: Optional[float]) -> Future:
+        """Отдать задачу планировщику опросов; Future завершится URL результата"""
+        future = poll_scheduler.submit(
+            name=self.name,
+            poll=lambda client: self._poll_once(client, task_id, headers),
+            timeout=budget(deadline, self.poll_timeout),
+            typical=provider_health.typical_latency(type(self)),
+            min_interval=callback_registry.poll_interval(_CALLBACK_KEY, self.poll_interval),
+            waiter=callback_registry.register(_CALLBACK_KEY, task_id),
+            parse_callback=lambda payload: self._parse_record(payload.get("data") or {}),
+        )
+        future.add_done_callback(lambda _: callback_registry.discard(task_id))
+        return future
+
+    def _check_download(self, img_resp) -> bytes:
+        if img_resp.status_code != 200:
+            raise Exception(f"[{self.name}] Download failed: {img_resp.status_code}")
+        check_size(len(img_resp.content), self.name)
+
+        logger.info(f"✅ [{self.name}] Downloaded {len(img_resp.content)} bytes")
+        return img_resp.content
+
+    def generate(self, prompt: str, negative_prompt: str, width: int, height: int,
+                 deadline: Optional[float] = None) -> bytes:
+        if not self.api_key:
+            raise ValueError("KIEAI_API_KEY not set")
 
-        # 2. Поллинг результата
-        start = time.time()
-        image_url = None
+        logger.info(f"🎯 [{self.name}] Starting. Prompt: '{prompt[:50]}...'")
+
+        headers = self._headers()
+
+        # 1. Создаём задачу
+        payload = self._build_payload(prompt, negative_prompt, width, height)
+        with self._phase("submit"):
+            resp = get_session(_CREATE_URL).post(_CREATE_URL, json=payload, headers=headers, timeout=budget(deadline, 30))
+        task_id = self._parse_task_id(resp)
+
+        # 2. Ждём результат: общий планировщик опросов + вебхук
+        with self._phase("poll"):
+            image_url = self._schedule_poll(task_id, headers, deadline).result()
+
+        # 3. Скачиваем изображение
+        with self._phase("download"):
+            return self._check_download(get_session(image_url).get(image_url, timeout=budget(deadline, 60)))
 
-        while time.time() - start < self.poll_timeout:
-            time.sleep(3)
+    async def _aimage_url(self, prompt: str, negative_prompt: str, width: int, height: int,
+                          deadline: Optional[float] = None) -> str:
+        """Создание задачи + поллинг без скачивания: возвращает ссылку на результат"""
+        if not self.api_key:
+            raise ValueError("KIEAI_API_KEY not set")
 
-            poll_resp = requests.get(_POLL_URL, params={"taskId": task_id}, headers=headers, timeout=15)
-            if poll_resp.status_code != 200:
-                logger.warning(f"⚠️ [{self.name}] Poll error {poll_resp.status_code}")
-                continue
+        logger.info(f"🎯 [{self.name}] Starting async. Prompt: '{prompt[:50]}...'")
 
-            poll_data = poll_resp.json().get("data", {})
-            state = poll_data.get("state")
-            logger.debug(f"🔄 [{self.name}] State: {state}")
+        client = get_async_client()
+        headers = self._headers()
 
-            if state == "success":
-                result_json = poll_data.get("resultJson", "{}")
-                urls = json.loads(result_json).get("resultUrls", [])
-                if not urls:
-                    raise ValueError(f"[{self.name}] Success but no resultUrls")
-                image_url = urls[0]
-                logger.info(f"✅ [{self.name}] Done. Downloading...")
-                break
+        # 1. Создаём задачу
+        payload = self._build_payload(prompt, negative_prompt, width, height)
+        with self._phase("submit"):
+            resp = await client.post(_CREATE_URL, json=payload, headers=headers, timeout=budget(deadline, 30))
+        task_id = self._parse_task_id(resp)
 
-            if state == "fail":
-                raise Exception(f"[{self.name}] Generation failed: {poll_data.get('failMsg', 'unknown')}")
+        # 2. Ждём результат: общий планировщик опросов + вебхук
+        with self._phase("poll"):
+            image_url = await asyncio.wrap_future(self._schedule_poll(task_id, headers, deadline))
+        return image_url
 
-        if not image_url:
-            raise TimeoutError(f"[{self.name}] Polling timed out after {self.poll_timeout}s")
+    async def agenerate(self, prompt: str, negative_prompt: str, width: int, height: int,
+                        deadline: Optional[float] = None) -> bytes:
+        image_url = await self._aimage_url(prompt, negative_prompt, width, height, deadline)
 
         # 3. Скачиваем изображение
-        img_resp = requests.get(image_url, timeout=60)
-        if img_resp.status_code != 200:
-            raise Exception(f"[{self.name}] Download failed: {img_resp.status_code}")
+        with self._phase("download"):
+            return self._check_download(await get_async_client().get(image_url, timeout=budget(deadline, 60)))
 
-        logger.info(f"✅ [{self.name}] Downloaded {len(img_resp.content)} bytes")
-        return img_resp.content
+    async def astream(self, prompt: str, negative_prompt: str, width: int, height: int,
+                      deadline: Optional[float] = None) -> ImageStream:
+        image_url = await self._aimage_url(prompt, negative_prompt, width, height, deadline)
+        return await ImageStream.open(get_async_client(), image_url, self.name, timeout=budget(deadline, 60))
@@ -1,13 +1,40 @@
 import os
-import time
+import asyncio
 import logging
-import requests
 import random
+from concurrent.futures import Future
+from typing import Optional
 from .base import ImageProvider
+from .http_client import get_async_client, get_session
+from .progress import report
+from .deadline import budget
+from .stream import ImageStream, check_size
+from .callbacks import callback_registry
+from .poller import poll_scheduler
+from .health import provider_health
+from .capabilities import ANY_SIZE, Capabilities
 
 logger = logging.getLogger(__name__)
 
+_CALLBACK_KEY = "leonardo"  # имя провайдера в URL вебхука: /api/image/callbacks/leonardo
+
+
+def _model_capabilities(model_id: str) -> Capabilities:
+    # GPT-1.5 only supports 3 fixed resolutions: 1024x1024, 1024x1536, 1536x1024
+    if model_id == 'gpt-image-1.5':
+        return Capabilities(sizes=((1024, 1024), (1536, 1024), (1024, 1536)))
+    # Seedream-4.5 supports width/height between 256 and 1440, multiples of 8
+    if "seedream" in model_id.lower():
+        return Capabilities(min_side=256, max_side=1440, multiple=8)
+    return ANY_SIZE
+
 class LeonardoProvider(ImageProvider):
+    expected_latency = 40.0
+    max_concurrency = 3
+    poll_timeout: int = 90  # секунд на поллинг результата
+    poll_interval: int = 2  # минимальный интервал опроса, дальше он растёт (см. poller.py)
+    capabilities = _model_capabilities(os.getenv('LEONARDO_MODEL_ID', 'gpt-image-1.5'))
+
     def __init__(self):
         self.api_key = os.getenv('LEONARDO_API_KEY')
         # Default model: GPT Image-1.5
@@ -16,51 +43,29 @@ class LeonardoProvider(ImageProvider):
         # - gemini-2.5-flash-image (Nano Banana)
         # - seedream-4.5
         self.model_id = os.getenv('LEONARDO_MODEL_ID', 'gpt-image-1.5')
-        self.base_url = "https://cloud.leonardo.ai/api/rest/v2/generations"
+        # LEONARDO_BASE_URL — для локальных заглушек (bench/)
+        api_root = os.getenv('LEONARDO_BASE_URL', "https://cloud.leonardo.ai").rstrip('/')
+        self.base_url = f"{api_root}/api/rest/v2/generations"
+        # Note: Polling is often v1 methods in docs.
+        # The endpoint is `GET https://cloud.leonardo.ai/api/rest/v1/generations/{id}` usually.
+        self.poll_base_url = f"{api_root}/api/rest/v1/generations"
 
     @property
     def name(self):
         return f"Leonardo.AI ({self.model_id})"
 
-    def _get_seedream_resolution(self, width: int, height: int) -> tuple[int, int]:
-        """
-        Seedream-4.5 supports width/height between 256 and 1440.
-        Must be multiples of 8.
-        """
-        def clamp_and_align(val):
-            val = max(256, min(1440, val))
-            return (val // 8) * 8
-        
-        return clamp_and_align(width), clamp_and_align(height)
-
-    def generate(self, prompt: str, negative_prompt: str, width: int, height: int) -> bytes:
-        logger.info(f"🎯 [Leonardo] Starting generation. Prompt: '{prompt[:50]}...', Size: {width}x{height}, Model: {self.model_id}")
-        logger.debug(f"🔑 [Leonardo] API key present: {bool(self.api_key)}")
-
-        if not self.api_key:
-             raise ValueError("LEONARDO_API_KEY not set")
-
+    def _build_request(self, prompt: str, negative_prompt: str, width: int, height: int) -> tuple[dict, dict]:
+        """Заголовки и payload для v2/generations с учётом ограничений модели"""
         headers = {
             "accept": "application/json",
             "authorization": f"Bearer {self.api_key}",
             "content-type": "application/json"
         }
 
-        # Parameter logic based on model
-        gen_width, gen_height = width, height
-        
-        # Adjust dimensions for Seedream if needed
-        if "seedream" in self.model_id.lower():
-             gen_width, gen_height = self._get_seedream_resolution(width, height)
-             if gen_width != width or gen_height != height:
-                 logger.info(f"📐 [Leonardo] Adjusted size for Seedream: {width}x{height} -> {gen_width}x{gen_height}")
-        
-        # GPT-1.5 only supports 3 fixed resolutions: 1024x1024, 1024x1536, 1536x1024
-        if self.model_id == 'gpt-image-1.5':
-            gpt_resolutions = [(1024, 1024), (1536, 1024), (1024, 1536)]
-            ratio = width / height if height else 1
-            gen_width, gen_height = min(gpt_resolutions, key=lambda r: abs(r[0] / r[1] - ratio))
-            logger.info(f"📐 [Leonardo] Mapped size for GPT-1.5: {width}x{height} -> {gen_width}x{gen_height}")
+        # Parameter logic based on model: size limits live in _model_capabilities
+        gen_width, gen_height = _model_capabilities(self.model_id).native_size(width, height)
+        if (gen_width, gen_height) != (width, height):
+            logger.info(f"📐 [Leonardo] Adjusted size for {self.model_id}: {width}x{height} -> {gen_width}x{gen_height}")
 
         payload = {
             "model": self.model_id,
@@ -82,120 +87,207 @@ class LeonardoProvider(ImageProvider):
         if negative_prompt:
              payload["parameters"]["negative_prompt"] = negative_prompt
 
+        return headers, payload
+
+    def _parse_generation_id(self, response) -> str:
+        """Достать generationId из ответа на submit (requests или httpx)"""
+        logger.debug(f"📤 [Leonardo] Submit response status: {response.status_code}")
+
+        if response.status_code != 200:
+            logger.error(f"❌ [Leonardo] API Error: {response.text}")
+            raise Exception(f"Leonardo API Error {response.status_code}: {response.text}")
+
+        data = response.json()
+        logger.info(f"📦 [Leonardo] Submit raw response: {data}") # Changed to INFO to definitely see it
+
+        if isinstance(data, list):
+             logger.warning(f"⚠️ [Leonardo] Submit response is a LIST. Trying to parse first item...")
+             if data:
+                 data = data[0]
+             else:
+                 raise ValueError("Leonardo returned empty list")
+
+        generation_id = (
+            data.get('generationId')
+            or data.get('generate', {}).get('generationId')
+            or data.get('sdGenerationJob', {}).get('generationId')
+        )
+
+        if not generation_id:
+             logger.error(f"❌ [Leonardo] No generationId in response: {data}")
+             raise ValueError(f"Leonardo API did not return generationId. Response: {data}")
+
+        logger.info(f"🆔 [Leonardo] Job submitted. ID: {generation_id}")
+        report("submitted", provider=self.name, task_id=generation_id)
+        return generation_id
+
+    def _parse_poll(self, poll_response) -> Optional[str]:
+        """
+        Разобрать ответ поллинга.
+        Возвращает URL картинки, None если ещё не готово.
+        ValueError = фатальная логическая ошибка (FAILED, нет изображений).
+        """
+        if poll_response.status_code != 200:
+            logger.warning(f"⚠️ [Leonardo] Poll error {poll_response.status_code}: {poll_response.text}")
+            return None
+
+        poll_data = poll_response.json()
+        # logger.debug(f"📦 [Leonardo] Poll data: {poll_data}") # Uncomment for deep debug
+
+        generation_info = poll_data.get('generations_by_pk')
+
+        if not generation_info:
+             logger.warning(f"⚠️ [Leonardo] Poll response missing 'generations_by_pk'. Keys: {list(poll_data.keys())}")
+             return None
+
+        # Fix for "list object has no attribute get"
+        # Sometimes it returns a list?
+        if isinstance(generation_info, list):
+            if not generation_info:
+                logger.warning(f"⚠️ [Leonardo] 'generations_by_pk' is an empty list")
+                return None
+            generation_info = generation_info[0]
+
+        status = generation_info.get('status')
+        logger.debug(f"🔄 [Leonardo] Poll status: {status}")
+
+        if status == 'COMPLETE':
+            generated_images = generation_info.get('generated_images', [])
+            if generated_images:
+                logger.info(f"✅ [Leonardo] Generation COMPLETE. Image URL found.")
+                report("downloading", provider=self.name)
+                return generated_images[0].get('url')
+            else:
+                logger.error(f"❌ [Leonardo] Status COMPLETE but no images found.")
+                raise ValueError("Leonardo generation failed (no images)")
+        elif status == 'FAILED':
+            logger.error(f"❌ [Leonardo] Generation FAILED.")
+            raise ValueError("Leonardo generation status: FAILED")
+
+        return None
+
+    async def _poll_once(self, client, generation_id: str, headers: dict) -> Optional[str]:
+        poll_response = await client.get(f"{self.poll_base_url}/{generation_id}", headers=headers, timeout=30)
+        return self._parse_poll(poll_response)
+
+    def _schedule_poll(self, generation_id: str, headers: dict, deadline: Optional[float]) -> Future:
+        """
+        Отдать генерацию планировщику опросов; Future завершится URL картинки.
+        ValueError из _parse_poll (FAILED, нет изображений) завершает его ошибкой,
+        сетевые ошибки опроса — временные.
+        """
+        future = poll_scheduler.submit(
+            name=self.name,
+            poll=lambda client: self._poll_once(client, generation_id, headers),
+            timeout=budget(deadline, self.poll_timeout),
+            typical=provider_health.typical_latency(type(self)),
+            min_interval=callback_registry.poll_interval(_CALLBACK_KEY, self.poll_interval),
+            waiter=callback_registry.register(_CALLBACK_KEY, generation_id),
+            parse_callback=self._parse_webhook,
+        )
+        future.add_done_callback(lambda _: callback_registry.discard(generation_id))
+        return future
+
+    def _parse_webhook(self, payload: dict) -> Optional[str]:
+        """
+        Разобрать вебхук Leonardo (адрес задаётся в настройках API-ключа).
+        Возвращает URL картинки, None если из уведомления его достать не удалось.
+        """
+        generation = (payload.get("data") or {}).get("object") or {}
+        status = generation.get("status")
+        logger.info(f"📬 [Leonardo] Webhook received. Status: {status}")
+
+        if status == "FAILED":
+            raise ValueError("Leonardo generation status: FAILED")
+
+        images = generation.get("images") or generation.get("generated_images") or []
+        if status == "COMPLETE" and images and images[0].get("url"):
+            report("downloading", provider=self.name)
+            return images[0]["url"]
+        return None
+
+    def _check_download(self, img_response) -> bytes:
+        if img_response.status_code == 200:
+            check_size(len(img_response.content), self.name)
+            logger.info(f"✅ [Leonardo] Image downloaded OK. Size: {len(img_response.content)} bytes")
+            return img_response.content
+        else:
+             raise Exception(f"Download failed with status {img_response.status_code}")
+
+    def generate(self, prompt: str, negative_prompt: str, width: int, height: int,
+                 deadline: Optional[float] = None) -> bytes:
+        logger.info(f"🎯 [Leonardo] Starting generation. Prompt: '{prompt[:50]}...', Size: {width}x{height}, Model: {self.model_id}")
+        logger.debug(f"🔑 [Leonardo] API key present: {bool(self.api_key)}")
+
+        if not self.api_key:
+             raise ValueError("LEONARDO_API_KEY not set")
+
+        headers, payload = self._build_request(prompt, negative_prompt, width, height)
+
         # 1. Submit Generation
         logger.info(f"⏳ [Leonardo] Submitting job (Timeout: 60s)...")
         logger.debug(f"📤 [Leonardo] Request payload: {payload}")
         try:
-            response = requests.post(self.base_url, json=payload, headers=headers, timeout=60)
-            logger.debug(f"📤 [Leonardo] Submit response status: {response.status_code}")
-            
-            if response.status_code != 200:
-                logger.error(f"❌ [Leonardo] API Error: {response.text}")
-                raise Exception(f"Leonardo API Error {response.status_code}: {response.text}")
-            
-            data = response.json()
-            logger.info(f"📦 [Leonardo] Submit raw response: {data}") # Changed to INFO to definitely see it
-
-            if isinstance(data, list):
-                 logger.warning(f"⚠️ [Leonardo] Submit response is a LIST. Trying to parse first item...")
-                 if data:
-                     data = data[0]
-                 else:
-                     raise ValueError("Leonardo returned empty list")
-
-            generation_id = (
-                data.get('generationId')
-                or data.get('generate', {}).get('generationId')
-                or data.get('sdGenerationJob', {}).get('generationId')
-            )
-            
-            if not generation_id:
-                 logger.error(f"❌ [Leonardo] No generationId in response: {data}")
-                 raise ValueError(f"Leonardo API did not return generationId. Response: {data}")
-                 
-            logger.info(f"🆔 [Leonardo] Job submitted. ID: {generation_id}")
+            with self._phase("submit"):
+                response = get_session(self.base_url).post(self.base_url, json=payload, headers=headers, timeout=budget(deadline, 60))
+            generation_id = self._parse_generation_id(response)
+        except Exception as e:
+            logger.error(f"❌ [Leonardo] Submit failed: {e}")
+            raise e
+
+        # 2. Poll for Result — общий планировщик опросов, вебхук завершает досрочно
+        with self._phase("poll"):
+            image_url = self._schedule_poll(generation_id, headers, deadline).result()
 
+        # 3. Download Image
+        logger.info(f"⬇️ [Leonardo] Downloading image...")
+        try:
+            with self._phase("download"):
+                return self._check_download(get_session(image_url).get(image_url, timeout=budget(deadline, 60)))
+        except Exception as e:
+            logger.error(f"❌ [Leonardo] Download failed: {e}")
+            raise e
+
+    async def _aimage_url(self, prompt: str, negative_prompt: str, width: int, height: int,
+                          deadline: Optional[float] = None) -> str:
+        """Submit + поллинг без скачивания: возвращает ссылку на готовую картинку"""
+        logger.info(f"🎯 [Leonardo] Starting async generation. Prompt: '{prompt[:50]}...', Size: {width}x{height}, Model: {self.model_id}")
+
+        if not self.api_key:
+             raise ValueError("LEONARDO_API_KEY not set")
+
+        client = get_async_client()
+        headers, payload = self._build_request(prompt, negative_prompt, width, height)
+
+        # 1. Submit Generation
+        logger.info(f"⏳ [Leonardo] Submitting job (Timeout: 60s)...")
+        try:
+            with self._phase("submit"):
+                response = await client.post(self.base_url, json=payload, headers=headers, timeout=budget(deadline, 60))
+            generation_id = self._parse_generation_id(response)
         except Exception as e:
             logger.error(f"❌ [Leonardo] Submit failed: {e}")
             raise e
 
-        # 2. Poll for Result
-        start_time = time.time()
-        timeout = 90 # 90 seconds polling timeout
-        image_url = None
-
-        while time.time() - start_time < timeout:
-            try:
-                poll_url = f"https://cloud.leonardo.ai/api/rest/v1/generations/{generation_id}" # Note: Polling is often v1 methods in docs, but let's check correct endpoint. 
-                # Docs said GET /generations/{id} returns generation info.
-                # Actually, standard pattern is checking v1/generations/{id} or similar. 
-                # Let's verify polling endpoint from my research task... I read 'Get a Single Generation'.
-                # The endpoint is `GET https://cloud.leonardo.ai/api/rest/v1/generations/{id}` usually.
-                
-                poll_response = requests.get(poll_url, headers=headers, timeout=30)
-                
-                if poll_response.status_code != 200:
-                    logger.warning(f"⚠️ [Leonardo] Poll error {poll_response.status_code}: {poll_response.text}")
-                    time.sleep(2)
-                    continue
-                
-                poll_data = poll_response.json()
-                # logger.debug(f"📦 [Leonardo] Poll data: {poll_data}") # Uncomment for deep debug
-                
-                generation_info = poll_data.get('generations_by_pk')
-                
-                if not generation_info:
-                     logger.warning(f"⚠️ [Leonardo] Poll response missing 'generations_by_pk'. Keys: {list(poll_data.keys())}")
-                     time.sleep(2)
-                     continue
-                
-                # Fix for "list object has no attribute get"
-                # Sometimes it returns a list?
-                if isinstance(generation_info, list):
-                    if not generation_info:
-                        logger.warning(f"⚠️ [Leonardo] 'generations_by_pk' is an empty list")
-                        time.sleep(2)
-                        continue
-                    generation_info = generation_info[0]
-
-                status = generation_info.get('status')
-                logger.debug(f"🔄 [Leonardo] Poll status: {status}")
-                
-                if status == 'COMPLETE':
-                    generated_images = generation_info.get('generated_images', [])
-                    if generated_images:
-                        image_url = generated_images[0].get('url')
-                        logger.info(f"✅ [Leonardo] Generation COMPLETE. Image URL found.")
-                        break
-                    else:
-                        logger.error(f"❌ [Leonardo] Status COMPLETE but no images found.")
-                        raise ValueError("Leonardo generation failed (no images)")
-                elif status == 'FAILED':
-                    logger.error(f"❌ [Leonardo] Generation FAILED.")
-                    raise ValueError("Leonardo generation status: FAILED")
-
-                time.sleep(2)
-
-            except (ValueError, Exception) as e:
-                # ValueError = фатальная логическая ошибка (FAILED, нет изображений) — пробрасываем
-                if isinstance(e, ValueError):
-                    raise
-                # Остальное (сеть, timeout запроса) — временная ошибка, продолжаем поллинг
-                logger.warning(f"⚠️ [Leonardo] Polling transient error: {e}")
-                time.sleep(2)
-
-        if not image_url:
-            raise TimeoutError("Leonardo generation timed out while polling")
+        # 2. Poll for Result — ждём Future планировщика, поток не держим
+        with self._phase("poll"):
+            image_url = await asyncio.wrap_future(self._schedule_poll(generation_id, headers, deadline))
+        return image_url
+
+    async def agenerate(self, prompt: str, negative_prompt: str, width: int, height: int,
+                        deadline: Optional[float] = None) -> bytes:
+        image_url = await self._aimage_url(prompt, negative_prompt, width, height, deadline)
 
         # 3. Download Image
         logger.info(f"⬇️ [Leonardo] Downloading image...")
         try:
-            img_response = requests.get(image_url, timeout=60)
-            if img_response.status_code == 200:
-                logger.info(f"✅ [Leonardo] Image downloaded OK. Size: {len(img_response.content)} bytes")
-                return img_response.content
-            else:
-                 raise Exception(f"Download failed with status {img_response.status_code}")
+            with self._phase("download"):
+                return self._check_download(await get_async_client().get(image_url, timeout=budget(deadline, 60)))
         except Exception as e:
             logger.error(f"❌ [Leonardo] Download failed: {e}")
             raise e
+
+    async def astream(self, prompt: str, negative_prompt: str, width: int, height: int,
+                      deadline: Optional[float] = None) -> ImageStream:
+        image_url = await self._aimage_url(prompt, negative_prompt, width, height, deadline)
+        return await ImageStream.open(get_async_client(), image_url, self.name, timeout=budget(deadline, 60))
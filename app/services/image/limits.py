@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, Optional, Type
+
+logger = logging.getLogger(__name__)
+
+# Переопределение лимитов без правки кода, например:
+# IMAGE_PROVIDER_LIMITS={"LeonardoProvider": {"max_concurrency": 2, "rate_per_minute": 10}}
+_ENV_LIMITS = os.getenv("IMAGE_PROVIDER_LIMITS")
+
+
+def _load_overrides() -> Dict[str, dict]:
+    if not _ENV_LIMITS:
+        return {}
+    try:
+        data = json.loads(_ENV_LIMITS)
+    except json.JSONDecodeError as e:
+        logger.error(f"❌ [Limits] IMAGE_PROVIDER_LIMITS is not valid JSON: {e}")
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+class TokenBucket:
+    """Токен-бакет: rate_per_minute пополнение, burst — сколько запросов можно подряд"""
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def wait_time(self) -> float:
+        """Через сколько секунд появится токен"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class _Limit:
+    def __init__(self, max_concurrency: Optional[int], bucket: Optional[TokenBucket]):
+        self.max_concurrency = max_concurrency
+        self.bucket = bucket
+        self.in_flight = 0
+        self.rejected = 0
+
+
+class ProviderLimiter:
+    """
+    Допуск к провайдеру: не больше max_concurrency одновременных попыток
+    и не чаще rate_per_minute (токен-бакет). Проверка неблокирующая —
+    если места нет, оркестратор сразу идёт к следующему провайдеру,
+    а не отправляет запрос, который закончится 429.
+
+    Лимиты берутся из атрибутов класса провайдера и переопределяются IMAGE_PROVIDER_LIMITS.
+    Счётчики живут в процессе: при нескольких воркерах лимит действует на каждый.
+    """
+
+    def __init__(self):
+        self._overrides = _load_overrides()
+        self._limits: Dict[str, _Limit] = {}
+        self._lock = threading.Lock()
+
+    def _limit(self, cls: Type) -> _Limit:
+        name = cls.__name__
+        limit = self._limits.get(name)
+        if limit is None:
+            conf = {
+                "max_concurrency": getattr(cls, "max_concurrency", None),
+                "rate_per_minute": getattr(cls, "rate_per_minute", None),
+                "burst": getattr(cls, "rate_burst", None),
+                **self._overrides.get(name, {}),
+            }
+            bucket = None
+            if conf["rate_per_minute"]:
+                # По умолчанию разрешаем всплеск в ~10 секунд трафика
+                burst = conf["burst"] or max(1, round(conf["rate_per_minute"] / 6))
+                bucket = TokenBucket(float(conf["rate_per_minute"]), int(burst))
+            limit = _Limit(conf["max_concurrency"], bucket)
+            self._limits[name] = limit
+        return limit
+
+    def try_acquire(self, cls: Type) -> bool:
+        with self._lock:
+            limit = self._limit(cls)
+            if limit.max_concurrency is not None and limit.in_flight >= limit.max_concurrency:
+                limit.rejected += 1
+                return False
+            if limit.bucket is not None and not limit.bucket.try_take():
+                limit.rejected += 1
+                return False
+            limit.in_flight += 1
+            return True
+
+    def release(self, cls: Type) -> None:
+        with self._lock:
+            limit = self._limit(cls)
+            limit.in_flight = max(limit.in_flight - 1, 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    "in_flight": limit.in_flight,
+                    "max_concurrency": limit.max_concurrency,
+                    "rate_per_minute": round(limit.bucket.rate * 60, 2) if limit.bucket else None,
+                    "tokens": round(limit.bucket.tokens, 2) if limit.bucket else None,
+                    "rejected": limit.rejected,
+                }
+                for name, limit in self._limits.items()
+            }
+
+
+# Общий лимитер на процесс
+provider_limits = ProviderLimiter()
@@ -1,7 +1,25 @@
+import os
+import asyncio
 import logging
 import time
-from typing import List, Dict, Type
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Any, Awaitable, Callable, List, Dict, Type, Optional
+
+import httpx
+import requests
 from .base import ImageProvider
+from .cache import make_key
+from .singleflight import SingleFlight
+from .health import provider_health
+from .stream import ImageStream
+from .deadline import DeadlineExceeded, make_deadline, remaining, within
+from .limits import provider_limits
+from .progress import report
+from .capabilities import CapabilityIndex, GEOMETRY_ROUTING
+from ..metrics import metrics, track_executor
+from .. import tracing
 
 # Импортируем все провайдеры
 from .playground import PlaygroundProvider
@@ -15,49 +33,81 @@ logger = logging.getLogger(__name__)
 
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
-# Провайдеры, которые никогда не банятся (всегда в ротации)
+# Провайдеры, которых circuit breaker никогда не выключает (всегда в ротации)
 NEVER_BLACKLIST: set[Type[ImageProvider]] = {PixazoProvider}
+# Платный «последний рубеж» — при ранжировании всегда в конце цепочки
+PINNED_LAST: set[Type[ImageProvider]] = {PixazoProvider}
 
-# Blacklist: класс провайдера -> timestamp когда упал
-# Провайдер исключается на 24 часа после первой ошибки
-_blacklist: Dict[Type[ImageProvider], float] = {}
-_BLACKLIST_TTL = 24 * 60 * 60  # секунд
+# Порядок цепочки: adaptive — по живой статистике (см. health.py), static — как в _provider_chain
+ADAPTIVE_RANKING = os.getenv("IMAGE_RANKING", "adaptive") == "adaptive"
 
+provider_health.never_open = {cls.__name__ for cls in NEVER_BLACKLIST}
 
-def _is_blacklisted(cls: Type[ImageProvider]) -> bool:
-    if cls in NEVER_BLACKLIST:
-        return False
-    banned_at = _blacklist.get(cls)
-    if banned_at is None:
-        return False
-    if time.time() - banned_at >= _BLACKLIST_TTL:
-        del _blacklist[cls]
-        logger.info(f"🔓 [Orchestrator] {cls.__name__} unbanned after 24h cooldown")
-        return False
-    return True
+# Hedged-режим: задержка (сек) перед запуском следующего провайдера, пока предыдущий ещё работает.
+# None — обычный последовательный перебор, 0 — гонка всех провайдеров сразу.
+_env_hedge_delay = os.getenv("IMAGE_HEDGE_DELAY")
+DEFAULT_HEDGE_DELAY: Optional[float] = float(_env_hedge_delay) if _env_hedge_delay else None
 
+# Общий пул потоков для параллельных попыток. Проигравшие попытки нельзя прервать
+# посреди HTTP-запроса, поэтому они дорабатывают в фоне, а их результат выбрасывается.
+_hedge_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("IMAGE_HEDGE_WORKERS", "16")),
+    thread_name_prefix="image-hedge"
+)
 
-def _ban(cls: Type[ImageProvider]) -> None:
-    if cls in NEVER_BLACKLIST:
-        return
-    _blacklist[cls] = time.time()
-    logger.warning(f"🚫 [Orchestrator] {cls.__name__} banned for {_BLACKLIST_TTL // 3600}h")
 
+# Прогрессивный режим: пока основной провайдер делает картинку, быстрый делает превью.
+# Имя класса провайдера превью или "fastest" — самый быстрый здоровый по замерам
+PREVIEW_PROVIDER = os.getenv("IMAGE_PREVIEW_PROVIDER", "PixazoProvider")
+PREVIEW_TIMEOUT = float(os.getenv("IMAGE_PREVIEW_TIMEOUT", "20"))  # дольше превью уже не нужно, сек
 
-def generate_image_sync(
-        prompt: str,
-        negative_prompt: str,
-        width: int,
-        height: int
-) -> bytes:
+# При заданном дедлайне провайдер пропускается, если до него осталось меньше,
+# чем его типичное время генерации × _DEADLINE_FIT
+_DEADLINE_FIT = float(os.getenv("IMAGE_DEADLINE_FIT", "1.0"))
+_NO_TIME_LEFT = "skipped, not enough time left"
+# Таймаут, сработавший ближе этого (сек) к дедлайну, считается обрывом по бюджету, а не медленным провайдером
+_DEADLINE_SLACK = 0.5
+
+# Одинаковые запросы, пришедшие пока генерация уже идёт, ждут её результат, а не запускают свою
+COALESCE_ENABLED = os.getenv("IMAGE_COALESCE", "1") == "1"
+_inflight = SingleFlight()
+
+# --- Метрики (/metrics) ---
+GENERATION_SECONDS = metrics.histogram(
+    "image_generation_seconds", "End-to-end image generation time", ["mode", "outcome"]
+)
+FALLBACK_DEPTH = metrics.histogram(
+    "image_fallback_depth", "Failed provider attempts before the successful one", buckets=(0, 1, 2, 3, 4, 5, 6)
+)
+ATTEMPTS = metrics.counter(
+    "image_provider_attempts_total", "Provider attempts by outcome: success, quota, timeout, parse, error, deadline",
+    ["provider", "outcome"]
+)
+ATTEMPT_SECONDS = metrics.histogram(
+    "image_provider_attempt_seconds", "Duration of one provider attempt", ["provider", "outcome"]
+)
+PREVIEWS = metrics.counter(
+    "image_previews_total", "Progressive-mode previews by outcome: ok, failed, skipped", ["outcome"]
+)
+SKIPPED = metrics.counter(
+    "image_provider_skipped_total", "Providers skipped before an attempt: deadline, limit, probe",
+    ["provider", "reason"]
+)
+metrics.gauge("image_attempts_in_flight", "Provider attempts currently running", ["provider"],
+              lambda: {(name,): s["in_flight"] for name, s in provider_limits.stats().items()})
+metrics.gauge("image_coalesced_in_flight", "Distinct generations shared by coalesced requests",
+              collect=lambda: _inflight.in_flight())
+track_executor("image_hedge", lambda: _hedge_executor)
 
+
+def _provider_chain() -> List[Type[ImageProvider]]:
     # === СТРАТЕГИЯ ===
     # 1. Сначала пробуем самые крутые бесплатные (Playground, Flux, Qwen)
     # 2. Потом пробуем быстрые/CPU (Radames Lightning)
     # 3. LeonardoAI (универсальный)
     # 4. В самом конце - платный/стабильный (Pixazo) — никогда не банится
-
-    all_providers: List[Type[ImageProvider]] = [
+    # При adaptive-ранжировании это лишь исходный порядок: дальше его двигает живая статистика.
+    return [
         PlaygroundProvider,    # 1. Топ качество (45 сек)
         FluxKleinProvider,     # 2. Быстрый и крутой (30 сек)
         LeonardoProvider,      # 3. Leonardo AI (GPT-1.5 / Nano / SeeDream)
@@ -66,37 +116,595 @@ def generate_image_sync(
         PixazoProvider,        # 7. ПОСЛЕДНИЙ РУБЕЖ (Всегда работает, не банится)
     ]
 
-    active = [cls for cls in all_providers if not _is_blacklisted(cls)]
 
-    skipped = len(all_providers) - len(active)
-    logger.info(f"🎬 [Orchestrator] New Request: '{prompt[:40]}...' Size: {width}x{height} "
-                f"| Active: {len(active)}/{len(all_providers)} providers"
-                + (f" ({skipped} blacklisted)" if skipped else ""))
+# Возможности провайдеров по геометрии — собираются один раз, оценка размеров кэшируется
+_capability_index = CapabilityIndex(_provider_chain())
+
+
+def warm_up_providers() -> None:
+    """Прогреть провайдеров цепочки (gradio-клиенты строятся в фоне, старт не блокируется)"""
+    for cls in _provider_chain():
+        try:
+            cls().warm()
+        except Exception as e:
+            logger.warning(f"⚠️ [Orchestrator] Warm-up of {cls.__name__} failed: {e}")
+
+
+# Таймауты HTTP-клиентов не наследуют TimeoutError, а текст у них бывает пустым
+_TIMEOUT_ERRORS = (TimeoutError, httpx.TimeoutException, requests.Timeout)
+
+
+def _classify_error(e: Exception) -> str:
+    err_msg = str(e).lower()
+    if "quota" in err_msg or "429" in err_msg:
+        return "quota"
+    if isinstance(e, _TIMEOUT_ERRORS) or "timeout" in err_msg or "timed out" in err_msg:
+        return "timeout"
+    return "error"
+
+
+def _error_class(e: BaseException, kind: str) -> str:
+    """Класс ошибки для метрик: как _classify_error, но неразобранный ответ провайдера — отдельно"""
+    if kind == "error" and isinstance(e, (ValueError, KeyError, IndexError, TypeError)):
+        return "parse"
+    return kind
+
+
+@contextmanager
+def _measure_request(mode: str, errors: List[str]):
+    """Время генерации целиком и сколько провайдеров упало до успешного"""
+    started = time.monotonic()
+    outcome = "ok"
+    try:
+        yield
+    except TimeoutError:
+        outcome = "timeout"
+        raise
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        GENERATION_SECONDS.observe(time.monotonic() - started, mode=mode, outcome=outcome)
+        if outcome == "ok":
+            FALLBACK_DEPTH.observe(sum(1 for e in errors if not e.endswith(_NO_TIME_LEFT)))
+
+
+def _start_attempt(cls: Type[ImageProvider], label: str, deadline: Optional[float] = None,
+                   errors: Optional[List[str]] = None) -> Optional[ImageProvider]:
+    """
+    Создать провайдера для попытки. None — провайдер не успеет до дедлайна, у него нет свободного места
+    (лимит параллельных попыток / запросов в минуту) или breaker в half-open и пробу уже занял другой запрос.
+    """
+    left = remaining(deadline)
+    if left is not None:
+        typical = provider_health.typical_latency(cls)
+        if left < typical * _DEADLINE_FIT:
+            logger.info(f"⏭️ [Orchestrator] {label}: {cls.__name__} needs ~{typical:.0f}s, "
+                        f"only {max(left, 0):.0f}s left, skipping")
+            if errors is not None:
+                errors.append(f"{cls.__name__}: {_NO_TIME_LEFT}")
+            SKIPPED.inc(provider=cls.__name__, reason="deadline")
+            return None
+    if not provider_limits.try_acquire(cls):
+        logger.info(f"⏭️ [Orchestrator] {label}: {cls.__name__} is at its concurrency/rate limit, skipping")
+        SKIPPED.inc(provider=cls.__name__, reason="limit")
+        return None
+    probe = provider_health.try_acquire(cls.__name__)
+    if probe is None:
+        provider_limits.release(cls)
+        logger.info(f"⏭️ [Orchestrator] {label}: {cls.__name__} is probing in another request, skipping")
+        SKIPPED.inc(provider=cls.__name__, reason="probe")
+        return None
+    provider = cls()
+    provider.probe = probe
+    provider.attempt = tracing.next_attempt()
+    logger.info(f"🔄 [Orchestrator] {label}: Launching >>> {provider.name} <<<")
+    report("attempt", provider=provider.name, step=label)
+    return provider
+
+
+def _cancel_attempt(cls: Type[ImageProvider], provider: ImageProvider) -> None:
+    """Попытку отменили, не дождавшись исхода — освобождаем её место и слот пробы, если он её"""
+    provider_limits.release(cls)
+    provider_health.release(cls.__name__, provider.probe)
+
+
+def _handle_success(cls: Type[ImageProvider], provider: ImageProvider, started: float) -> None:
+    provider_limits.release(cls)
+    duration = time.monotonic() - started
+    provider_health.record_success(cls.__name__, duration)
+    ATTEMPTS.inc(provider=cls.__name__, outcome="success")
+    ATTEMPT_SECONDS.observe(duration, provider=cls.__name__, outcome="success")
+    tracing.record("attempt", started, cls.__name__, provider.attempt, outcome="success")
+    logger.info(f"✅ [Orchestrator] SUCCESS! Image generated by {provider.name} in {duration:.1f}s")
+    report("provider_succeeded", provider=provider.name, duration=round(duration, 2))
+
+
+def _cut_by_deadline(e: BaseException, deadline: Optional[float]) -> bool:
+    """
+    Попытку оборвал бюджет запроса, а не провайдер: DeadlineExceeded или таймаут шага,
+    урезанного до остатка бюджета (ReadTimeout, «Polling timed out», job.result), на самом дедлайне
+    """
+    if isinstance(e, DeadlineExceeded):
+        return True
+    left = remaining(deadline)
+    return left is not None and left <= _DEADLINE_SLACK and _classify_error(e) == "timeout"
+
+
+def _handle_failure(cls: Type[ImageProvider], provider: ImageProvider, e: Exception,
+                    errors: List[str], started: float, deadline: Optional[float] = None) -> None:
+    if _cut_by_deadline(e, deadline):
+        # Попытку оборвал бюджет запроса — в статистику провайдера это не пишем
+        logger.warning(f"⏰ [Orchestrator] {provider.name} cut off by request deadline")
+        ATTEMPTS.inc(provider=cls.__name__, outcome="deadline")
+        tracing.record("attempt", started, cls.__name__, provider.attempt, outcome="deadline")
+        _cancel_attempt(cls, provider)
+        errors.append(f"{provider.name}: {e}")
+        report("provider_failed", provider=provider.name, kind="deadline", error=str(e))
+        return
+
+    provider_limits.release(cls)
+    err_msg = str(e)
+    kind = _classify_error(e)
+
+    if kind == "quota":
+        logger.warning(f"[Orchestrator] {provider.name} hit QUOTA/LIMIT. Moving next...")
+    elif kind == "timeout":
+        logger.warning(f"[Orchestrator] {provider.name} TIMED OUT. Moving next...")
+    else:
+        logger.error(f"[Orchestrator] {provider.name} FAILED: {err_msg}")
+
+    duration = time.monotonic() - started
+    provider_health.record_failure(cls.__name__, duration, kind)
+    outcome = _error_class(e, kind)
+    ATTEMPTS.inc(provider=cls.__name__, outcome=outcome)
+    ATTEMPT_SECONDS.observe(duration, provider=cls.__name__, outcome=outcome)
+    tracing.record("attempt", started, cls.__name__, provider.attempt, outcome=outcome)
+    errors.append(f"{provider.name}: {err_msg}")
+    report("provider_failed", provider=provider.name, kind=kind, error=err_msg[:300])
+
+
+def _record_abandoned(cls: Type[ImageProvider], provider: ImageProvider, started: float, future: Future,
+                      deadline: Optional[float] = None) -> None:
+    """Проигравшая попытка в потоке всё равно доработала — её исход полезен для статистики"""
+    if future.cancelled():
+        _cancel_attempt(cls, provider)
+        return
+    duration = time.monotonic() - started
+    error = future.exception()
+    if error is not None and _cut_by_deadline(error, deadline):
+        _cancel_attempt(cls, provider)
+        return
+    provider_limits.release(cls)
+    if error is None:
+        provider_health.record_success(cls.__name__, duration)
+        outcome = "success"
+    else:
+        kind = _classify_error(error)
+        provider_health.record_failure(cls.__name__, duration, kind)
+        outcome = _error_class(error, kind)
+    ATTEMPTS.inc(provider=cls.__name__, outcome=outcome)
+    ATTEMPT_SECONDS.observe(duration, provider=cls.__name__, outcome=outcome)
 
-    errors = []
 
+def _run_serial(active: List[Type[ImageProvider]], prompt: str, negative_prompt: str,
+                width: int, height: int, errors: List[str], deadline: Optional[float] = None) -> Optional[bytes]:
     for i, cls in enumerate(active, 1):
-        provider = cls()
-        logger.info(f"🔄 [Orchestrator] Step {i}/{len(active)}: Launching >>> {provider.name} <<<")
+        provider = _start_attempt(cls, f"Step {i}/{len(active)}", deadline, errors)
+        if provider is None:
+            continue
 
+        started = time.monotonic()
         try:
-            result = provider.generate(prompt, negative_prompt, width, height)
-            logger.info(f"✅ [Orchestrator] SUCCESS! Image generated by {provider.name}")
+            result = provider.generate(prompt, negative_prompt, width, height, deadline)
+        except Exception as e:
+            _handle_failure(cls, provider, e, errors, started, deadline)
+            continue
+
+        _handle_success(cls, provider, started)
+        return result
+
+    return None
+
+
+def _abandon(pending: Dict[Future, tuple], deadline: Optional[float] = None) -> None:
+    """Бросить незавершённые попытки в потоках: их исход дозапишется в статистику, когда они доработают"""
+    for loser, (loser_cls, loser_provider, loser_started) in pending.items():
+        loser.cancel()
+        loser.add_done_callback(
+            lambda f, c=loser_cls, p=loser_provider, st=loser_started: _record_abandoned(c, p, st, f, deadline)
+        )
+
+
+def _wait_timeout(hedge_delay: float, queue: list, deadline: Optional[float]) -> Optional[float]:
+    """Сколько ждать очередного исхода: до подключения следующего провайдера, но не дольше дедлайна"""
+    timeouts = [t for t in (hedge_delay if queue else None, remaining(deadline)) if t is not None]
+    return max(min(timeouts), 0) if timeouts else None
+
+
+def _run_hedged(active: List[Type[ImageProvider]], prompt: str, negative_prompt: str,
+                width: int, height: int, hedge_delay: float, errors: List[str],
+                deadline: Optional[float] = None) -> Optional[bytes]:
+    """
+    Запускает провайдеров внахлёст: следующий стартует, если предыдущий не ответил
+    за hedge_delay секунд или упал. Возвращает первую успешную картинку.
+    """
+    queue = list(active)
+    pending: Dict[Future, tuple] = {}
+
+    def launch() -> None:
+        while queue:
+            cls = queue.pop(0)
+            step = len(active) - len(queue)
+            provider = _start_attempt(cls, f"Hedge {step}/{len(active)}", deadline, errors)
+            if provider is None:
+                continue
+            # copy_context: прогресс и трасса запроса доходят и до попыток в пуле
+            future = _hedge_executor.submit(contextvars.copy_context().run, provider.generate,
+                                            prompt, negative_prompt, width, height, deadline)
+            pending[future] = (cls, provider, time.monotonic())
+            return
+
+    launch()
+    while hedge_delay == 0 and queue:
+        launch()
+
+    while pending:
+        done, _ = wait(list(pending), timeout=_wait_timeout(hedge_delay, queue, deadline),
+                       return_when=FIRST_COMPLETED)
+
+        if not done:
+            if deadline is not None and remaining(deadline) <= 0:
+                logger.warning(f"⏰ [Orchestrator] Deadline reached, abandoning {len(pending)} attempt(s)")
+                _abandon(pending, deadline)
+                return None
+            # Никто не успел за hedge_delay — подключаем следующего
+            launch()
+            continue
+
+        for future in done:
+            cls, provider, started = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                _handle_failure(cls, provider, e, errors, started, deadline)
+                launch()
+                continue
+
+            _handle_success(cls, provider, started)
+            logger.info(f"🏁 [Orchestrator] Abandoning {len(pending)} other attempt(s)")
+            _abandon(pending, deadline)
             return result
 
-        except Exception as e:
-            err_msg = str(e)
+    return None
+
+
+def _prepare_request(prompt: str, negative_prompt: str, width: int, height: int, hedge_delay: Optional[float],
+                     deadline: Optional[float] = None) -> tuple[List[Type[ImageProvider]], Optional[float]]:
+    all_providers = _provider_chain()
+    if ADAPTIVE_RANKING:
+        all_providers = provider_health.rank(all_providers, pinned_last=PINNED_LAST)
+    active = [cls for cls in all_providers if provider_health.is_available(cls.__name__)]
+    skipped = len(all_providers) - len(active)
+
+    distorting = []
+    if GEOMETRY_ROUTING:
+        # Сначала провайдеры, которые сразу дают нужные пропорции; искажающие — в конец, как запасной вариант.
+        # При negative prompt внутри групп вперёд те, кто его учитывает
+        active, distorting = _capability_index.route(active, width, height, keep=PINNED_LAST,
+                                                     negative_prompt=bool(negative_prompt and negative_prompt.strip()))
+        for cls in distorting:
+            native = _capability_index.fit(cls.__name__, width, height).native
+            logger.info(f"📐 [Orchestrator] Moving {cls.__name__} to the end: would return ~{native[0]}x{native[1]} "
+                        f"for {width}x{height}")
+
+    if hedge_delay is None:
+        hedge_delay = DEFAULT_HEDGE_DELAY
+
+    logger.info(f"🎬 [Orchestrator] New Request: '{prompt[:40]}...' Size: {width}x{height} "
+                f"| Active: {len(active)}/{len(all_providers)} providers"
+                + (f" ({skipped} cooling down)" if skipped else "")
+                + (f" ({len(distorting)} demoted for geometry)" if distorting else "")
+                + (f" | Hedge: {hedge_delay}s" if hedge_delay is not None else "")
+                + (f" | Deadline: {remaining(deadline):.0f}s" if deadline is not None else ""))
+    logger.info(f"📊 [Orchestrator] Chain: {' -> '.join(cls.__name__ for cls in active)}")
+
+    return active, hedge_delay
+
+
+def _preview_provider(negative_prompt: str, width: int, height: int) -> Optional[Type[ImageProvider]]:
+    """
+    Кто делает превью: IMAGE_PREVIEW_PROVIDER, если он доступен, иначе самый быстрый здоровый
+    по живой статистике. Первый в цепочке основной генерации не подходит — он занят качественной картинкой.
+    """
+    chain = _provider_chain()
+    if ADAPTIVE_RANKING:
+        chain = provider_health.rank(chain, pinned_last=PINNED_LAST)
+    chain = [cls for cls in chain if provider_health.is_available(cls.__name__)]
+    if GEOMETRY_ROUTING:
+        chain, _ = _capability_index.route(chain, width, height, keep=PINNED_LAST,
+                                           negative_prompt=bool(negative_prompt and negative_prompt.strip()))
+    candidates = chain[1:]
+    preferred = [cls for cls in candidates if cls.__name__ == PREVIEW_PROVIDER]
+    if preferred:
+        return preferred[0]
+    return min(candidates, key=provider_health.typical_latency, default=None)
 
-            if "quota" in err_msg.lower() or "429" in err_msg:
-                logger.warning(f"[Orchestrator] {provider.name} hit QUOTA/LIMIT. Moving next...")
-            elif "timeout" in err_msg.lower():
-                logger.warning(f"[Orchestrator] {provider.name} TIMED OUT. Moving next...")
-            else:
-                logger.error(f"[Orchestrator] {provider.name} FAILED: {err_msg}")
 
-            _ban(cls)
-            errors.append(f"{provider.name}: {err_msg}")
+def provider_stats() -> dict:
+    """Живая статистика и состояние breaker по каждому провайдеру + текущий порядок цепочки"""
+    chain = _provider_chain()
+    if ADAPTIVE_RANKING:
+        chain = provider_health.rank(chain, pinned_last=PINNED_LAST)
+    return {"chain": [cls.__name__ for cls in chain], "providers": provider_health.stats(),
+            "limits": provider_limits.stats(), "capabilities": _capability_index.stats()}
 
+
+def _raise_all_dead(errors: List[str], deadline: Optional[float] = None) -> None:
+    if deadline is not None and (remaining(deadline) <= 0 or any(e.endswith(_NO_TIME_LEFT) for e in errors)):
+        # Упёрлись в бюджет времени вызывающего — это таймаут, а не поломка провайдеров
+        final_error = f"Deadline exceeded. Details: {'; '.join(errors) or 'no attempts finished in time'}"
+        logger.error(final_error)
+        raise TimeoutError(final_error)
     final_error = f"ALL PROVIDERS DEAD. Details: {'; '.join(errors)}"
     logger.critical(final_error)
     raise Exception(final_error)
+
+
+# Одна попытка асинхронного пути: agenerate (байты) или astream (поток)
+AttemptCall = Callable[[ImageProvider], Awaitable[Any]]
+
+
+async def _off_loop(fn: Callable[..., Any], *args) -> Any:
+    """
+    Учёт попытки (допуск, исход) пишет в хранилище здоровья. У SQLite это транзакция под файловой
+    блокировкой, которая может ждать чужого воркера до IMAGE_HEALTH_DB_TIMEOUT — в event loop
+    такое ожидание стопорило бы все запросы, поэтому уводим его в поток
+    """
+    if provider_health.blocking:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+
+async def _start_attempt_async(cls: Type[ImageProvider], label: str, deadline: Optional[float],
+                               errors: List[str]) -> Optional[ImageProvider]:
+    if not provider_health.blocking:
+        return _start_attempt(cls, label, deadline, errors)
+    starting = asyncio.ensure_future(asyncio.to_thread(_start_attempt, cls, label, deadline, errors))
+    try:
+        return await asyncio.shield(starting)
+    except asyncio.CancelledError:
+        # Поток всё равно допустит попытку — место освобождаем, когда он закончит
+        def release(f: asyncio.Future) -> None:
+            if not f.cancelled() and f.exception() is None and f.result() is not None:
+                _cancel_in_background(cls, f.result())
+
+        starting.add_done_callback(release)
+        raise
+
+
+def _cancel_in_background(cls: Type[ImageProvider], provider: ImageProvider) -> None:
+    """_cancel_attempt из отменённой корутины: ждать поток она уже не может"""
+    if provider_health.blocking:
+        asyncio.get_running_loop().run_in_executor(None, _cancel_attempt, cls, provider)
+    else:
+        _cancel_attempt(cls, provider)
+
+
+async def _run_serial_async(active: List[Type[ImageProvider]], call: AttemptCall,
+                            errors: List[str], deadline: Optional[float] = None) -> Optional[Any]:
+    for i, cls in enumerate(active, 1):
+        provider = await _start_attempt_async(cls, f"Step {i}/{len(active)}", deadline, errors)
+        if provider is None:
+            continue
+
+        started = time.monotonic()
+        try:
+            # Провайдер сам укладывает шаги в бюджет; within — страховка от зависшего шага
+            result = await within(call(provider), deadline)
+        except asyncio.CancelledError:
+            _cancel_in_background(cls, provider)
+            raise
+        except Exception as e:
+            await _off_loop(_handle_failure, cls, provider, e, errors, started, deadline)
+            continue
+
+        await _off_loop(_handle_success, cls, provider, started)
+        return result
+
+    return None
+
+
+async def _run_hedged_async(active: List[Type[ImageProvider]], call: AttemptCall,
+                            hedge_delay: float, errors: List[str],
+                            deadline: Optional[float] = None) -> Optional[Any]:
+    """
+    Асинхронный hedged-режим. В отличие от потокового варианта,
+    проигравшие задачи реально отменяются (кроме тех, что сами сидят в потоке).
+    """
+    queue = list(active)
+    pending: Dict[asyncio.Task, tuple] = {}
+
+    async def launch() -> None:
+        while queue:
+            cls = queue.pop(0)
+            step = len(active) - len(queue)
+            provider = await _start_attempt_async(cls, f"Hedge {step}/{len(active)}", deadline, errors)
+            if provider is None:
+                continue
+            task = asyncio.create_task(call(provider))
+            pending[task] = (cls, provider, time.monotonic())
+            return
+
+    try:
+        await launch()
+        while hedge_delay == 0 and queue:
+            await launch()
+
+        while pending:
+            done, _ = await asyncio.wait(list(pending), timeout=_wait_timeout(hedge_delay, queue, deadline),
+                                         return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:
+                if deadline is not None and remaining(deadline) <= 0:
+                    logger.warning(f"⏰ [Orchestrator] Deadline reached, cancelling {len(pending)} attempt(s)")
+                    return None
+                await launch()
+                continue
+
+            for task in done:
+                cls, provider, started = pending.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    await _off_loop(_handle_failure, cls, provider, e, errors, started, deadline)
+                    await launch()
+                    continue
+
+                await _off_loop(_handle_success, cls, provider, started)
+                logger.info(f"🏁 [Orchestrator] Cancelling {len(pending)} other attempt(s)")
+                return result
+    finally:
+        # Отмена проигравших (и всех попыток, если отменили самого вызывающего)
+        for task, (cls, provider, _) in pending.items():
+            if task.done() and not task.cancelled() and task.exception() is None:
+                # Успел доделаться одновременно с победителем — закрываем его открытое скачивание
+                _discard(task.result())
+            task.cancel()
+            _cancel_in_background(cls, provider)
+
+    return None
+
+
+def generate_image_sync(
+        prompt: str,
+        negative_prompt: str,
+        width: int,
+        height: int,
+        hedge_delay: Optional[float] = None,
+        timeout: Optional[float] = None
+) -> bytes:
+    deadline = make_deadline(timeout)
+    active, hedge_delay = _prepare_request(prompt, negative_prompt, width, height, hedge_delay, deadline)
+    errors = []
+
+    with _measure_request("sync", errors):
+        if hedge_delay is None:
+            result = _run_serial(active, prompt, negative_prompt, width, height, errors, deadline)
+        else:
+            result = _run_hedged(active, prompt, negative_prompt, width, height, hedge_delay, errors, deadline)
+
+        if result is not None:
+            return result
+
+        _raise_all_dead(errors, deadline)
+
+
+async def generate_image_async(
+        prompt: str,
+        negative_prompt: str,
+        width: int,
+        height: int,
+        hedge_delay: Optional[float] = None,
+        timeout: Optional[float] = None
+) -> bytes:
+    """
+    Асинхронный путь оркестратора: провайдеры вызываются через agenerate,
+    поэтому ожидание REST-провайдеров стоит корутину, а не поток.
+    Одинаковые параллельные запросы схлопываются в одну генерацию.
+    timeout — бюджет всего запроса в секундах: провайдеры, которые не успеют, пропускаются,
+    а шаги каждой попытки укладываются в остаток.
+    """
+    if not COALESCE_ENABLED:
+        return await _generate_image_async(prompt, negative_prompt, width, height, hedge_delay, timeout)
+
+    # Бюджет общей генерации задаёт первый запрос, поэтому timeout входит в ключ;
+    # присоединившийся позже всё равно не ждёт дольше своего timeout
+    key = make_key(prompt, negative_prompt, width, height) + (f":{timeout}" if timeout is not None else "")
+    return await asyncio.wait_for(_inflight.do(
+        key, lambda: _generate_image_async(prompt, negative_prompt, width, height, hedge_delay, timeout)
+    ), timeout=timeout)
+
+
+async def _generate_image_async(prompt: str, negative_prompt: str, width: int, height: int,
+                                hedge_delay: Optional[float], timeout: Optional[float] = None) -> bytes:
+    deadline = make_deadline(timeout)
+    active, hedge_delay = _prepare_request(prompt, negative_prompt, width, height, hedge_delay, deadline)
+    errors = []
+
+    with _measure_request("async", errors):
+        result = await _run_async(active, lambda p: p.agenerate(prompt, negative_prompt, width, height, deadline),
+                                  hedge_delay, errors, deadline)
+        if result is not None:
+            return result
+
+        _raise_all_dead(errors, deadline)
+
+
+async def _run_async(active: List[Type[ImageProvider]], call: AttemptCall, hedge_delay: Optional[float],
+                     errors: List[str], deadline: Optional[float] = None) -> Optional[Any]:
+    if hedge_delay is None:
+        return await _run_serial_async(active, call, errors, deadline)
+    return await _run_hedged_async(active, call, hedge_delay, errors, deadline)
+
+
+def _discard(result: Any) -> None:
+    if isinstance(result, ImageStream):
+        asyncio.ensure_future(result.aclose())
+
+
+async def generate_image_stream(
+        prompt: str,
+        negative_prompt: str,
+        width: int,
+        height: int,
+        hedge_delay: Optional[float] = None,
+        timeout: Optional[float] = None
+) -> ImageStream:
+    """
+    Как generate_image_async, но картинка отдаётся потоком: попытка считается успешной,
+    когда провайдер начал отдавать файл, дальше байты идут клиенту по мере скачивания.
+    Одинаковые запросы не схлопываются — один поток нельзя отдать нескольким клиентам.
+    """
+    deadline = make_deadline(timeout)
+    active, hedge_delay = _prepare_request(prompt, negative_prompt, width, height, hedge_delay, deadline)
+    errors = []
+
+    with _measure_request("stream", errors):
+        result = await _run_async(active, lambda p: p.astream(prompt, negative_prompt, width, height, deadline),
+                                  hedge_delay, errors, deadline)
+        if result is not None:
+            return result
+
+        _raise_all_dead(errors, deadline)
+
+
+async def generate_image_preview(
+        prompt: str,
+        negative_prompt: str,
+        width: int,
+        height: int,
+        timeout: Optional[float] = None
+) -> Optional[bytes]:
+    """
+    Быстрое превью для прогрессивного режима: одна попытка быстрого провайдера (см. _preview_provider),
+    параллельно с основной генерацией. None — превью не вышло; основной запрос от этого не падает.
+    """
+    cls = _preview_provider(negative_prompt, width, height)
+    if cls is None:
+        logger.info("⏭️ [Orchestrator] Preview: no fast provider besides the main one, skipping")
+        PREVIEWS.inc(outcome="skipped")
+        return None
+
+    deadline = make_deadline(min(timeout, PREVIEW_TIMEOUT) if timeout is not None else PREVIEW_TIMEOUT)
+    errors = []
+    result = await _run_serial_async(
+        [cls], lambda p: p.agenerate(prompt, negative_prompt, width, height, deadline), errors, deadline
+    )
+    if result is None:
+        logger.warning(f"⚠️ [Orchestrator] Preview by {cls.__name__} failed: {'; '.join(errors)}")
+    PREVIEWS.inc(outcome="ok" if result is not None else "failed")
+    return result
@@ -1,12 +1,20 @@
 import os
 import random
 import logging
-import requests
+from typing import Optional
 from .base import ImageProvider
+from .http_client import get_async_client, get_session
+from .progress import report
+from .deadline import budget
+from .stream import ImageStream, check_size
+from .capabilities import Capabilities
 
 logger = logging.getLogger(__name__)
 
 class PixazoProvider(ImageProvider):
+    expected_latency = 10.0
+    capabilities = Capabilities(negative_prompt=False)
+
     def __init__(self):
         self.api_key = os.getenv('API_KEY_PIXAZO')
         self.url = os.getenv('URL_PIXAZO', "https://gateway.pixazo.ai/flux-1-schnell/v1/getData")
@@ -15,15 +23,15 @@ class PixazoProvider(ImageProvider):
     def name(self):
         return "Pixazo (Flux Schnell)"
 
-    def generate(self, prompt: str, negative_prompt: str, width: int, height: int) -> bytes:
-        logger.info(f"🎯 [Pixazo] Starting generation. Prompt: '{prompt[:50]}...', Size: {width}x{height}")
-        logger.debug(f"🔑 [Pixazo] API key present: {bool(self.api_key)}, URL: {self.url}")
-
+    def _build_request(self, prompt: str, width: int, height: int) -> tuple[dict, dict]:
+        """Заголовки и тело запроса на генерацию"""
         headers = {
             "Content-Type": "application/json",
             "Cache-Control": "no-cache",
             "Ocp-Apim-Subscription-Key": self.api_key
         }
+        # requests молча выкидывает заголовки со значением None, httpx — падает
+        headers = {k: v for k, v in headers.items() if v is not None}
 
         seed = random.randint(1, 9999999)
         data = {
@@ -34,10 +42,10 @@ class PixazoProvider(ImageProvider):
             "width": width
         }
         logger.debug(f"📤 [Pixazo] Request data: seed={seed}, steps=4")
+        return headers, data
 
-        # 1. Запрос ссылки
-        logger.info(f"⏳ [Pixazo] Sending API request (Timeout: 60s)...")
-        response = requests.post(self.url, json=data, headers=headers, timeout=60)
+    def _parse_image_url(self, response) -> str:
+        """Достать ссылку на картинку из ответа API (requests или httpx)"""
         logger.info(f"📥 [Pixazo] API response status: {response.status_code}")
         if response.status_code != 200:
             logger.error(f"❌ [Pixazo] API Error {response.status_code}: {response.text}")
@@ -50,13 +58,56 @@ class PixazoProvider(ImageProvider):
         if not image_url:
             logger.error(f"❌ [Pixazo] No 'output' in response: {json_data}")
             raise ValueError(f"Нет ссылки в ответе: {json_data}")
+        report("downloading", provider=self.name)
+        return image_url
 
-        # 2. Скачивание
-        logger.info(f"⬇️ [Pixazo] Downloading image from URL...")
-        img_response = requests.get(image_url)
+    def _check_download(self, img_response) -> bytes:
         if img_response.status_code == 200:
+            check_size(len(img_response.content), self.name)
             logger.info(f"✅ [Pixazo] Image downloaded OK. Size: {len(img_response.content)} bytes")
             return img_response.content
         else:
             logger.error(f"❌ [Pixazo] Download failed. Status: {img_response.status_code}")
-            raise Exception("Ошибка скачивания файла Pixazo")
\ No newline at end of file
+            raise Exception("Ошибка скачивания файла Pixazo")
+
+    def generate(self, prompt: str, negative_prompt: str, width: int, height: int,
+                 deadline: Optional[float] = None) -> bytes:
+        logger.info(f"🎯 [Pixazo] Starting generation. Prompt: '{prompt[:50]}...', Size: {width}x{height}")
+        logger.debug(f"🔑 [Pixazo] API key present: {bool(self.api_key)}, URL: {self.url}")
+
+        headers, data = self._build_request(prompt, width, height)
+
+        # 1. Запрос ссылки
+        logger.info(f"⏳ [Pixazo] Sending API request (Timeout: 60s)...")
+        with self._phase("submit"):
+            response = get_session(self.url).post(self.url, json=data, headers=headers, timeout=budget(deadline, 60))
+        image_url = self._parse_image_url(response)
+
+        # 2. Скачивание
+        logger.info(f"⬇️ [Pixazo] Downloading image from URL...")
+        with self._phase("download"):
+            return self._check_download(get_session(image_url).get(image_url, timeout=budget(deadline, 60)))
+
+    async def _aimage_url(self, prompt: str, width: int, height: int, deadline: Optional[float]) -> str:
+        logger.info(f"🎯 [Pixazo] Starting async generation. Prompt: '{prompt[:50]}...', Size: {width}x{height}")
+        headers, data = self._build_request(prompt, width, height)
+
+        # 1. Запрос ссылки
+        logger.info(f"⏳ [Pixazo] Sending API request (Timeout: 60s)...")
+        with self._phase("submit"):
+            response = await get_async_client().post(self.url, json=data, headers=headers, timeout=budget(deadline, 60))
+        return self._parse_image_url(response)
+
+    async def agenerate(self, prompt: str, negative_prompt: str, width: int, height: int,
+                        deadline: Optional[float] = None) -> bytes:
+        image_url = await self._aimage_url(prompt, width, height, deadline)
+
+        # 2. Скачивание
+        logger.info(f"⬇️ [Pixazo] Downloading image from URL...")
+        with self._phase("download"):
+            return self._check_download(await get_async_client().get(image_url, timeout=budget(deadline, 60)))
+
+    async def astream(self, prompt: str, negative_prompt: str, width: int, height: int,
+                      deadline: Optional[float] = None) -> ImageStream:
+        image_url = await self._aimage_url(prompt, width, height, deadline)
+        return await ImageStream.open(get_async_client(), image_url, self.name, timeout=budget(deadline, 60))
@@ -1,13 +1,19 @@
 import os
 import logging
+from typing import Optional
 
-from gradio_client import Client
-from .base import ImageProvider
+from .base import FileImageProvider
+from .gradio_pool import gradio_pool
+from .progress import report
+from .deadline import budget, DeadlineExceeded
 
 # Инициализируем логгер для этого файла
 logger = logging.getLogger(__name__)
 
-class PlaygroundProvider(ImageProvider):
+class PlaygroundProvider(FileImageProvider):
+    expected_latency = 20.0
+    max_concurrency = 2  # бесплатный Space: лишние параллельные задачи только удлиняют его очередь
+
     def __init__(self):
         self.token = os.getenv("HF_TOKEN")
         self.url = os.getenv("HF_URL") or "https://playgroundai-playground-v2-5.hf.space/"
@@ -16,13 +22,14 @@ class PlaygroundProvider(ImageProvider):
     def name(self):
         return "Hugging Face (Playground v2.5)"
 
-    def generate(self, prompt: str, negative_prompt: str, width: int, height: int) -> bytes:
+    def warm(self) -> None:
+        gradio_pool.warm(self.url, self.token)
+
+    def generate_file(self, prompt: str, negative_prompt: str, width: int, height: int,
+                      deadline: Optional[float] = None) -> str:
         logger.info(f"🎯 [Playground] Starting generation. Prompt: '{prompt[:50]}...', Size: {width}x{height}")
-        headers = {"Authorization": f"Bearer {self.token}"} if self.token else None
         logger.debug(f"🔑 [Playground] Token present: {bool(self.token)}, URL: {self.url}")
-        client = Client(self.url, headers=headers)
-
-        try:
+        with gradio_pool.lease(self.url, self.token) as client:
             logger.info(f"⏳ [Playground] Submitting job (Timeout: 45s)...")
 
             job = client.submit(
@@ -30,10 +37,15 @@ class PlaygroundProvider(ImageProvider):
                 api_name="/run"
             )
             logger.debug(f"📤 [Playground] Job submitted, waiting for result...")
+            report("submitted", provider=self.name)
 
             try:
-                result = job.result(timeout=45)
+                with self._phase("queue"):
+                    result = job.result(timeout=budget(deadline, 45))
                 logger.info(f"✅ [Playground] Job result received. Type: {type(result).__name__}, Value: {result}")
+            except DeadlineExceeded:
+                # Бюджет запроса кончился — это не медленный Space, пусть оркестратор учтёт как deadline
+                raise
             except Exception as e:
                 logger.warning(f"⚠️ [Playground] Timeout or Error: {e}")
                 raise TimeoutError(f"Too slow! Queue is long. ({str(e)})")
@@ -57,19 +69,8 @@ class PlaygroundProvider(ImageProvider):
             logger.debug(f"📂 [Playground] Resolved image_path: {image_path}")
 
             if image_path and os.path.exists(image_path):
-                logger.info(f"📖 [Playground] Reading file: {image_path}")
-                with open(image_path, "rb") as img_file:
-                    image_bytes = img_file.read()
-                logger.info(f"✅ [Playground] File read OK. Size: {len(image_bytes)} bytes")
-                try:
-                    os.remove(image_path)
-                    logger.debug(f"🗑️ [Playground] Temp file deleted: {image_path}")
-                except:
-                    pass
-                return image_bytes
+                logger.info(f"✅ [Playground] File ready: {image_path} ({os.path.getsize(image_path)} bytes)")
+                return image_path
 
             logger.error(f"❌ [Playground] Image path not found or doesn't exist. Path: {image_path}")
             raise ValueError(f"HF не вернул файл. Ответ: {result}")
-        finally:
-            client.close()
-            logger.debug(f"🔌 [Playground] Client closed")
\ No newline at end of file
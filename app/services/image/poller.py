@@ -0,0 +1,210 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Optional, Set
+
+import httpx
+
+from .http_client import create_async_client
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Первый опрос — на этой доле типичного времени генерации, дальше интервал растёт
+# в _BACKOFF раз до max_interval, каждый сдвигается случайно на ±_JITTER
+_FIRST_FRACTION = float(os.getenv("IMAGE_POLL_FIRST_FRACTION", "0.5"))
+_BACKOFF = float(os.getenv("IMAGE_POLL_BACKOFF", "1.5"))
+_JITTER = float(os.getenv("IMAGE_POLL_JITTER", "0.2"))
+
+# poll(client) -> URL готовой картинки или None, если ещё не готово
+PollFn = Callable[[httpx.AsyncClient], Awaitable[Optional[str]]]
+
+
+class _PollJob:
+    def __init__(self, name: str, poll: PollFn, future: Future, timeout: float,
+                 first_delay: float, min_interval: float, max_interval: float,
+                 parse_callback: Optional[Callable[[dict], Optional[str]]]):
+        now = time.monotonic()
+        self.name = name
+        self.poll = poll
+        self.future = future
+        self.timeout = timeout
+        self.deadline = now + timeout
+        self.due = now + first_delay
+        self.interval = min_interval
+        self.max_interval = max_interval
+        self.parse_callback = parse_callback
+        self.polling = False
+
+
+class PollScheduler:
+    """
+    Один поток с event loop опрашивает все задачи Leonardo / kie.ai, ждущие результата.
+
+    Вместо отдельного цикла sleep+poll на каждую генерацию — общий список задач:
+    каждая опрашивается по своему расписанию (первый опрос ближе к типичному времени
+    провайдера, дальше экспоненциальный backoff с джиттером), результат кладётся
+    в concurrent.futures.Future — его одинаково ждут и поток, и корутина.
+    Вебхук (callbacks.py) завершает задачу досрочно.
+    """
+
+    def __init__(self):
+        self._jobs: Set[_PollJob] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+        # Идущие опросы: event loop держит на задачи только слабые ссылки
+        self._tasks: Set[asyncio.Task] = set()
+        self._stats = {"jobs": 0, "polls": 0, "callbacks": 0, "timeouts": 0, "transient_errors": 0}
+
+    # --- Публичное API ---
+
+    def submit(self, name: str, poll: PollFn, timeout: float, typical: float, min_interval: float,
+               max_interval: Optional[float] = None, waiter: Optional[Future] = None,
+               parse_callback: Optional[Callable[[dict], Optional[str]]] = None) -> Future:
+        """
+        Поставить задачу на опрос. typical — типичное время генерации у провайдера,
+        waiter — Future вебхука (если включён), parse_callback достаёт из него URL.
+        """
+        future: Future = Future()
+        max_interval = max(min_interval, max_interval or typical / 4)
+        first_delay = min(max(min_interval, typical * _FIRST_FRACTION), timeout)
+        job = _PollJob(name, poll, future, timeout, first_delay, min_interval, max_interval, parse_callback)
+
+        loop = self._ensure_started()
+        loop.call_soon_threadsafe(self._add, job)
+        if waiter is not None:
+            waiter.add_done_callback(lambda f: loop.call_soon_threadsafe(self._on_callback, job, f))
+        return future
+
+    def stats(self) -> dict:
+        return {**self._stats, "pending": len(self._jobs)}
+
+    # --- Поток планировщика ---
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                ready = threading.Event()
+                threading.Thread(target=self._thread_main, args=(ready,), daemon=True,
+                                 name="image-poller").start()
+                ready.wait()
+        return self._loop
+
+    def _thread_main(self, ready: threading.Event) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._wakeup = asyncio.Event()
+        self._loop = loop
+        ready.set()
+        logger.info("⏱️ [Poller] Poll scheduler started")
+        loop.run_until_complete(self._run())
+
+    async def _run(self) -> None:
+        # Свой клиент: общий get_async_client привязан к event loop приложения
+        self._client = create_async_client()
+        while True:
+            now = time.monotonic()
+            for job in list(self._jobs):
+                if job.future.done():
+                    self._jobs.discard(job)
+                elif not job.polling and job.due <= now:
+                    job.polling = True
+                    task = asyncio.create_task(self._poll(job))
+                    self._tasks.add(task)
+                    task.add_done_callback(lambda t, j=job: self._poll_done(t, j))
+
+            waiting = [job.due for job in self._jobs if not job.polling]
+            timeout = max(min(waiting) - now, 0) if waiting else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _add(self, job: _PollJob) -> None:
+        self._jobs.add(job)
+        self._stats["jobs"] += 1
+        self._wakeup.set()
+
+    async def _poll(self, job: _PollJob) -> None:
+        try:
+            if job.future.done():
+                return
+            try:
+                self._stats["polls"] += 1
+                url = await job.poll(self._client)
+            except httpx.TransportError as e:
+                # Сеть / таймаут запроса — временная ошибка, опросим ещё раз
+                self._stats["transient_errors"] += 1
+                logger.warning(f"⚠️ [{job.name}] Polling transient error: {e}")
+                url = None
+            except Exception as e:
+                self._finish(job, error=e)
+                return
+
+            if url:
+                self._finish(job, result=url)
+                return
+
+            now = time.monotonic()
+            if now >= job.deadline:
+                self._stats["timeouts"] += 1
+                self._finish(job, error=TimeoutError(f"[{job.name}] Polling timed out after {job.timeout:.0f}s"))
+                return
+
+            delay = job.interval * random.uniform(1 - _JITTER, 1 + _JITTER)
+            job.interval = min(job.interval * _BACKOFF, job.max_interval)
+            # Последний опрос — ровно на дедлайне
+            job.due = min(now + delay, job.deadline)
+        finally:
+            job.polling = False
+            self._wakeup.set()
+
+    def _poll_done(self, task: asyncio.Task, job: _PollJob) -> None:
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            # _poll сам разбирает ошибки опроса — сюда доходит только поломка планировщика
+            logger.error(f"❌ [{job.name}] Poll task crashed: {error!r}")
+            self._finish(job, error=error)
+
+    def _on_callback(self, job: _PollJob, waiter: Future) -> None:
+        if job.future.done() or waiter.cancelled() or job.parse_callback is None:
+            return
+        self._stats["callbacks"] += 1
+        try:
+            url = job.parse_callback(waiter.result())
+        except Exception as e:
+            self._finish(job, error=e)
+            return
+        if url:
+            self._finish(job, result=url)
+        # Вебхук без ссылки — продолжаем опрашивать по расписанию
+
+    def _finish(self, job: _PollJob, result: Any = None, error: Optional[BaseException] = None) -> None:
+        self._jobs.discard(job)
+        if job.future.done():
+            return
+        try:
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+        except Exception:
+            # Ожидающий успел отменить Future (проигравший hedge)
+            pass
+
+
+# Общий планировщик на процесс
+poll_scheduler = PollScheduler()
+
+metrics.gauge("image_poll_pending", "Provider tasks waiting for their result in the poll scheduler",
+              collect=lambda: poll_scheduler.stats()["pending"])
@@ -0,0 +1,29 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+# Подписчик на прогресс текущей генерации. ContextVar сам переезжает в asyncio-задачи
+# и в asyncio.to_thread, поэтому провайдеры могут сообщать фазы, ничего не зная о подписчике.
+_listener: ContextVar[Optional[Callable[[dict], None]]] = ContextVar("image_progress", default=None)
+
+
+def report(phase: str, **data) -> None:
+    """Сообщить фазу генерации (попытка провайдера, submit, поллинг, скачивание...)"""
+    callback = _listener.get()
+    if callback is None:
+        return
+    try:
+        callback({"phase": phase, **data})
+    except Exception:
+        # Прогресс — вспомогательная штука, генерацию из-за него не роняем
+        pass
+
+
+@contextmanager
+def listen(callback: Callable[[dict], None]):
+    """Подписаться на события прогресса внутри блока"""
+    token = _listener.set(callback)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
@@ -1,12 +1,21 @@
 import os
 import logging
-from gradio_client import Client
-from .base import ImageProvider
+from typing import Optional
+from .base import FileImageProvider
+from .gradio_pool import gradio_pool
+from .progress import report
+from .deadline import budget, DeadlineExceeded
+from .capabilities import Capabilities, ratios
 
 # Инициализируем логгер для этого файла
 logger = logging.getLogger(__name__)
 
-class QwenProvider(ImageProvider):
+class QwenProvider(FileImageProvider):
+    expected_latency = 50.0
+    max_concurrency = 2
+    # Space принимает только соотношение сторон, negative prompt не поддерживает
+    capabilities = Capabilities(ratios=ratios("1:1", "16:9", "9:16", "4:3", "3:4", "3:2", "2:3"), negative_prompt=False)
+
     def __init__(self):
         self.space_id = "https://qwen-qwen-image-2512.hf.space"
         self.token = os.getenv("HF_TOKEN")
@@ -18,47 +27,37 @@ class QwenProvider(ImageProvider):
     def _get_aspect_ratio(self, width: int, height: int) -> str:
         """
         Превращает размеры в пикселях в строку соотношения сторон,
-        которую требует Qwen API.
+        которую требует Qwen API (ближайшее из capabilities; 1024x680 -> '3:2').
         """
-        ratio = width / height
-
-        # Список доступных опций из твоего лога
-        # '1:1', '16:9', '9:16', '4:3', '3:4', '3:2', '2:3'
-
-        if 0.9 <= ratio <= 1.1:
-            return '1:1'
+        return self.capabilities.nearest_ratio(width, height)
 
-        elif ratio > 1:  # Горизонтальные
-            if ratio >= 1.6: return '16:9'  # Широкий экран
-            if ratio >= 1.4: return '3:2'  # Фото (твой стандарт 1024/680 как раз тут)
-            return '4:3'  # Старый монитор
+    def warm(self) -> None:
+        gradio_pool.warm(self.space_id, self.token)
 
-        else:  # Вертикальные
-            if ratio <= 0.6: return '9:16'  # Сторис
-            if ratio <= 0.7: return '2:3'  # Портрет
-            return '3:4'
-
-    def generate(self, prompt: str, negative_prompt: str, width: int, height: int) -> bytes:
+    def generate_file(self, prompt: str, negative_prompt: str, width: int, height: int,
+                      deadline: Optional[float] = None) -> str:
         logger.info(f"🎯 [Qwen] Starting generation. Prompt: '{prompt[:50]}...', Size: {width}x{height}")
-        headers = {"Authorization": f"Bearer {self.token}"} if self.token else None
         logger.debug(f"🔑 [Qwen] Token present: {bool(self.token)}, Space: {self.space_id}")
 
         ar_string = self._get_aspect_ratio(width, height)
         logger.info(f"📐 [Qwen] Size {width}x{height} -> Aspect Ratio '{ar_string}'")
 
-        client = Client(self.space_id, headers=headers)
-
-        try:
+        with gradio_pool.lease(self.space_id, self.token) as client:
             logger.info(f"⏳ [Qwen] Submitting job (Timeout: 60s)...")
             job = client.submit(
                 prompt, 0, True, ar_string, 4.0, 50, True,
                 api_name="/infer"
             )
             logger.debug(f"📤 [Qwen] Job submitted, waiting for result...")
+            report("submitted", provider=self.name)
 
             try:
-                result = job.result(timeout=60)
+                with self._phase("queue"):
+                    result = job.result(timeout=budget(deadline, 60))
                 logger.info(f"✅ [Qwen] Job result received. Type: {type(result).__name__}, Value: {result}")
+            except DeadlineExceeded:
+                # Бюджет запроса кончился — это не медленный Space, пусть оркестратор учтёт как deadline
+                raise
             except Exception as e:
                 logger.warning(f"⚠️ [Qwen] Timeout: {e}")
                 raise TimeoutError("Qwen Queue timeout (60s limit)")
@@ -84,19 +83,8 @@ class QwenProvider(ImageProvider):
             logger.debug(f"📂 [Qwen] Resolved image_path: {image_path}")
 
             if image_path and os.path.exists(image_path):
-                logger.info(f"📖 [Qwen] Reading file: {image_path}")
-                with open(image_path, "rb") as img_file:
-                    image_bytes = img_file.read()
-                logger.info(f"✅ [Qwen] File read OK. Size: {len(image_bytes)} bytes")
-                try:
-                    os.remove(image_path)
-                    logger.debug(f"🗑️ [Qwen] Temp file deleted: {image_path}")
-                except:
-                    pass
-                return image_bytes
+                logger.info(f"✅ [Qwen] File ready: {image_path} ({os.path.getsize(image_path)} bytes)")
+                return image_path
 
             logger.error(f"❌ [Qwen] Image path not found or doesn't exist. Path: {image_path}")
             raise ValueError(f"Qwen не вернул файл. Ответ: {result}")
-        finally:
-            client.close()
-            logger.debug(f"🔌 [Qwen] Client closed")
\ No newline at end of file
@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """Одна общая генерация и число корутин, которые её ждут"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Схлопывание одинаковых запросов: пока по ключу идёт работа, новые вызовы
+    не запускают свою, а ждут ту же задачу и получают тот же результат (или ту же ошибку).
+    Общая задача отменяется только когда ушли все ожидающие.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            logger.info(f"🔗 [SingleFlight] Joined in-flight request {key[:12]} ({call.waiters} already waiting)")
+
+        call.waiters += 1
+        try:
+            # shield: отмена одного ожидающего не должна убивать общую работу
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                logger.info(f"🛑 [SingleFlight] All waiters gone, cancelling {key[:12]}")
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -0,0 +1,136 @@
+import os
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Больше этого картинка быть не может — защита от бесконечного/битого ответа провайдера
+MAX_IMAGE_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(25 * 1024 * 1024)))
+
+
+# Размер куска при чтении файла для потоковой отдачи (когда sendfile не применим)
+_FILE_CHUNK = 256 * 1024
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+def check_size(size: int, source: str) -> None:
+    if size > MAX_IMAGE_BYTES:
+        raise ImageTooLarge(f"[{source}] Image is {size} bytes, limit is {MAX_IMAGE_BYTES}")
+
+
+def remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+        logger.debug(f"🗑️ [Stream] Temp file deleted: {path}")
+    except OSError:
+        pass
+
+
+class ImageStream:
+    """
+    Картинка, которая ещё скачивается: async-итератор чанков + метаданные.
+    Роутер отдаёт её клиенту через StreamingResponse по мере скачивания,
+    не собирая целиком в памяти. Итерировать можно один раз; после — aclose().
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], source: str, content_type: str = "image/png",
+                 size: Optional[int] = None, close: Optional[Callable[[], Awaitable[None]]] = None):
+        self._chunks = chunks
+        self._close = close
+        self.source = source
+        self.content_type = content_type
+        self.size = size
+        self.received = 0
+        # Картинка уже лежит локальным файлом (результат gradio-Space): роутер может отдать её
+        # через FileResponse (sendfile), а кэш — забрать переименованием. Файл принадлежит потоку
+        # и удаляется в aclose(), если его не забрали через detach()
+        self.path: Optional[str] = None
+
+    @classmethod
+    def from_bytes(cls, data: bytes, source: str, content_type: str = "image/png") -> "ImageStream":
+        async def one_chunk():
+            yield data
+        return cls(one_chunk(), source, content_type, size=len(data))
+
+    @classmethod
+    def from_file(cls, path: str, source: str) -> "ImageStream":
+        """Поток поверх скачанного файла. Блокирующий (stat, сигнатура) — вызывать в потоке"""
+        from .transform import sniff_type
+
+        size = os.path.getsize(path)
+        try:
+            check_size(size, source)
+            with open(path, "rb") as f:
+                content_type = sniff_type(f.read(16))
+        except BaseException:
+            remove_file(path)
+            raise
+
+        async def chunks():
+            with open(path, "rb") as f:
+                while chunk := await asyncio.to_thread(f.read, _FILE_CHUNK):
+                    yield chunk
+
+        stream = cls(chunks(), source, content_type, size=size)
+        stream.path = path
+        stream._close = stream._remove
+        return stream
+
+    def detach(self) -> str:
+        """Забрать файл себе (переименовать в кэш, отдать FileResponse): aclose() его больше не удалит"""
+        path, self.path = self.path, None
+        self._close = None
+        return path
+
+    async def _remove(self) -> None:
+        if self.path is not None:
+            path, self.path = self.path, None
+            await asyncio.to_thread(remove_file, path)
+
+    @classmethod
+    async def open(cls, client: httpx.AsyncClient, url: str, source: str, timeout: float = 60) -> "ImageStream":
+        """Начать скачивание: ждём только заголовки ответа, тело пойдёт чанками"""
+        response = await client.send(client.build_request("GET", url, timeout=timeout), stream=True)
+        if response.status_code != 200:
+            await response.aclose()
+            raise Exception(f"[{source}] Download failed: {response.status_code}")
+
+        size = response.headers.get("content-length")
+        size = int(size) if size and size.isdigit() else None
+        if size is not None:
+            try:
+                check_size(size, source)
+            except ImageTooLarge:
+                await response.aclose()
+                raise
+
+        content_type = response.headers.get("content-type", "").split(";")[0].strip()
+        if not content_type.startswith("image/"):
+            content_type = "image/png"
+
+        logger.info(f"⬇️ [{source}] Streaming image ({size if size is not None else '?'} bytes)")
+        return cls(response.aiter_bytes(), source, content_type, size=size, close=response.aclose)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in self._chunks:
+                self.received += len(chunk)
+                check_size(self.received, self.source)
+                yield chunk
+        finally:
+            await self.aclose()
+
+    async def read(self) -> bytes:
+        """Дочитать целиком (кэш, фоновые задачи)"""
+        return b"".join([chunk async for chunk in self])
+
+    async def aclose(self) -> None:
+        if self._close is not None:
+            close, self._close = self._close, None
+            await close()
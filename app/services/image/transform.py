@@ -0,0 +1,133 @@
+import io
+import os
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from .cache import image_cache
+from ..tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Перекодирование и ресайз — чистый CPU: в отдельных процессах, мимо event loop и GIL
+_WORKERS = int(os.getenv("IMAGE_TRANSCODE_WORKERS", str(min(2, os.cpu_count() or 1))))
+
+CONTENT_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp", "gif": "image/gif"}
+EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp", "image/gif": "gif"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def sniff_type(data: bytes) -> str:
+    """Настоящий формат картинки по сигнатуре (провайдеры отдают и JPEG, и WebP)"""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "image/png"
+
+
+def extension(content_type: str) -> str:
+    return EXTENSIONS.get(content_type, "png")
+
+
+@dataclass(frozen=True)
+class OutputSpec:
+    """Что клиент хочет получить: формат, качество и подгонку под запрошенный размер"""
+    format: Optional[str] = None    # png | jpeg | webp, None — как отдал провайдер
+    quality: int = 85               # для jpeg / webp
+    fit: str = "none"               # none | resize (растянуть) | crop (заполнить и обрезать по центру)
+    width: int = 0
+    height: int = 0
+
+    def is_noop(self, content_type: str) -> bool:
+        same_format = self.format is None or CONTENT_TYPES[self.format] == content_type
+        return same_format and self.fit == "none"
+
+    def variant_key(self, source_digest: str) -> str:
+        raw = f"{source_digest}|{self.format}|{self.quality}|{self.fit}|{self.width}x{self.height}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _transcode(data: bytes, fmt: str, quality: int, fit: str, width: int, height: int) -> bytes:
+    """Выполняется в дочернем процессе"""
+    from PIL import Image, ImageOps
+
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    if fit == "resize" and image.size != (width, height):
+        image = image.resize((width, height), Image.LANCZOS)
+    elif fit == "crop" and image.size != (width, height):
+        image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+
+    if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    out = io.BytesIO()
+    if fmt == "png":
+        image.save(out, "PNG", optimize=True)
+    elif fmt == "jpeg":
+        image.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(out, "WEBP", quality=quality, method=4)
+    return out.getvalue()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: fork процесса с потоками (пулы, планировщик опросов) небезопасен
+        _pool = ProcessPoolExecutor(max_workers=_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        logger.info(f"🖼️ [Transform] Process pool started ({_WORKERS} workers)")
+    return _pool
+
+
+async def transform(data: bytes, spec: OutputSpec) -> Tuple[bytes, str]:
+    """Привести картинку к spec. Возвращает (байты, content type)"""
+    content_type = sniff_type(data)
+    if spec.is_noop(content_type):
+        return data, content_type
+
+    fmt = spec.format or {v: k for k, v in CONTENT_TYPES.items()}.get(content_type, "png")
+    if fmt == "gif":
+        fmt = "png"
+    loop = asyncio.get_running_loop()
+    with span("transform", format=fmt, fit=spec.fit):
+        result = await loop.run_in_executor(
+            _get_pool(), _transcode, data, fmt, spec.quality, spec.fit, spec.width, spec.height
+        )
+    logger.info(f"🖼️ [Transform] {content_type} {len(data)}B -> {fmt} {len(result)}B (fit={spec.fit})")
+    return result, CONTENT_TYPES[fmt]
+
+
+async def cached_transform(data: bytes, spec: OutputSpec, use_cache: bool = True) -> Tuple[bytes, str]:
+    """
+    transform с кэшем вариантов: ключ — sha256 самих исходных байтов + параметры вывода.
+    Не ключ генерации: перегенерированная под тем же ключом картинка не получит чужой вариант.
+    """
+    if spec.is_noop(sniff_type(data)) or image_cache is None or not use_cache:
+        return await transform(data, spec)
+
+    key = spec.variant_key(hashlib.sha256(data).hexdigest())
+    cached = await image_cache.aget(key)
+    if cached is not None:
+        return cached, sniff_type(cached)
+
+    result, content_type = await transform(data, spec)
+    await image_cache.aput(key, result)
+    return result, content_type
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -1,12 +1,26 @@
 import os
 import logging
-from gradio_client import Client
-from .base import ImageProvider
+from typing import Optional
+from .base import FileImageProvider
+from .gradio_pool import gradio_pool
+from .progress import report
+from .deadline import budget, DeadlineExceeded
+from .capabilities import Capabilities
 
 # Инициализируем логгер для этого файла
 logger = logging.getLogger(__name__)
 
-class ZImageProvider(ImageProvider):
+class ZImageProvider(FileImageProvider):
+    expected_latency = 35.0
+    max_concurrency = 2
+    # Space принимает разрешение строкой из своего списка
+    _RESOLUTIONS = {
+        (1024, 1024): '1024x1024 ( 1:1 )',
+        (1248, 832): '1248x832 ( 3:2 )',
+        (832, 1248): '832x1248 ( 2:3 )',
+    }
+    capabilities = Capabilities(sizes=tuple(_RESOLUTIONS))
+
     def __init__(self):
         self.space_id = "Tongyi-MAI/Z-Image"
         self.token = os.getenv("HF_TOKEN")
@@ -16,23 +30,18 @@ class ZImageProvider(ImageProvider):
         return "Z-Image (Tongyi-MAI)"
 
     def _get_best_resolution(self, width: int, height: int) -> str:
-        ratio = width / height
-        if 0.95 < ratio < 1.05:
-            return '1024x1024 ( 1:1 )'
-        elif ratio > 1:
-            return '1248x832 ( 3:2 )'
-        else:
-            return '832x1248 ( 2:3 )'
-
-    def generate(self, prompt: str, negative_prompt: str, width: int, height: int) -> bytes:
+        return self._RESOLUTIONS[self.capabilities.nearest_size(width, height)]
+
+    def warm(self) -> None:
+        gradio_pool.warm(self.space_id, self.token)
+
+    def generate_file(self, prompt: str, negative_prompt: str, width: int, height: int,
+                      deadline: Optional[float] = None) -> str:
         resolution_str = self._get_best_resolution(width, height)
         logger.info(f"🎯 [Z-Image] Starting generation. Prompt: '{prompt[:50]}...', Resolution: {resolution_str}")
 
-        headers = {"Authorization": f"Bearer {self.token}"} if self.token else None
         logger.debug(f"🔑 [Z-Image] Token present: {bool(self.token)}, Space: {self.space_id}")
-        client = Client(self.space_id, headers=headers)
-
-        try:
+        with gradio_pool.lease(self.space_id, self.token) as client:
             logger.info(f"⏳ [Z-Image] Submitting job (Timeout: 45s)...")
 
             try:
@@ -50,11 +59,16 @@ class ZImageProvider(ImageProvider):
                     api_name="/generate"
                 )
                 logger.debug(f"📤 [Z-Image] Job submitted, waiting for result...")
+                report("submitted", provider=self.name)
 
                 # 2. Ждем 45 секунд
-                result = job.result(timeout=45)
+                with self._phase("queue"):
+                    result = job.result(timeout=budget(deadline, 45))
                 logger.info(f"✅ [Z-Image] Job result received. Type: {type(result).__name__}, Value: {result}")
 
+            except DeadlineExceeded:
+                # Бюджет запроса кончился — это не медленный Space, пусть оркестратор учтёт как deadline
+                raise
             except Exception as e:
                 logger.warning(f"⚠️ [Z-Image] Timeout or Error: {e}")
                 raise TimeoutError(f"Z-Image failed/timeout: {e}")
@@ -93,25 +107,10 @@ class ZImageProvider(ImageProvider):
 
             logger.debug(f"📂 [Z-Image] Resolved image_path: {image_path}")
 
-            # Читаем файл и потом чистим
             if image_path and os.path.exists(image_path):
-                logger.info(f"📖 [Z-Image] Reading file: {image_path}")
-                with open(image_path, "rb") as img_file:
-                    image_bytes = img_file.read()
-                logger.info(f"✅ [Z-Image] File read OK. Size: {len(image_bytes)} bytes")
-
-                # Удаляем временный файл ПОСЛЕ чтения
-                try:
-                    os.remove(image_path)
-                    logger.debug(f"🗑️ [Z-Image] Temp file deleted: {image_path}")
-                except Exception as cleanup_e:
-                    logger.warning(f"⚠️ [Z-Image] Failed to delete temp file {image_path}: {cleanup_e}")
-
-                return image_bytes
+                logger.info(f"✅ [Z-Image] File ready: {image_path} ({os.path.getsize(image_path)} bytes)")
+                return image_path
 
             # Если дошли сюда — значит файл не нашли
             logger.error(f"❌ [Z-Image] Image path not found or doesn't exist. Path: {image_path}")
             raise ValueError(f"Z-Image не вернул корректный путь. Сырой ответ: {result}")
-        finally:
-            client.close()
-            logger.debug(f"🔌 [Z-Image] Client closed")
\ No newline at end of file
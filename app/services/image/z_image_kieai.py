@@ -1,9 +1,10 @@
 from .kieai_base import KieAIProvider
+from .capabilities import Capabilities, ratios
 
 
 class ZImageKieAIProvider(KieAIProvider):
-    # Поддерживаемые aspect_ratio: 1:1, 4:3, 3:4, 16:9, 9:16
-    _RATIOS = {"1:1": 1/1, "4:3": 4/3, "3:4": 3/4, "16:9": 16/9, "9:16": 9/16}
+    # Поддерживаемые aspect_ratio; negative prompt модель не принимает
+    capabilities = Capabilities(ratios=ratios("1:1", "4:3", "3:4", "16:9", "9:16"), negative_prompt=False)
 
     @property
     def name(self) -> str:
@@ -14,6 +15,4 @@ class ZImageKieAIProvider(KieAIProvider):
         return "z-image"
 
     def _build_input(self, prompt: str, negative_prompt: str, width: int, height: int) -> dict:
-        ratio = width / height if height else 1
-        aspect_ratio = min(self._RATIOS, key=lambda k: abs(self._RATIOS[k] - ratio))
-        return {"prompt": prompt, "aspect_ratio": aspect_ratio}
+        return {"prompt": prompt, "aspect_ratio": self.capabilities.nearest_ratio(width, height)}
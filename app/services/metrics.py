@@ -0,0 +1,242 @@
+import math
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Метрики в формате Prometheus без внешних зависимостей: счётчики в памяти процесса,
+# текст собирается только при запросе /metrics. При нескольких uvicorn-воркерах
+# у каждого свои значения — Prometheus складывает их сам (по instance/pid).
+
+# Границы корзин по умолчанию (секунды): от быстрых HTTP-шагов до долгих очередей Space
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name}: expected labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}"
+                                for key, v in items]
+
+
+class Gauge(_Metric):
+    """Текущее значение. Либо inc/dec/set из кода, либо функция, которую зовут при сборе"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 collect: Optional[Callable[[], Union[float, Dict[LabelValues, float]]]] = None):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._collect = collect
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels: str) -> Iterator[None]:
+        """Сколько сейчас внутри блока"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def render(self) -> List[str]:
+        if self._collect is not None:
+            try:
+                collected = self._collect()
+            except Exception as e:
+                logger.warning(f"⚠️ [Metrics] Collecting {self.name} failed: {e}")
+                return []
+            items = collected.items() if isinstance(collected, dict) else [((), collected)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}"
+                                for key, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Счётчики по корзинам хранятся не накопленными: observe трогает одну ячейку
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        lines = self.header()
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Повторный импорт модуля (reload) — отдаём уже накопленную метрику
+                if type(existing) is not type(metric):
+                    raise ValueError(f"Metric {metric.name} already registered as {existing.kind}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = (),
+              collect: Optional[Callable[[], Union[float, Dict[LabelValues, float]]]] = None) -> Gauge:
+        return self._register(Gauge(name, documentation, labels, collect))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Общий реестр на процесс
+metrics = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# Пулы потоков, загрузку которых видно в /metrics: имя -> функция, возвращающая пул (он может быть ещё не создан)
+_executors: Dict[str, Callable[[], Optional[ThreadPoolExecutor]]] = {}
+
+
+def track_executor(name: str, get_executor: Callable[[], Optional[ThreadPoolExecutor]]) -> None:
+    _executors[name] = get_executor
+
+
+def _executor_load(executor: ThreadPoolExecutor) -> Dict[str, int]:
+    # Внутренности ThreadPoolExecutor: публичного API для загрузки пула нет
+    threads = len(getattr(executor, "_threads", ()))
+    idle = getattr(getattr(executor, "_idle_semaphore", None), "_value", 0)
+    queue = getattr(executor, "_work_queue", None)
+    return {"threads": threads, "busy": max(threads - idle, 0), "queued": queue.qsize() if queue else 0}
+
+
+def _collect_executors(field: str) -> Callable[[], Dict[LabelValues, float]]:
+    def collect() -> Dict[LabelValues, float]:
+        values: Dict[LabelValues, float] = {}
+        for name, get_executor in list(_executors.items()):
+            executor = get_executor()
+            if executor is not None:
+                values[(name,)] = _executor_load(executor)[field]
+        return values
+    return collect
+
+
+metrics.gauge("threadpool_threads", "Threads started in the pool", ["pool"], _collect_executors("threads"))
+metrics.gauge("threadpool_busy_threads", "Threads currently running a task", ["pool"], _collect_executors("busy"))
+metrics.gauge("threadpool_queued_tasks", "Tasks waiting for a free thread", ["pool"], _collect_executors("queued"))
@@ -6,19 +6,21 @@ import time
 import base64
 import uuid
 import asyncio
-import edge_tts
+import logging
 import requests
 import threading
-import speech_recognition as sr
+from typing import NamedTuple, Optional
 
-from pydub import AudioSegment
+import httpx
 from dotenv import load_dotenv
 
-from Crypto.PublicKey import RSA
-from Crypto.Cipher import PKCS1_OAEP, AES
-from Crypto.Signature import PKCS1_v1_5
-from Crypto.Hash import SHA
-from Crypto import Random
+from app.services.metrics import metrics
+from app.services.tracing import span
+
+# speech_recognition, pydub, edge_tts и pycryptodome импортируются внутри функций:
+# вместе это ~0.4 с на старте каждого воркера, а нужны они только на первом запросе к речи
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
@@ -56,19 +58,79 @@ key_data = {
     "auth_url": os.getenv("AUTH_URL"),  # должен быть полный: https://auth-asraas-prod.neuro.net/api/v1/auth
     "endpoint_tts": os.getenv("ENDPOINT_TTS")
 }
+# Как долго доверять публичному ключу сервера neuro.net до повторного запроса
+NEURO_KEY_TTL = float(os.getenv("NEURO_KEY_TTL", str(24 * 60 * 60)))
 
-# ==== Загружаем приватный ключ клиента ====
-raw_key = key_data["private_key"]
-private_key = "\n".join(line.strip() for line in raw_key.strip().splitlines())
-client_private_key = RSA.importKey(private_key)
-
-# ==== Получаем публичный ключ сервера ====
-resp = requests.get(key_data["public_key_url"])
-resp.raise_for_status()
-server_pub_b64 = resp.json()["public_key"]
-server_pub_der = base64.b64decode(server_pub_b64)
-server_public_key = RSA.importKey(server_pub_der)
-TMP_DIR = "/tmp"
+
+class NeuroKeys(NamedTuple):
+    client: object  # RSA-ключ клиента (из PRIVATE_KEY)
+    server: object  # публичный RSA-ключ сервера (с PUBLIC_KEY_URL)
+
+
+class NeuroAuthError(Exception):
+    pass
+
+
+class NeuroKeyStore:
+    """
+    Ключи для авторизации в neuro.net. Загружаются при первом синтезе (не при импорте):
+    сбой сети на PUBLIC_KEY_URL не мешает старту и не задевает STT и Edge TTS.
+    Ключ сервера кэшируется на NEURO_KEY_TTL; при неудачном обновлении остаётся старый.
+    """
+
+    def __init__(self, ttl: float = NEURO_KEY_TTL):
+        self.ttl = ttl
+        self._keys: Optional[NeuroKeys] = None
+        self._fetched_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _fresh(self) -> bool:
+        return self._keys is not None and time.monotonic() - self._fetched_at < self.ttl
+
+    async def get(self, refresh: bool = False) -> NeuroKeys:
+        if not refresh and self._fresh():
+            return self._keys
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Пока ждали блокировку, ключи мог обновить соседний запрос
+            if not refresh and self._fresh():
+                return self._keys
+            try:
+                self._keys = await self._load()
+                self._fetched_at = time.monotonic()
+            except Exception as e:
+                if self._keys is None:
+                    raise RuntimeError(f"Neuro keys are unavailable: {e}") from e
+                logger.warning(f"⚠️ [NeuroTTS] Server key refresh failed, keeping the old one: {e}")
+            return self._keys
+
+    async def _load(self) -> NeuroKeys:
+        from Crypto.PublicKey import RSA
+
+        raw_key = key_data["private_key"]
+        if not raw_key or not key_data["public_key_url"]:
+            raise RuntimeError("PRIVATE_KEY and PUBLIC_KEY_URL must be set for neuro TTS")
+        private_key = "\n".join(line.strip() for line in raw_key.strip().splitlines())
+        client_private_key = self._keys.client if self._keys else RSA.importKey(private_key)
+
+        async with httpx.AsyncClient(timeout=10) as client:
+            resp = await client.get(key_data["public_key_url"])
+            resp.raise_for_status()
+        server_pub_der = base64.b64decode(resp.json()["public_key"])
+        logger.info("🔑 [NeuroTTS] Server public key fetched")
+        return NeuroKeys(client_private_key, RSA.importKey(server_pub_der))
+
+
+neuro_keys = NeuroKeyStore()
+
+# ==== Метрики (/metrics) ====
+STT_SECONDS = metrics.histogram("speech_stt_seconds", "Speech-to-text request time", ["outcome"])
+STT_CHUNK_SECONDS = metrics.histogram(
+    "speech_stt_chunk_seconds", "Recognition time of one audio chunk", ["outcome"]
+)
+STT_AUDIO_SECONDS = metrics.counter("speech_stt_audio_seconds_total", "Seconds of audio transcribed")
+TTS_SECONDS = metrics.histogram("speech_tts_seconds", "Text-to-speech synthesis time", ["engine", "outcome"])
 
 
 async def speech_to_text(file_bytes: bytes, original_filename: str, lang: str = "ru-RU") -> str:
@@ -80,16 +142,21 @@ async def speech_to_text(file_bytes: bytes, original_filename: str, lang: str =
     request_id = uuid.uuid4()
     # Создаем путь для временного сохранения входящих байтов
     input_temp_path = f"{TMP_DIR}/input_{request_id}.{ext}"
+    started = time.monotonic()
+    outcome = "error"
 
     try:
         # Пишем байты в файл
-        with open(input_temp_path, "wb") as f:
+        with span("stt_save"), open(input_temp_path, "wb") as f:
             f.write(file_bytes)
 
         # Запускаем тяжелую логику в потоке, передавая ПУТЬ к файлу
-        return await asyncio.to_thread(transcribe_audio_with_chunks, input_temp_path, lang, request_id)
+        text = await asyncio.to_thread(transcribe_audio_with_chunks, input_temp_path, lang, request_id)
+        outcome = "ok"
+        return text
 
     finally:
+        STT_SECONDS.observe(time.monotonic() - started, outcome=outcome)
         # Гарантированно удаляем входной временный файл
         if os.path.exists(input_temp_path):
             os.remove(input_temp_path)
@@ -99,39 +166,55 @@ def transcribe_audio_with_chunks(file_path: str, lang: str, request_id: uuid.UUI
     """
     Внутренняя логика обработки файла (конвертация + нарезка + распознавание).
     """
+    import speech_recognition as sr
+    from pydub import AudioSegment
+
     ext = file_path.split(".")[-1].lower()
     format_pydub = SUPPORTED_FORMATS.get(ext, "wav")
     wav_path = f"{TMP_DIR}/convert_{request_id}.wav"
 
     try:
         # Конвертируем исходный файл в нужный формат WAV
-        audio = AudioSegment.from_file(file_path, format=format_pydub).set_channels(1).set_frame_rate(16000)
-        audio.export(wav_path, format="wav")
+        with span("stt_decode", format=format_pydub):
+            audio = AudioSegment.from_file(file_path, format=format_pydub).set_channels(1).set_frame_rate(16000)
+        with span("stt_export"):
+            audio.export(wav_path, format="wav")
 
         recognizer = sr.Recognizer()
         full_text = []
 
         # Загружаем сконвертированный WAV для нарезки
         audio_src = AudioSegment.from_wav(wav_path)
+        STT_AUDIO_SECONDS.inc(len(audio_src) / 1000)
 
         for i, start_ms in enumerate(range(0, len(audio_src), CHUNK_LENGTH_MS)):
             chunk = audio_src[start_ms:start_ms + CHUNK_LENGTH_MS]
             chunk_name = f"{TMP_DIR}/chunk_{request_id}_{i}.wav"
+            chunk_started = time.monotonic()
+            outcome = "recognized"
 
             try:
-                chunk.export(chunk_name, format="wav")
-                with sr.AudioFile(chunk_name) as source:
-                    audio_data = recognizer.record(source)
+                with span("stt_chunk_export", chunk=i):
+                    chunk.export(chunk_name, format="wav")
+                    with sr.AudioFile(chunk_name) as source:
+                        audio_data = recognizer.record(source)
 
                 # Распознавание через Google (игнорируем предупреждение атрибута)
-                text = recognizer.recognize_google(audio_data, language=lang)
+                with span("stt_recognize", chunk=i):
+                    text = recognizer.recognize_google(audio_data, language=lang)
                 full_text.append(text)
-            except (sr.UnknownValueError, Exception):
-                # Если фрагмент не распознан или ошибка — ставим метку
+            except sr.UnknownValueError:
+                # Если фрагмент не распознан — ставим метку
+                outcome = "unrecognized"
+                full_text.append("[...]")
+            except Exception:
+                # Ошибка сервиса распознавания — тоже метка, но считаем отдельно
+                outcome = "error"
                 full_text.append("[...]")
             finally:
                 if os.path.exists(chunk_name):
                     os.remove(chunk_name)
+                STT_CHUNK_SECONDS.observe(time.monotonic() - chunk_started, outcome=outcome)
 
         return " ".join(full_text).strip()
 
@@ -146,23 +229,47 @@ async def text_to_speech_edge(text: str, voice: str = "ru-RU-DmitryNeural") -> s
     Генерирует речь через Microsoft Edge TTS.
     Здесь цикл не нужен, API отвечает мгновенно.
     """
+    import edge_tts
+
+    started = time.monotonic()
     try:
         communicate = edge_tts.Communicate(text, voice)
-        output_path = f"temp_tts_{int(time.time())}.mp3"
-        await communicate.save(output_path)
+        output_path = f"temp_tts_{uuid.uuid4().hex}.mp3"
+        with span("tts_synthesize", provider="edge"):
+            await communicate.save(output_path)
+        TTS_SECONDS.observe(time.monotonic() - started, engine="edge", outcome="ok")
         return output_path
     except Exception as e:
+        TTS_SECONDS.observe(time.monotonic() - started, engine="edge", outcome="error")
         # Если Microsoft недоступен, пробрасываем ошибку сразу
         raise RuntimeError(f"EdgeTTS failed: {e}")
 
 
 # Neuro Временно отключено
 async def text_to_speech(text: str, voice_name: str = "Oleg:master"):
-    audio_bytes = await asyncio.to_thread(synthesize_speech, text, voice_name)
+    started = time.monotonic()
+    outcome = "error"
+    try:
+        keys = await neuro_keys.get()
+        try:
+            audio_bytes = await asyncio.to_thread(synthesize_speech, text, voice_name, keys)
+        except NeuroAuthError:
+            # Сервер мог сменить ключ — берём свежий и пробуем ещё раз
+            keys = await neuro_keys.get(refresh=True)
+            audio_bytes = await asyncio.to_thread(synthesize_speech, text, voice_name, keys)
+        outcome = "ok"
+    finally:
+        TTS_SECONDS.observe(time.monotonic() - started, engine="neuro", outcome=outcome)
     return audio_bytes
 
 # ==== Функция шифрования авторизационного запроса ====
-def encrypt_message(plaintext: bytes):
+def encrypt_message(plaintext: bytes, keys: NeuroKeys):
+    from Crypto.Cipher import PKCS1_OAEP, AES
+    from Crypto.Signature import PKCS1_v1_5
+    from Crypto.Hash import SHA
+    from Crypto import Random
+
+    client_private_key, server_public_key = keys
     # Хешируем сообщение
     text_hash = SHA.new(plaintext)
 
@@ -190,18 +297,18 @@ def encrypt_message(plaintext: bytes):
     return cipher_text, session_key_encrypted, client_signature_final
 
 # ==== Получаем JWT ====
-def get_jwt():
+def get_jwt(keys: NeuroKeys):
     auth_payload = {
         "organization_uuid": key_data["organization_uuid"],
         "company_uuid": key_data["company_uuid"],
         "user_uuid": key_data["user_uuid"],
         "key_name": key_data["key_name"],
         "key_uuid": key_data["key_uuid"],
-        "public_key": client_private_key.publickey().export_key().decode()
+        "public_key": keys.client.publickey().export_key().decode()
     }
 
     plaintext_bytes = json.dumps(auth_payload).encode("utf-8")
-    cipher_text, session_key_encrypted, client_signature_final = encrypt_message(plaintext_bytes)
+    cipher_text, session_key_encrypted, client_signature_final = encrypt_message(plaintext_bytes, keys)
 
     auth_request = {
         "key_uuid": key_data["key_uuid"],
@@ -212,7 +319,7 @@ def get_jwt():
 
     response = requests.post(key_data["auth_url"], json=auth_request)
     if response.status_code != 200:
-        raise Exception(f"AUTH FAILED: {response.status_code} {response.text}")
+        raise NeuroAuthError(f"AUTH FAILED: {response.status_code} {response.text}")
 
     return response.json()["access_token"]
 
@@ -227,9 +334,9 @@ def save_wav(filename, audio_bytes, samplerate=16000):
 # ==== Синтез речи ====
 #jwt_token = get_jwt()  # получаем токен один раз при старте
 #token_lock = threading.Lock() # Создаем замок
-def synthesize_speech(text: str, voice_name: str = "Oleg:master"):
+def synthesize_speech(text: str, voice_name: str, keys: NeuroKeys):
     #global jwt_token
-    jwt_token = get_jwt() # переместить в глобальный
+    jwt_token = get_jwt(keys) # переместить в глобальный
     token_lock = threading.Lock()  # Создаем замок, переместить в глобальный
     payload = {
         "text": f"<speak>{text}</speak>",
@@ -251,7 +358,7 @@ def synthesize_speech(text: str, voice_name: str = "Oleg:master"):
 
     if response.status_code == 401:
         with token_lock:
-            jwt_token = get_jwt()  # Обновляем глобально
+            jwt_token = get_jwt(keys)  # Обновляем глобально
             current_token = jwt_token
 
         headers["X-Token"] = current_token
@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import logging
+from typing import Optional
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сколько может занимать импорт приложения при старте воркера. Превышение — предупреждение в логе
+_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "1500"))
+
+# Тяжёлые библиотеки, которые должны грузиться лениво, при первом запросе к своему бэкенду
+LAZY_MODULES = ("speech_recognition", "pydub", "edge_tts", "Crypto", "gradio_client", "huggingface_hub", "PIL")
+
+_report: dict = {}
+
+
+def _rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def report_imports(started: float) -> dict:
+    """
+    Итог импорта приложения: время от started (time.perf_counter() в начале main.py),
+    RSS и какие из «ленивых» библиотек всё-таки загрузились при старте.
+    """
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    eager = [name for name in LAZY_MODULES if name in sys.modules]
+    _report.update({
+        "import_ms": round(elapsed_ms, 1),
+        "budget_ms": _BUDGET_MS,
+        "rss_mb": _rss_mb(),
+        "eager_heavy_modules": eager,
+    })
+
+    if elapsed_ms > _BUDGET_MS:
+        logger.warning(f"🐢 [Startup] Imports took {elapsed_ms:.0f} ms, budget {_BUDGET_MS:.0f} ms")
+    else:
+        logger.info(f"🚀 [Startup] Imports took {elapsed_ms:.0f} ms (budget {_BUDGET_MS:.0f} ms), "
+                    f"RSS {_report['rss_mb']} MB")
+    if eager:
+        logger.warning(f"🐢 [Startup] Heavy modules loaded at import time: {', '.join(eager)}")
+    return dict(_report)
+
+
+metrics.gauge("app_import_seconds", "Time spent importing the application at worker start",
+              collect=lambda: _report.get("import_ms", 0) / 1000)
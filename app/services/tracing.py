@@ -0,0 +1,202 @@
+import os
+import re
+import time
+import uuid
+import itertools
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Фазы запроса (очередь Space, поллинг, скачивание, распознавание кусков аудио...) с длительностями.
+# Итог уходит в заголовок Server-Timing, в отладочном режиме — ещё и JSON по /debug/traces/{id}.
+# Server-Timing раскрывает провайдеров и их тайминги любому клиенту — по умолчанию выключен
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING", "0") == "1"
+TRACE_DEBUG = os.getenv("TRACE_DEBUG", "0") == "1"
+_TRACE_KEEP = int(os.getenv("TRACE_DEBUG_KEEP", "200"))  # сколько последних трасс хранить
+_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))  # спанов на трассу, лишние только считаются
+
+_NOOP = nullcontext()
+_TOKEN_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class Span:
+    __slots__ = ("name", "provider", "attempt", "start", "duration", "attrs")
+
+    def __init__(self, name: str, provider: Optional[str], attempt: Optional[int],
+                 start: float, duration: float, attrs: dict):
+        self.name = name
+        self.provider = provider
+        self.attempt = attempt
+        self.start = start
+        self.duration = duration
+        self.attrs = attrs
+
+    def as_dict(self, origin: float) -> dict:
+        data = {"name": self.name, "start_ms": round((self.start - origin) * 1000, 1),
+                "duration_ms": round(self.duration * 1000, 1)}
+        if self.provider is not None:
+            data["provider"] = self.provider
+        if self.attempt is not None:
+            data["attempt"] = self.attempt
+        return {**data, **self.attrs}
+
+
+class Trace:
+    """
+    Спаны одного запроса. Пишется и из event loop, и из потоков (asyncio.to_thread,
+    hedge-пул) — list.append атомарен, отдельная блокировка не нужна.
+    """
+
+    def __init__(self, method: str = "", path: str = ""):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.started = time.monotonic()
+        self.started_at = time.time()
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self.status: Optional[int] = None
+        self.duration: Optional[float] = None
+        self._attempts = itertools.count(1)
+
+    def next_attempt(self) -> int:
+        return next(self._attempts)
+
+    def add(self, name: str, start: float, duration: float, provider: Optional[str] = None,
+            attempt: Optional[int] = None, **attrs) -> None:
+        if len(self.spans) >= _MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append(Span(name, provider, attempt, start, duration, attrs))
+
+    def server_timing(self) -> str:
+        """Спаны, сгруппированные по (провайдер, фаза): суммарная длительность и число повторов"""
+        totals: Dict[str, list] = {}
+        for span in list(self.spans):
+            key = _TOKEN_UNSAFE.sub("_", f"{span.provider}.{span.name}" if span.provider else span.name)
+            total = totals.setdefault(key, [0.0, 0])
+            total[0] += span.duration
+            total[1] += 1
+        parts = [f'{key};dur={dur * 1000:.1f}' + (f';desc="{count}x"' if count > 1 else "")
+                 for key, (dur, count) in totals.items()]
+        parts.append(f"total;dur={(time.monotonic() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "spans": [s.as_dict(self.started) for s in sorted(self.spans, key=lambda s: s.start)],
+            "dropped_spans": self.dropped,
+        }
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("request_trace", default=None)
+
+
+@contextmanager
+def _timed(trace: Trace, name: str, provider: Optional[str], attempt: Optional[int], attrs: dict) -> Iterator[None]:
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        trace.add(name, started, time.monotonic() - started, provider, attempt, **attrs)
+
+
+@contextmanager
+def traced(method: str, path: str) -> Iterator[Trace]:
+    """Своя трасса на блок (запрос, фоновая задача): спаны внутри пишутся в неё, а не в трассу вызывающего"""
+    trace = Trace(method, path)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        trace.duration = time.monotonic() - trace.started
+        if TRACE_DEBUG:
+            _keep(trace)
+
+
+def span(name: str, provider: Optional[str] = None, attempt: Optional[int] = None, **attrs):
+    """
+    Замерить фазу: with span("poll", provider="LeonardoProvider", attempt=2): ...
+    Вне трассируемого запроса (фоновые задачи, трассировка выключена) — общий nullcontext.
+    """
+    trace = _current.get()
+    if trace is None:
+        return _NOOP
+    return _timed(trace, name, provider, attempt, attrs)
+
+
+def record(name: str, started: float, provider: Optional[str] = None,
+           attempt: Optional[int] = None, **attrs) -> None:
+    """Добавить уже закончившуюся фазу (started — time.monotonic() её начала)"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, started, time.monotonic() - started, provider, attempt, **attrs)
+
+
+def next_attempt() -> Optional[int]:
+    """Номер попытки провайдера в текущем запросе (1, 2, ...), None вне трассировки"""
+    trace = _current.get()
+    return trace.next_attempt() if trace is not None else None
+
+
+# Последние трассы для /debug/traces (только при TRACE_DEBUG)
+_finished: "OrderedDict[str, Trace]" = OrderedDict()
+
+
+def _keep(trace: Trace) -> None:
+    _finished[trace.id] = trace
+    while len(_finished) > _TRACE_KEEP:
+        _finished.popitem(last=False)
+
+
+def get_trace(trace_id: str) -> Optional[dict]:
+    trace = _finished.get(trace_id)
+    return trace.as_dict() if trace is not None else None
+
+
+def recent_traces(limit: int = 20) -> List[dict]:
+    items = list(_finished.values())[-limit:]
+    return [{"id": t.id, "method": t.method, "path": t.path, "status": t.status,
+             "duration_ms": round(t.duration * 1000, 1) if t.duration is not None else None,
+             "spans": len(t.spans)} for t in reversed(items)]
+
+
+class TracingMiddleware:
+    """
+    ASGI-middleware: заводит трассу на запрос и добавляет Server-Timing к заголовкам ответа.
+    В заголовок попадает то, что закончилось к началу ответа (при потоковой отдаче
+    скачивание идёт уже после) — полная трасса доступна в отладочном режиме.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with traced(scope.get("method", ""), scope.get("path", "")) as trace:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    trace.status = message["status"]
+                    headers = list(message.get("headers", []))
+                    if SERVER_TIMING_ENABLED:
+                        headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    if TRACE_DEBUG:
+                        headers.append((b"x-trace-id", trace.id.encode("latin-1")))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,299 @@
+import math
+import time
+import uuid
+import json
+import zlib
+import random
+import socket
+import struct
+import asyncio
+import logging
+import tempfile
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+logger = logging.getLogger(__name__)
+
+# Локальные заглушки внешних сервисов: kie.ai, Leonardo, Pixazo (HTTP-сервер в фоновом потоке)
+# и gradio Space (подменный Client для gradio_pool). Ничего из app/ здесь не импортируется —
+# адреса заглушек нужно выставить в окружение до импорта провайдеров (см. run.py).
+
+
+@dataclass
+class Behaviour:
+    """Как ведёт себя сервис: логнормальная задержка, доля отказов и доля ответов 429"""
+    median: float = 1.0          # медиана времени генерации, сек
+    sigma: float = 0.3           # разброс (sigma логнормального распределения), 0 — фиксированная задержка
+    failure_rate: float = 0.0    # генерация падает
+    quota_rate: float = 0.0      # сервис отвечает 429 / «квота исчерпана» сразу
+
+    def latency(self, rng: random.Random) -> float:
+        return self.median * math.exp(rng.gauss(0, self.sigma)) if self.sigma else self.median
+
+    def outcome(self, rng: random.Random) -> str:
+        roll = rng.random()
+        if roll < self.quota_rate:
+            return "quota"
+        if roll < self.quota_rate + self.failure_rate:
+            return "fail"
+        return "ok"
+
+
+def make_png(width: int = 256, height: int = 256, seed: int = 0) -> bytes:
+    """Настоящий PNG из шума: размер файла ≈ width*height*3, чтобы скачивание стоило как в жизни"""
+    rng = random.Random(seed)
+    rows = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(rows, 1)) + chunk(b"IEND", b""))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class _Task:
+    def __init__(self, ready_at: float, outcome: str):
+        self.ready_at = ready_at
+        self.outcome = outcome
+
+
+class FakeProviders:
+    """
+    HTTP-заглушки kie.ai (createTask/recordInfo), Leonardo (v2 generations + v1 поллинг)
+    и Pixazo (синхронный getData) на одном локальном uvicorn. Картинки отдаются с /files/.
+    """
+
+    def __init__(self, behaviours: Dict[str, Behaviour], image: bytes, seed: int = 0):
+        self.behaviours = behaviours
+        self.image = image
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self._rng = random.Random(seed)
+        self._tasks: Dict[str, _Task] = {}
+        self._calls: Counter = Counter()
+        self._lock = threading.Lock()
+        self._server: Optional[uvicorn.Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self.app = self._build_app()
+
+    # --- Адреса для окружения провайдеров ---
+
+    def env(self) -> Dict[str, str]:
+        return {
+            "KIEAI_BASE_URL": self.base_url,
+            "LEONARDO_BASE_URL": self.base_url,
+            "URL_PIXAZO": f"{self.base_url}/pixazo/getData",
+        }
+
+    # --- Жизненный цикл ---
+
+    def start(self) -> "FakeProviders":
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=self.port,
+                                log_level="warning", lifespan="off", access_log=False)
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, name="bench-fakes", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake providers did not start in 10s")
+            time.sleep(0.02)
+        logger.info(f"🧪 [Bench] Fake providers listening on {self.base_url}")
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(sorted(self._calls.items()))
+
+    # --- Внутреннее ---
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._calls[key] += 1
+
+    def _roll(self, service: str):
+        behaviour = self.behaviours[service]
+        with self._lock:
+            return behaviour.latency(self._rng), behaviour.outcome(self._rng)
+
+    def _new_task(self, service: str) -> Optional[str]:
+        """id новой задачи или None, если сервис ответил 429"""
+        latency, outcome = self._roll(service)
+        self._count(f"{service}.submit.{outcome}")
+        if outcome == "quota":
+            return None
+        task_id = uuid.uuid4().hex
+        with self._lock:
+            self._tasks[task_id] = _Task(time.monotonic() + latency, outcome)
+        return task_id
+
+    def _task_state(self, service: str, task_id: str) -> Optional[str]:
+        """pending | fail | ok, None — задача неизвестна"""
+        with self._lock:
+            task = self._tasks.get(task_id)
+        if task is None:
+            return None
+        self._count(f"{service}.poll")
+        if time.monotonic() < task.ready_at:
+            return "pending"
+        return task.outcome
+
+    def _file_url(self, task_id: str) -> str:
+        return f"{self.base_url}/files/{task_id}.png"
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+        quota = {"code": 429, "msg": "Rate limit exceeded, too many requests"}
+
+        @app.post("/api/v1/jobs/createTask")
+        async def kie_create(request: Request):
+            await request.body()
+            task_id = self._new_task("kieai")
+            if task_id is None:
+                return JSONResponse(quota, status_code=429)
+            return {"code": 200, "msg": "success", "data": {"taskId": task_id}}
+
+        @app.get("/api/v1/jobs/recordInfo")
+        async def kie_record(taskId: str):
+            state = self._task_state("kieai", taskId)
+            if state is None:
+                return JSONResponse({"code": 404, "msg": "task not found"}, status_code=404)
+            data = {"taskId": taskId, "state": {"pending": "generating", "fail": "fail", "ok": "success"}[state]}
+            if state == "fail":
+                data["failMsg"] = "internal error (fake)"
+            if state == "ok":
+                data["resultJson"] = json.dumps({"resultUrls": [self._file_url(taskId)]})
+            return {"code": 200, "data": data}
+
+        @app.post("/api/rest/v2/generations")
+        async def leonardo_create(request: Request):
+            await request.body()
+            task_id = self._new_task("leonardo")
+            if task_id is None:
+                return JSONResponse({"error": "429 Too Many Requests"}, status_code=429)
+            return {"generate": {"generationId": task_id}}
+
+        @app.get("/api/rest/v1/generations/{generation_id}")
+        async def leonardo_poll(generation_id: str):
+            state = self._task_state("leonardo", generation_id)
+            if state is None:
+                return JSONResponse({"generations_by_pk": None}, status_code=404)
+            info = {"id": generation_id, "status": {"pending": "PENDING", "fail": "FAILED", "ok": "COMPLETE"}[state],
+                    "generated_images": [{"url": self._file_url(generation_id)}] if state == "ok" else []}
+            return {"generations_by_pk": info}
+
+        @app.post("/pixazo/getData")
+        async def pixazo(request: Request):
+            await request.body()
+            latency, outcome = self._roll("pixazo")
+            self._count(f"pixazo.submit.{outcome}")
+            if outcome == "quota":
+                return JSONResponse({"statusCode": 429, "message": "Rate limit is exceeded"}, status_code=429)
+            await asyncio.sleep(latency)
+            if outcome == "fail":
+                return JSONResponse({"error": "generation failed (fake)"}, status_code=500)
+            return {"output": self._file_url(uuid.uuid4().hex)}
+
+        @app.get("/files/{name}")
+        async def files(name: str):
+            self._count("files.download")
+            return Response(self.image, media_type="image/png")
+
+        return app
+
+
+# --- gradio Space ---
+
+# Подстрока в адресе / id Space -> имя поведения
+SPACES = {"playground": "playground", "flux": "flux", "qwen": "qwen", "z-image": "zimage"}
+
+
+class FakeJob:
+    def __init__(self, space: "FakeSpaceClient", latency: float, outcome: str):
+        self._space = space
+        self._ready_at = time.monotonic() + latency
+        self._outcome = outcome
+
+    def result(self, timeout: Optional[float] = None):
+        wait = self._ready_at - time.monotonic()
+        if timeout is not None and wait > timeout:
+            time.sleep(max(timeout, 0))
+            raise TimeoutError("Fake Space: job did not finish in time")
+        time.sleep(max(wait, 0))
+        if self._outcome == "quota":
+            raise Exception("You have exceeded your GPU quota (fake)")
+        if self._outcome == "fail":
+            raise Exception("Fake Space: the upstream app raised an error")
+        return self._space.result_payload()
+
+
+class FakeSpaceClient:
+    """
+    Подмена gradio Client: submit(...).result(timeout) ждёт задержку по Behaviour
+    и возвращает путь к временному PNG в той форме, в какой его отдаёт настоящий Space.
+    Атрибута src нет — фоновая проверка gradio_pool такой клиент не трогает.
+    """
+
+    def __init__(self, space: str, behaviour: Behaviour, image: bytes, rng: random.Random, lock: threading.Lock):
+        self.space = space
+        self.behaviour = behaviour
+        self.image = image
+        self._rng = rng
+        self._lock = lock
+        self.calls = 0
+
+    def submit(self, *args, api_name: Optional[str] = None, **kwargs) -> FakeJob:
+        with self._lock:
+            latency, outcome = self.behaviour.latency(self._rng), self.behaviour.outcome(self._rng)
+            self.calls += 1
+        return FakeJob(self, latency, outcome)
+
+    def result_payload(self):
+        with tempfile.NamedTemporaryFile(prefix="bench-", suffix=".png", delete=False) as f:
+            f.write(self.image)
+            path = f.name
+        # Провайдеры удаляют файл после чтения
+        if self.space == "zimage":
+            return [{"image": path, "caption": None}], "seed"
+        return path, 42
+
+
+class FakeSpaces:
+    """Фабрика клиентов для gradio_pool.set_factory"""
+
+    def __init__(self, behaviours: Dict[str, Behaviour], image: bytes, seed: int = 0):
+        self.behaviours = behaviours
+        self.image = image
+        self._rng = random.Random(seed + 1)
+        self._lock = threading.Lock()
+        self.clients: Dict[str, FakeSpaceClient] = {}
+
+    def __call__(self, src: str, token: Optional[str]) -> FakeSpaceClient:
+        space = next((name for marker, name in SPACES.items() if marker in src.lower()), None)
+        if space is None or space not in self.behaviours:
+            raise ValueError(f"No fake behaviour for Space {src}")
+        client = FakeSpaceClient(space, self.behaviours[space], self.image, self._rng, self._lock)
+        self.clients[space] = client
+        return client
+
+    def stats(self) -> Dict[str, int]:
+        return {f"{name}.submit": client.calls for name, client in sorted(self.clients.items())}
@@ -0,0 +1,293 @@
+"""
+Офлайн-бенчмарк конвейера картинок: оркестратор и настоящие провайдеры против локальных заглушек.
+
+    python -m bench.run --list
+    python -m bench.run --scenario steady
+    python -m bench.run --scenario all --output bench-results.json
+    python -m bench.run --scenario hedged --baseline bench-results.json
+
+Результат — JSON (stdout или --output): пропускная способность, p50/p90/p99,
+исходы, победители по провайдерам, пик потоков и памяти, счётчики вызовов заглушек.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tracemalloc
+import threading
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .fakes import FakeProviders, FakeSpaces, make_png
+from .scenarios import SCENARIOS, Scenario
+
+logger = logging.getLogger("bench")
+
+# Окружение по умолчанию: без сети, без диска, без вебхуков; кулдауны брейкера ужаты
+# под секундные сценарии. Явно заданные переменные не перетираются.
+_ENV_DEFAULTS = {
+    "IMAGE_HEALTH_BACKEND": "memory",
+    "IMAGE_CACHE_ENABLED": "0",
+    "IMAGE_CALLBACK_BASE_URL": "",
+    "IMAGE_BREAKER_BASE_COOLDOWN": "5",
+    "IMAGE_BREAKER_QUOTA_COOLDOWN": "3",
+    "KIEAI_API_KEY": "bench",
+    "LEONARDO_API_KEY": "bench",
+    "API_KEY_PIXAZO": "bench",
+}
+
+
+class ResourceSampler:
+    """Фоновый замер: пик числа потоков и RSS процесса (Linux /proc, иначе ru_maxrss)"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.threads_peak = threading.active_count()
+        self.rss_peak = self._rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bench-sampler", daemon=True)
+
+    @staticmethod
+    def _rss() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.threads_peak = max(self.threads_peak, threading.active_count())
+            self.rss_peak = max(self.rss_peak, self._rss())
+
+    def __enter__(self) -> "ResourceSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return round(ordered[index], 3)
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _calibrate(scenario: Scenario) -> None:
+    """
+    Подогнать оценки провайдеров под ужатое время заглушек: expected_latency задаёт
+    ранжирование и первый опрос, poll_interval — минимальный шаг поллинга.
+    """
+    from app.services.image.orchestrator import _provider_chain
+    from app.services.image.kieai_base import KieAIProvider
+    from app.services.image.leonardo import LeonardoProvider
+    from app.services.image.pixazo import PixazoProvider
+    from app.services.image.playground import PlaygroundProvider
+    from app.services.image.flux_klein import FluxKleinProvider
+    from app.services.image.qwen import QwenProvider
+    from app.services.image.z_image import ZImageProvider
+
+    names = {PlaygroundProvider: "playground", FluxKleinProvider: "flux", QwenProvider: "qwen",
+             ZImageProvider: "zimage", LeonardoProvider: "leonardo", PixazoProvider: "pixazo"}
+    for cls in set(_provider_chain()) | set(names):
+        name = "kieai" if issubclass(cls, KieAIProvider) else names.get(cls)
+        if name is None or name not in scenario.behaviours:
+            continue
+        cls.expected_latency = scenario.behaviours[name].median
+        if issubclass(cls, (KieAIProvider, LeonardoProvider)):
+            cls.poll_interval = 0.1
+
+
+async def _load(scenario: Scenario) -> dict:
+    from app.services.image.orchestrator import generate_image_async, generate_image_sync
+    from app.services.image.progress import listen
+
+    latencies: List[float] = []
+    outcomes: Counter = Counter()
+    winners: Counter = Counter()
+    attempts: Counter = Counter()
+    failures: Counter = Counter()
+    semaphore = asyncio.Semaphore(scenario.concurrency)
+    pool = ThreadPoolExecutor(max_workers=scenario.concurrency, thread_name_prefix="bench-sync")
+    loop = asyncio.get_running_loop()
+
+    def on_event(event: dict, won: list) -> None:
+        phase = event["phase"]
+        if phase == "attempt":
+            attempts[event["provider"]] += 1
+        elif phase == "provider_failed":
+            failures[f"{event['provider']}: {event.get('kind')}"] += 1
+        elif phase == "provider_succeeded" and not won:
+            won.append(event["provider"])
+
+    def call_sync(params: dict, won: list) -> bytes:
+        with listen(lambda e: on_event(e, won)):
+            return generate_image_sync(**params)
+
+    async def one(index: int) -> None:
+        # Уникальный промпт: одинаковые запросы схлопнулись бы в одну генерацию
+        params = dict(prompt=f"bench {scenario.name} #{index}", negative_prompt="", width=scenario.width,
+                      height=scenario.height, hedge_delay=scenario.hedge_delay, timeout=scenario.timeout)
+        won: list = []
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                if scenario.mode == "sync":
+                    await loop.run_in_executor(pool, call_sync, params, won)
+                else:
+                    with listen(lambda e: on_event(e, won)):
+                        await generate_image_async(**params)
+                outcomes["ok"] += 1
+                latencies.append(time.monotonic() - started)
+                winners[won[0] if won else "unknown"] += 1
+            except TimeoutError:
+                outcomes["timeout"] += 1
+            except Exception as e:
+                outcomes["error"] += 1
+                logger.debug(f"Request {index} failed: {e}")
+
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(one(i) for i in range(scenario.requests)))
+    finally:
+        pool.shutdown(wait=False)
+    wall = time.monotonic() - started
+
+    return {
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(outcomes["ok"] / wall, 3) if wall else None,
+        "latency": {
+            "p50": _percentile(latencies, 0.5), "p90": _percentile(latencies, 0.9),
+            "p99": _percentile(latencies, 0.99), "max": _percentile(latencies, 1.0),
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else None,
+        },
+        "outcomes": dict(outcomes),
+        "winners": dict(winners.most_common()),
+        "attempts": dict(attempts.most_common()),
+        "failures": dict(failures.most_common()),
+    }
+
+
+def run_scenario(scenario: Scenario, trace_memory: bool = False, seed: int = 0) -> dict:
+    """Прогнать один сценарий в текущем процессе. Провайдеры импортируются уже с адресами заглушек"""
+    image = make_png(512, 512, seed)
+    fakes = FakeProviders(scenario.behaviours, image, seed).start()
+    for key, value in {**_ENV_DEFAULTS, **fakes.env()}.items():
+        os.environ.setdefault(key, value)
+
+    from app.services.image.gradio_pool import gradio_pool
+    spaces = FakeSpaces(scenario.behaviours, image, seed)
+    gradio_pool.set_factory(spaces)
+    _calibrate(scenario)
+
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        with ResourceSampler() as sampler:
+            result = asyncio.run(_load(scenario))
+    finally:
+        fakes.stop()
+
+    result.update({
+        "threads_peak": sampler.threads_peak,
+        "rss_peak_mb": round(sampler.rss_peak / 2 ** 20, 1),
+        "fake_calls": {**fakes.stats(), **spaces.stats()},
+    })
+    if trace_memory:
+        result["python_heap_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        tracemalloc.stop()
+    return result
+
+
+def _run_isolated(name: str, args: argparse.Namespace) -> dict:
+    """Каждый сценарий — в своём процессе: здоровье провайдеров, пулы и лимиты не перетекают"""
+    command = [sys.executable, "-m", "bench.run", "--scenario", name, "--seed", str(args.seed)]
+    if args.trace_memory:
+        command.append("--trace-memory")
+    proc = subprocess.run(command, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout)[0]
+
+
+def _compare(results: List[dict], baseline_path: str) -> None:
+    """Таблица изменений против сохранённого прогона (в stderr, чтобы stdout оставался JSON)"""
+    with open(baseline_path) as f:
+        baseline = {r["scenario"]: r for r in json.load(f)}
+
+    def delta(new: Optional[float], old: Optional[float]) -> str:
+        if new is None or old is None or not old:
+            return f"{new}"
+        return f"{new} ({(new - old) / old:+.0%})"
+
+    print(f"{'scenario':<14} {'rps':<18} {'p50':<18} {'p99':<18}", file=sys.stderr)
+    for r in results:
+        old = baseline.get(r["scenario"])
+        if old is None:
+            continue
+        print(f"{r['scenario']:<14} {delta(r['throughput_rps'], old['throughput_rps']):<18} "
+              f"{delta(r['latency']['p50'], old['latency']['p50']):<18} "
+              f"{delta(r['latency']['p99'], old['latency']['p99']):<18}", file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the image pipeline")
+    parser.add_argument("--scenario", default="steady", help="scenario name or 'all'")
+    parser.add_argument("--list", action="store_true", help="list scenarios and exit")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--seed", type=int, default=0, help="seed for latencies and failures")
+    parser.add_argument("--trace-memory", action="store_true", help="track Python heap peak (slower)")
+    parser.add_argument("--verbose", action="store_true", help="show service logs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s", stream=sys.stderr)
+
+    if args.list:
+        for scenario in SCENARIOS.values():
+            print(f"{scenario.name:<14} {scenario.description}")
+        return
+
+    if args.scenario == "all":
+        results = []
+        for name in SCENARIOS:
+            print(f"🧪 [Bench] {name}...", file=sys.stderr)
+            results.append(_run_isolated(name, args))
+    else:
+        scenario = SCENARIOS.get(args.scenario)
+        if scenario is None:
+            parser.error(f"unknown scenario {args.scenario!r}, see --list")
+        result = run_scenario(scenario, args.trace_memory, args.seed)
+        results = [{"scenario": scenario.name, "git_rev": _git_rev(), "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "config": scenario.describe(), **result}]
+
+    payload = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload)
+    print(payload)
+    if args.baseline:
+        _compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
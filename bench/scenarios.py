@@ -0,0 +1,67 @@
+from dataclasses import dataclass, field, replace
+from typing import Dict, Optional
+
+from .fakes import Behaviour
+
+# Задержки ужаты примерно в 20 раз против живых сервисов: сценарий идёт секунды, а не минуты,
+# но соотношения (Pixazo быстрее Space, kie.ai самый долгий) сохраняются.
+
+
+def healthy() -> Dict[str, Behaviour]:
+    return {
+        "playground": Behaviour(median=1.0, sigma=0.3),
+        "flux": Behaviour(median=0.8, sigma=0.3),
+        "qwen": Behaviour(median=1.5, sigma=0.3),
+        "zimage": Behaviour(median=1.2, sigma=0.3),
+        "leonardo": Behaviour(median=1.5, sigma=0.4),
+        "kieai": Behaviour(median=2.0, sigma=0.4),
+        "pixazo": Behaviour(median=0.5, sigma=0.2),
+    }
+
+
+def _tweak(behaviours: Dict[str, Behaviour], **changes: dict) -> Dict[str, Behaviour]:
+    """_tweak(healthy(), flux={"failure_rate": 0.5}) — копия с изменёнными сервисами"""
+    return {name: replace(b, **changes.get(name, {})) for name, b in behaviours.items()}
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    requests: int = 40
+    concurrency: int = 8
+    mode: str = "async"                  # async | sync (generate_image_sync в потоках)
+    hedge_delay: Optional[float] = None
+    timeout: Optional[float] = None
+    width: int = 1024
+    height: int = 1024
+    behaviours: Dict[str, Behaviour] = field(default_factory=healthy)
+
+    def describe(self) -> dict:
+        return {
+            "requests": self.requests, "concurrency": self.concurrency, "mode": self.mode,
+            "hedge_delay": self.hedge_delay, "timeout": self.timeout, "size": f"{self.width}x{self.height}",
+            "behaviours": {name: vars(b) for name, b in self.behaviours.items()},
+        }
+
+
+_SLOW_TAIL = _tweak(healthy(), playground={"median": 2.5, "sigma": 0.9}, flux={"median": 2.0, "sigma": 0.9})
+
+SCENARIOS: Dict[str, Scenario] = {s.name: s for s in [
+    Scenario("steady", "Все сервисы здоровы, умеренная нагрузка"),
+    Scenario("sync", "То же, что steady, но через generate_image_sync в пуле потоков", mode="sync"),
+    Scenario("burst", "Всплеск: параллельных запросов больше, чем суммарные лимиты провайдеров",
+             requests=120, concurrency=32),
+    Scenario("flaky_spaces", "gradio Space падают и упираются в квоту GPU",
+             behaviours=_tweak(healthy(),
+                               playground={"failure_rate": 0.4, "quota_rate": 0.1},
+                               flux={"failure_rate": 0.4, "quota_rate": 0.1})),
+    Scenario("quota_storm", "Платные API массово отвечают 429",
+             behaviours=_tweak(healthy(), leonardo={"quota_rate": 0.6}, kieai={"quota_rate": 0.6},
+                               pixazo={"quota_rate": 0.1})),
+    Scenario("slow_tail", "Тяжёлый хвост задержек у Space, последовательный перебор", behaviours=_SLOW_TAIL),
+    Scenario("hedged", "Тяжёлый хвост задержек у Space, hedged-режим (задержка 0.5 с)",
+             hedge_delay=0.5, behaviours=_SLOW_TAIL),
+    Scenario("deadline", "Жёсткий дедлайн 2 с при медленных провайдерах", timeout=2.0,
+             behaviours=_tweak(_SLOW_TAIL, pixazo={"median": 1.5, "sigma": 0.5})),
+]}
@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# Окружение до импорта приложения: состояние провайдеров в памяти, файлы — во временной папке
+_TMP = tempfile.mkdtemp(prefix="image-api-tests-")
+os.environ.setdefault("IMAGE_HEALTH_BACKEND", "memory")
+os.environ.setdefault("RESULT_STORE_DIR", os.path.join(_TMP, "results"))
+os.environ.setdefault("IMAGE_CACHE_DIR", os.path.join(_TMP, "images"))
+os.environ.setdefault("API_KEY", "test-key")
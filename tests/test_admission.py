@@ -0,0 +1,51 @@
+import asyncio
+
+from app.services import admission
+from app.services.admission import AdmissionController, AdmissionMiddleware, header
+
+
+def _scope(token=None) -> dict:
+    headers = [(b"x-token", token.encode())] if token else []
+    return {"type": "http", "method": "POST", "path": "/gen", "headers": headers}
+
+
+def test_unauthenticated_requests_do_not_take_slots(monkeypatch):
+    controller = AdmissionController("gen", max_concurrency=1, max_queue=0, service_time=1.0)
+    monkeypatch.setitem(admission.controllers, "gen", controller)
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        if header(scope, b"x-token") == "good":
+            await release.wait()
+            status = 200
+        else:
+            status = 401
+        await send({"type": "http.response.start", "status": status, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = AdmissionMiddleware(app, routes={("POST", "/gen"): "gen"},
+                                     authorized=lambda scope: header(scope, b"x-token") == "good")
+
+    async def call(token):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await middleware(_scope(token), None, send)
+        return sent[0]["status"]
+
+    async def scenario():
+        # Реальный клиент держит единственный слот
+        owner = asyncio.create_task(call("good"))
+        await asyncio.sleep(0)
+        # Анонимы не ждут слот и не получают 503 — сразу 401 от приложения
+        assert [await call(None), await call("bad")] == [401, 401]
+        # Второй реальный клиент при занятом слоте — 503
+        assert await call("good") == 503
+        release.set()
+        assert await owner == 200
+
+    asyncio.run(scenario())
+    assert controller.active == 0
+
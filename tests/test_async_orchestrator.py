@@ -0,0 +1,99 @@
+import time
+import asyncio
+import itertools
+
+import pytest
+
+from app.services.image.base import ImageProvider
+from app.services.image import orchestrator
+
+_names = itertools.count()
+
+
+def _named(cls):
+    cls.__name__ = cls.__qualname__ = f"AsyncStub{next(_names)}"
+    return cls
+
+
+def _blocking(delay: float, result: bytes = b"png"):
+    @_named
+    class Blocking(ImageProvider):
+        @property
+        def name(self):
+            return type(self).__name__
+
+        def generate(self, prompt, negative_prompt, width, height, deadline=None):
+            time.sleep(delay)
+            return result
+
+    return Blocking
+
+
+def _native(delay: float, result: bytes = b"png", error: Exception = None, cancelled: list = None):
+    @_named
+    class Native(_blocking(delay, result)):
+        async def agenerate(self, prompt, negative_prompt, width, height, deadline=None):
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                if cancelled is not None:
+                    cancelled.append(type(self).__name__)
+                raise
+            if error is not None:
+                raise error
+            return result
+
+    return Native
+
+
+def test_default_agenerate_keeps_the_event_loop_free(monkeypatch):
+    monkeypatch.setattr(orchestrator, "_provider_chain", lambda: [_blocking(0.2)])
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        background = asyncio.create_task(ticker())
+        result = await orchestrator.generate_image_async("cat", "", 512, 512)
+        background.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(scenario())
+    assert result == b"png"
+    assert ticks >= 5          # blocking generate ушёл в поток, цикл жил
+
+
+def test_async_hedge_cancels_the_losers(monkeypatch):
+    cancelled = []
+    slow = _native(5.0, b"slow", cancelled=cancelled)
+    fast = _native(0.01, b"fast")
+    monkeypatch.setattr(orchestrator, "_provider_chain", lambda: [slow, fast])
+
+    async def scenario():
+        result = await orchestrator.generate_image_async("cat", "", 512, 512, hedge_delay=0.05)
+        await asyncio.sleep(0.05)
+        return result
+
+    started = time.monotonic()
+    assert asyncio.run(scenario()) == b"fast"
+    assert time.monotonic() - started < 1.0
+    assert cancelled == [slow.__name__]
+
+
+def test_async_serial_falls_through_failures(monkeypatch):
+    broken = _native(0.01, error=RuntimeError("boom"))
+    good = _native(0.01, b"good")
+    monkeypatch.setattr(orchestrator, "_provider_chain", lambda: [broken, good])
+    assert asyncio.run(orchestrator.generate_image_async("cat", "", 512, 512)) == b"good"
+
+
+def test_async_all_failed_raises(monkeypatch):
+    chain = [_native(0.01, error=RuntimeError("down")) for _ in range(2)]
+    monkeypatch.setattr(orchestrator, "_provider_chain", lambda: chain)
+    with pytest.raises(Exception, match="ALL PROVIDERS DEAD"):
+        asyncio.run(orchestrator.generate_image_async("cat", "", 512, 512))
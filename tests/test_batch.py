@@ -0,0 +1,49 @@
+import io
+import json
+import asyncio
+import zipfile
+
+from app.services.image import batch as batch_module
+from app.services.image.batch import generate_batch, build_zip
+
+_ITEMS = [{"prompt": p, "negative_prompt": "", "width": 512, "height": 512} for p in ("cat", "dog", "owl")]
+
+
+def test_failed_item_does_not_fail_the_batch(monkeypatch):
+    running = 0
+    peak = 0
+
+    async def generate(prompt, **params):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if prompt == "dog":
+            raise RuntimeError("ALL PROVIDERS DEAD")
+        return prompt.encode()
+
+    monkeypatch.setattr(batch_module, "generate_image_async", generate)
+    results = asyncio.run(generate_batch(_ITEMS, use_cache=False))
+
+    assert [r.index for r in results] == [0, 1, 2]
+    assert [r.data for r in results] == [b"cat", None, b"owl"]
+    assert "ALL PROVIDERS DEAD" in results[1].error
+    assert peak == 3                            # картинки генерировались параллельно
+
+
+def test_zip_holds_successful_images_and_a_manifest(monkeypatch):
+    async def generate(prompt, **params):
+        if prompt == "dog":
+            raise RuntimeError("down")
+        return b"\x89PNG" + prompt.encode()
+
+    monkeypatch.setattr(batch_module, "generate_image_async", generate)
+    results = asyncio.run(generate_batch(_ITEMS, use_cache=False))
+
+    with zipfile.ZipFile(io.BytesIO(build_zip(results))) as archive:
+        manifest = json.loads(archive.read("manifest.json"))["items"]
+        files = [item["file"] for item in manifest]
+        assert [item["status"] for item in manifest] == ["ok", "failed", "ok"]
+        assert files[1] is None
+        assert archive.read(files[2]).endswith(b"owl")
@@ -0,0 +1,53 @@
+import io
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+from PIL import Image
+
+from bench.fakes import Behaviour, FakeSpaces, make_png
+from bench.scenarios import SCENARIOS, healthy
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_behaviour_draws_are_reproducible_and_follow_the_rates():
+    behaviour = Behaviour(median=1.0, sigma=0.3, failure_rate=0.2, quota_rate=0.1)
+    first = [behaviour.outcome(random.Random(7)) for _ in range(3)]
+    assert first == [behaviour.outcome(random.Random(7)) for _ in range(3)]
+
+    rng = random.Random(0)
+    outcomes = [behaviour.outcome(rng) for _ in range(5000)]
+    assert abs(outcomes.count("quota") / 5000 - 0.1) < 0.02
+    assert abs(outcomes.count("fail") / 5000 - 0.2) < 0.02
+    assert Behaviour(median=0.5, sigma=0).latency(rng) == 0.5
+
+
+def test_fake_png_is_a_real_image():
+    with Image.open(io.BytesIO(make_png(64, 32))) as image:
+        assert image.size == (64, 32)
+
+
+def test_fake_space_reports_quota_and_respects_the_step_timeout():
+    spaces = FakeSpaces({"flux": Behaviour(median=0.01, sigma=0, quota_rate=1.0),
+                         "qwen": Behaviour(median=5.0, sigma=0)}, make_png(8, 8))
+    with pytest.raises(Exception, match="quota"):
+        spaces("black-forest-labs/FLUX.2-klein", None).submit("cat").result(timeout=1)
+    with pytest.raises(TimeoutError):
+        spaces("Qwen/Qwen-Image", None).submit("cat").result(timeout=0.01)
+    assert spaces.stats() == {"flux.submit": 1, "qwen.submit": 1}
+
+
+def test_every_scenario_covers_all_services():
+    assert {"steady", "burst", "hedged", "deadline"} <= set(SCENARIOS)
+    for scenario in SCENARIOS.values():
+        assert set(scenario.behaviours) == set(healthy())
+
+
+def test_cli_lists_scenarios():
+    listed = subprocess.run([sys.executable, "-m", "bench.run", "--list"], cwd=_ROOT,
+                            capture_output=True, text=True, timeout=60)
+    assert listed.returncode == 0
+    assert {line.split()[0] for line in listed.stdout.splitlines() if line.strip()} == set(SCENARIOS)
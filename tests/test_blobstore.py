@@ -0,0 +1,53 @@
+import time
+
+from app.services.blobstore import BlobStore
+
+
+def _store(tmp_path) -> BlobStore:
+    return BlobStore(str(tmp_path), max_bytes=1024 * 1024, ttl=3600, secret="secret")
+
+
+def test_signed_link_verifies_until_it_expires(tmp_path, monkeypatch):
+    store = _store(tmp_path)
+    blob = store.put(b"png-bytes", "png")
+    query = store.signed_query(blob.name, "cat.png", ttl=60)
+    assert store.verify(blob.name, query["expires"], query["sig"], "cat.png")
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert not store.verify(blob.name, query["expires"], query["sig"], "cat.png")
+
+
+def test_tampered_links_are_rejected(tmp_path):
+    store = _store(tmp_path)
+    blob = store.put(b"png-bytes", "png")
+    other = store.put(b"other-bytes", "png")
+    query = store.signed_query(blob.name, "cat.png", ttl=60)
+    expires, sig = query["expires"], query["sig"]
+
+    assert not store.verify(other.name, expires, sig, "cat.png")                 # чужой файл
+    assert not store.verify(blob.name, expires + 3600, sig, "cat.png")           # продлённый срок
+    assert not store.verify(blob.name, expires, sig, "dog.png")                  # другое имя файла
+    assert not store.verify(blob.name, expires, sig[:-1] + ("0" if sig[-1] != "0" else "1"), "cat.png")
+    # Подпись другим секретом не подходит
+    foreign = BlobStore(str(tmp_path), max_bytes=1024 * 1024, ttl=3600, secret="other")
+    assert not foreign.verify(blob.name, expires, sig, "cat.png")
+
+
+def test_signed_url_round_trip_through_files_endpoint(tmp_path, monkeypatch):
+    from urllib.parse import urlsplit
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.api.routers import files_router
+
+    store = _store(tmp_path)
+    monkeypatch.setattr(files_router, "result_store", store)
+    app = FastAPI()
+    app.include_router(files_router.router)
+    client = TestClient(app)
+
+    link = store.url(store.put(b"png-bytes", "png"), "http://testserver")
+    url = urlsplit(link["url"])
+    path = f"{url.path}?{url.query}"
+    assert client.get(path).content == b"png-bytes"
+    assert client.get(path.replace("sig=", "sig=0")).status_code == 403
@@ -0,0 +1,66 @@
+import os
+import time
+
+from app.services.image.cache import ImageCache, make_key
+
+
+def _cache(tmp_path, memory=100, disk=1000, ttl=3600) -> ImageCache:
+    return ImageCache(memory_max_bytes=memory, disk_dir=str(tmp_path), disk_max_bytes=disk, ttl=ttl)
+
+
+def test_memory_level_evicts_least_recently_used(tmp_path):
+    cache = _cache(tmp_path, memory=100)
+    cache.put("a", b"x" * 40)
+    cache.put("b", b"y" * 40)
+    assert cache.get("a") == b"x" * 40          # a — свежее b
+    cache.put("c", b"z" * 40)                   # 120 байт > 100: из памяти уходит b
+    assert cache.stats()["memory_items"] == 2 and cache.stats()["memory_bytes"] == 80
+
+    assert cache.get("a") == b"x" * 40 and cache.get("c") == b"z" * 40
+    assert cache.stats()["disk_hits"] == 0
+    # Диск при этом ещё хранит b
+    assert cache.get("b") == b"y" * 40
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_disk_level_evicts_oldest_over_the_limit(tmp_path):
+    cache = _cache(tmp_path, memory=0, disk=100)
+    for key in ("aa1", "bb2", "cc3"):
+        cache.put(key, b"x" * 40)
+    # Третья запись не влезла в 100 байт — ушла самая старая
+    assert cache.get("aa1") is None
+    assert cache.get("bb2") == b"x" * 40 and cache.get("cc3") == b"x" * 40
+    assert cache.stats()["disk_bytes"] == 80 and cache.stats()["evictions"] == 1
+
+
+def test_disk_eviction_does_not_walk_the_directory_per_write(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, memory=0, disk=100)
+    walks = []
+    real_walk = os.walk
+    monkeypatch.setattr(os, "walk", lambda *a, **k: walks.append(a) or real_walk(*a, **k))
+    for i in range(20):
+        cache.put(f"k{i:02d}", b"x" * 40)
+    assert walks == []
+    assert cache.stats()["disk_bytes"] == 80 and cache.stats()["evictions"] == 18
+
+
+def test_disk_index_survives_restart(tmp_path):
+    first = _cache(tmp_path, memory=0, disk=100)
+    first.put("aa1", b"x" * 40)
+    time.sleep(0.01)                            # порядок после рестарта — по mtime файлов
+    first.put("bb2", b"x" * 40)
+    # Новый процесс подхватывает файлы с диска, старые вытесняются первыми
+    second = _cache(tmp_path, memory=0, disk=100)
+    assert second.stats()["disk_bytes"] == 80
+    second.put("cc3", b"x" * 40)
+    assert second.get("aa1") is None and second.get("bb2") == b"x" * 40
+
+
+def test_expired_entries_are_misses(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, ttl=60)
+    key = make_key("cat", "", 512, 512)
+    cache.put(key, b"png")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    assert cache.get(key) is None
+    assert cache.stats()["disk_bytes"] == 0 and cache.stats()["misses"] == 1
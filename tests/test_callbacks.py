@@ -0,0 +1,50 @@
+from urllib.parse import parse_qs, urlsplit
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routers import callback_router
+from app.services.image.callbacks import CallbackRegistry
+
+_SECRET = "s3cr&t+#="
+
+
+def _client(monkeypatch) -> tuple:
+    registry = CallbackRegistry("https://api.example.com", _SECRET, {"kieai", "leonardo"})
+    monkeypatch.setattr(callback_router, "callback_registry", registry)
+    app = FastAPI()
+    app.include_router(callback_router.router, prefix="/api/image/callbacks")
+    return registry, TestClient(app)
+
+
+def test_callback_url_is_signed_and_does_not_carry_the_secret(monkeypatch):
+    registry, client = _client(monkeypatch)
+    url = urlsplit(registry.url("kieai"))
+    assert _SECRET not in registry.url("kieai") and "s3cr" not in url.query
+    waiter = registry.register("kieai", "task-1")
+
+    body = {"data": {"taskId": "task-1", "state": "success"}}
+    response = client.post(f"{url.path}?{url.query}", json=body)
+    assert response.status_code == 200 and response.json()["delivered"]
+    assert waiter.result(timeout=1) == body
+
+
+def test_forged_or_foreign_signatures_are_rejected(monkeypatch):
+    registry, client = _client(monkeypatch)
+    url = urlsplit(registry.url("kieai"))
+    query = parse_qs(url.query)
+    body = {"data": {"taskId": "task-1"}}
+
+    assert client.post(f"{url.path}?nonce={query['nonce'][0]}&sig=0", json=body).status_code == 403
+    # Подпись привязана к провайдеру
+    assert client.post(f"/api/image/callbacks/leonardo?{url.query}", json=body).status_code == 403
+    assert client.post(url.path, json=body).status_code == 403
+
+
+def test_leonardo_bearer_secret_still_accepted(monkeypatch):
+    registry, client = _client(monkeypatch)
+    body = {"data": {"object": {"id": "gen-1"}}}
+    headers = {"Authorization": f"Bearer {_SECRET}"}
+    assert client.post("/api/image/callbacks/leonardo", json=body, headers=headers).status_code == 200
+    assert client.post("/api/image/callbacks/leonardo", json=body,
+                       headers={"Authorization": "Bearer nope"}).status_code == 403
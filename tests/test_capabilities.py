@@ -0,0 +1,43 @@
+from app.services.image.capabilities import Capabilities, CapabilityIndex, ratios
+
+
+class Free:
+    capabilities = Capabilities()
+
+
+class RatiosOnly:
+    capabilities = Capabilities(ratios=ratios("1:1", "4:3", "16:9"))
+
+
+class LastResort:
+    capabilities = Capabilities()
+
+
+def test_distorting_provider_is_demoted_not_dropped():
+    index = CapabilityIndex([RatiosOnly, Free, LastResort])
+    # 3:2 у RatiosOnly превращается в 4:3 (~13%) — он идёт в конец, но перед последним рубежом
+    chain, demoted = index.route([RatiosOnly, Free, LastResort], 1024, 680, keep=[LastResort])
+    assert chain == [Free, RatiosOnly, LastResort]
+    assert demoted == [RatiosOnly]
+
+
+def test_fit_cache_is_per_index():
+    first = CapabilityIndex([Free])
+    second = CapabilityIndex([Free])
+    fit = first.fit("Free", 512, 512)
+    assert first.fit("Free", 512, 512) is fit
+    assert second.fit("Free", 512, 512) is not fit
+
+
+class NoNegative:
+    capabilities = Capabilities(negative_prompt=False)
+
+
+def test_negative_prompt_prefers_providers_that_honour_it():
+    index = CapabilityIndex([NoNegative, Free, RatiosOnly, LastResort])
+    chain = [NoNegative, RatiosOnly, Free, LastResort]
+    # Без negative prompt порядок прежний (RatiosOnly уходит только из-за геометрии)
+    assert index.route(chain, 1024, 680, keep=[LastResort])[0] == [NoNegative, Free, RatiosOnly, LastResort]
+    # С ним NoNegative уступает внутри своей группы, но не обгоняется искажающим RatiosOnly
+    assert index.route(chain, 1024, 680, keep=[LastResort], negative_prompt=True)[0] == \
+        [Free, NoNegative, RatiosOnly, LastResort]
@@ -0,0 +1,74 @@
+import time
+import asyncio
+import itertools
+from dataclasses import asdict
+
+import httpx
+import pytest
+
+from app.services.image.base import ImageProvider
+from app.services.image.deadline import budget, make_deadline
+from app.services.image.health import CLOSED, OPEN, ProviderHealth, provider_health
+from app.services.image import orchestrator
+
+_names = itertools.count()
+
+
+def _provider(error: Exception, step: float = 5.0):
+    """Провайдер, у которого шаг ждёт budget(deadline, step), а потом падает с error — как job.result(timeout=...)"""
+
+    class Stub(ImageProvider):
+        expected_latency = 0.01
+
+        @property
+        def name(self):
+            return type(self).__name__
+
+        def generate(self, prompt, negative_prompt, width, height, deadline=None):
+            time.sleep(budget(deadline, step))
+            raise error
+
+    Stub.__name__ = Stub.__qualname__ = f"Stub{next(_names)}"
+    return Stub
+
+
+def _health(cls) -> dict:
+    # Попытки, оборванные дедлайном, вообще не пишутся — записи может не быть
+    return provider_health.stats().get(cls.__name__, asdict(ProviderHealth()))
+
+
+def _state(cls) -> str:
+    return _health(cls)["state"]
+
+
+@pytest.mark.parametrize("error", [TimeoutError("Too slow! Queue is long."), httpx.ReadTimeout("")])
+def test_deadline_cut_attempts_leave_breaker_closed(error):
+    cls = _provider(error)
+    for _ in range(3):
+        errors = []
+        assert orchestrator._run_serial([cls], "cat", "", 512, 512, errors, make_deadline(0.1)) is None
+        assert errors
+    assert _state(cls) == CLOSED
+    assert _health(cls)["consecutive_failures"] == 0
+
+
+def test_async_deadline_cut_attempts_leave_breaker_closed():
+    cls = _provider(TimeoutError("Polling timed out"))
+
+    async def attempt():
+        errors = []
+        deadline = make_deadline(0.1)
+        call = lambda p: p.agenerate("cat", "", 512, 512, deadline)
+        return await orchestrator._run_serial_async([cls], call, errors, deadline)
+
+    for _ in range(3):
+        assert asyncio.run(attempt()) is None
+    assert _state(cls) == CLOSED
+
+
+def test_own_timeouts_still_open_breaker():
+    # Провайдер упал по своему таймауту задолго до дедлайна — это его вина
+    cls = _provider(TimeoutError("Too slow! Queue is long."), step=0.01)
+    for _ in range(2):
+        orchestrator._run_serial([cls], "cat", "", 512, 512, [], make_deadline(30))
+    assert _state(cls) == OPEN
@@ -0,0 +1,54 @@
+import os
+import asyncio
+
+from app.services.image.base import FileImageProvider
+from app.services.image.cache import ImageCache
+
+JPEG = b"\xff\xd8\xff" + b"x" * 61
+
+
+class _FileProvider(FileImageProvider):
+    """Провайдер-заглушка: «скачивает» файл во временную папку, как gradio_client"""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    @property
+    def name(self) -> str:
+        return "File stub"
+
+    def generate_file(self, prompt, negative_prompt, width, height, deadline=None) -> str:
+        path = os.path.join(self.folder, "result.jpg")
+        with open(path, "wb") as f:
+            f.write(JPEG)
+        return path
+
+
+def test_generate_reads_and_deletes_the_file(tmp_path):
+    assert _FileProvider(str(tmp_path)).generate("cat", "", 64, 64) == JPEG
+    assert os.listdir(tmp_path) == []
+
+
+def test_stream_keeps_the_file_until_closed(tmp_path):
+    async def scenario():
+        stream = await _FileProvider(str(tmp_path)).astream("cat", "", 64, 64)
+        assert stream.path and stream.size == len(JPEG) and stream.content_type == "image/jpeg"
+        assert await stream.read() == JPEG
+        await stream.aclose()
+        assert os.listdir(tmp_path) == []
+
+    asyncio.run(scenario())
+
+
+def test_cache_adopts_the_file_by_rename_and_counts_it_once(tmp_path):
+    source_dir, cache_dir = tmp_path / "gradio", tmp_path / "cache"
+    source_dir.mkdir()
+    cache = ImageCache(memory_max_bytes=0, disk_dir=str(cache_dir), disk_max_bytes=1000, ttl=3600)
+    provider = _FileProvider(str(source_dir))
+
+    first = cache.adopt("k", provider.generate_file("cat", "", 64, 64))
+    assert first and os.listdir(source_dir) == []
+    # Повторный результат под тем же ключом заменяет файл, а не удваивает занятый объём
+    assert cache.adopt("k", provider.generate_file("cat", "", 64, 64)) == first
+    assert cache.stats()["disk_bytes"] == len(JPEG)
+    assert cache.get("k") == JPEG
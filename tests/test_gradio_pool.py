@@ -0,0 +1,37 @@
+from app.services.image.gradio_pool import GradioClientPool
+
+
+class StubClient:
+    def __init__(self, src):
+        self.src = None  # без src фоновая проверка клиента не трогает
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _pool():
+    return GradioClientPool(factory=lambda src, token: StubClient(src))
+
+
+def test_rebuild_keeps_leased_client_open_until_release():
+    pool = _pool()
+    key = ("space", None)
+    with pool.lease("space") as old:
+        pool._rebuild(key, pool._entries[key])
+        assert not old.closed  # задача на старом клиенте ещё идёт
+        with pool.lease("space") as new:
+            assert new is not old
+    assert old.closed
+    assert not new.closed
+    pool.close_all()
+    assert new.closed
+
+
+def test_idle_client_is_closed_on_rebuild_immediately():
+    pool = _pool()
+    key = ("space", None)
+    with pool.lease("space") as old:
+        pass
+    pool._rebuild(key, pool._entries[key])
+    assert old.closed
@@ -0,0 +1,43 @@
+import time
+
+from app.services.image.health import CLOSED, HALF_OPEN, OPEN, HealthRegistry
+
+
+def _open_then_cool_down(registry: HealthRegistry, name: str, monkeypatch) -> None:
+    for _ in range(2):
+        registry.record_failure(name, 1.0, "error")
+    assert registry.stats()[name]["state"] == OPEN
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 3600)
+
+
+def test_only_one_probe_passes_in_half_open(monkeypatch):
+    registry = HealthRegistry()
+    _open_then_cool_down(registry, "Flaky", monkeypatch)
+    probe = registry.try_acquire("Flaky")
+    assert probe and registry.stats()["Flaky"]["state"] == HALF_OPEN
+    assert registry.try_acquire("Flaky") is None
+    registry.record_success("Flaky", 1.0)
+    assert registry.stats()["Flaky"]["state"] == CLOSED
+    assert registry.try_acquire("Flaky") == 0.0
+
+
+def test_cancelling_a_non_probe_attempt_keeps_the_probe(monkeypatch):
+    registry = HealthRegistry()
+    # Обычная попытка стартовала при закрытом breaker…
+    ordinary = registry.try_acquire("Flaky")
+    assert ordinary == 0.0
+    # …пока другие открыли его, и ушла проба
+    _open_then_cool_down(registry, "Flaky", monkeypatch)
+    probe = registry.try_acquire("Flaky")
+    assert probe
+
+    registry.release("Flaky", ordinary)
+    registry.release("Flaky", probe - 1)            # билет чужой, давно зависшей пробы
+    assert registry.stats()["Flaky"]["state"] == HALF_OPEN
+    assert registry.try_acquire("Flaky") is None    # вторая проба не проходит
+
+    # Отмена самой пробы освобождает слот
+    registry.release("Flaky", probe)
+    assert registry.stats()["Flaky"]["state"] == OPEN
+    assert registry.try_acquire("Flaky")
@@ -0,0 +1,55 @@
+import time
+import asyncio
+import sqlite3
+
+from app.services.image import orchestrator
+from app.services.image.base import ImageProvider
+from app.services.image.health import HealthRegistry
+from app.services.image.health_store import SQLiteHealthStore
+
+
+class Quick(ImageProvider):
+    expected_latency = 0.01
+
+    @property
+    def name(self):
+        return "Quick"
+
+    def generate(self, prompt, negative_prompt, width, height, deadline=None):
+        return b"png"
+
+    async def agenerate(self, prompt, negative_prompt, width, height, deadline=None):
+        return b"png"
+
+
+def test_sqlite_lock_wait_does_not_block_event_loop(tmp_path, monkeypatch):
+    path = str(tmp_path / "health.db")
+    registry = HealthRegistry(SQLiteHealthStore(path))
+    monkeypatch.setattr(orchestrator, "provider_health", registry)
+    monkeypatch.setattr(orchestrator, "_provider_chain", lambda: [Quick])
+
+    # Другой «воркер» держит транзакцию: запись состояния ждёт busy_timeout
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        asyncio.get_running_loop().call_later(0.3, other.execute, "COMMIT")
+        started = time.monotonic()
+        result = await orchestrator.generate_image_async("cat", "", 512, 512)
+        ticking.cancel()
+        return result, ticks, time.monotonic() - started
+
+    result, ticks, elapsed = asyncio.run(scenario())
+    assert result == b"png"
+    assert elapsed >= 0.25  # действительно ждали блокировку
+    assert ticks >= 10      # а event loop всё это время работал
+    assert registry.stats()["Quick"]["attempts"] == 1
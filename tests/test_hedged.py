@@ -0,0 +1,66 @@
+import time
+import itertools
+
+from app.services.image.base import ImageProvider
+from app.services.image import orchestrator
+
+_names = itertools.count()
+
+
+def _provider(delay: float, result: bytes = b"png", error: Exception = None, calls: list = None):
+    """Провайдер-заглушка: ждёт delay секунд, потом отдаёт result или падает с error"""
+
+    class Stub(ImageProvider):
+        @property
+        def name(self):
+            return type(self).__name__
+
+        def generate(self, prompt, negative_prompt, width, height, deadline=None):
+            if calls is not None:
+                calls.append((type(self).__name__, time.monotonic()))
+            time.sleep(delay)
+            if error is not None:
+                raise error
+            return result
+
+    Stub.__name__ = Stub.__qualname__ = f"HedgeStub{next(_names)}"
+    return Stub
+
+
+def test_slow_provider_is_overtaken_after_hedge_delay():
+    calls = []
+    slow = _provider(1.0, b"slow", calls=calls)
+    fast = _provider(0.01, b"fast", calls=calls)
+    started = time.monotonic()
+    errors = []
+    assert orchestrator._run_hedged([slow, fast], "cat", "", 512, 512, 0.05, errors) == b"fast"
+    assert time.monotonic() - started < 0.5
+    # Второй стартовал не сразу, а спустя hedge_delay
+    assert calls[1][1] - calls[0][1] >= 0.04
+    assert errors == []
+
+
+def test_zero_delay_races_all_providers():
+    calls = []
+    chain = [_provider(0.2, calls=calls) for _ in range(3)]
+    assert orchestrator._run_hedged(chain, "cat", "", 512, 512, 0, []) == b"png"
+    assert len(calls) == 3
+    assert calls[-1][1] - calls[0][1] < 0.1
+
+
+def test_failure_launches_the_next_provider_without_waiting():
+    calls = []
+    broken = _provider(0.01, error=RuntimeError("boom"), calls=calls)
+    good = _provider(0.01, b"good", calls=calls)
+    errors = []
+    started = time.monotonic()
+    assert orchestrator._run_hedged([broken, good], "cat", "", 512, 512, 5.0, errors) == b"good"
+    assert time.monotonic() - started < 1.0
+    assert len(errors) == 1 and "boom" in errors[0]
+
+
+def test_all_failed_returns_none():
+    chain = [_provider(0.01, error=RuntimeError("down")) for _ in range(2)]
+    errors = []
+    assert orchestrator._run_hedged(chain, "cat", "", 512, 512, 0.05, errors) is None
+    assert len(errors) == 2
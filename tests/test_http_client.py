@@ -0,0 +1,29 @@
+import asyncio
+
+import httpx
+
+from app.services.image import http_client
+
+
+def test_sessions_are_shared_per_host():
+    first = http_client.get_session("https://api.example.com/v1/generate")
+    assert http_client.get_session("https://api.example.com/v1/status") is first
+    assert http_client.get_session("https://cdn.example.com/image.png") is not first
+    assert "api.example.com" in http_client.pool_stats()["sessions"]
+
+
+def test_pool_stats_report_the_async_pool():
+    async def scenario():
+        http_client.get_async_client()
+        stats = http_client.pool_stats()["async_client"]
+        await http_client.aclose_async_client()
+        return stats
+
+    assert asyncio.run(scenario()) == {"connections": 0, "idle": 0}
+
+
+def test_pool_stats_survive_unknown_transport(monkeypatch):
+    # Внутренности httpx другие (или транспорт свой) — статистика пустая, а не исключение
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+    monkeypatch.setattr(http_client, "_async_client", client)
+    assert http_client.pool_stats()["async_client"] == {"connections": None, "idle": None}
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routers import image_router
+from app.services.image import jobs as jobs_module
+from app.services.image.jobs import JobManager, JobQueueFull, DONE, RUNNING
+
+_PARAMS = {"prompt": "cat", "negative_prompt": "", "width": 512, "height": 512}
+
+
+async def _stuck_generate(**params):
+    await asyncio.Event().wait()
+
+
+async def _wait_for(predicate, timeout: float = 2.0) -> None:
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+def test_full_queue_raises_with_retry_after_from_depth_and_throughput(monkeypatch):
+    monkeypatch.setattr(jobs_module, "generate_image_async", _stuck_generate)
+
+    async def scenario():
+        manager = JobManager(workers=1, queue_size=1, ttl=60, job_time=10)
+        first = manager.submit(_PARAMS, use_cache=False)
+        await _wait_for(lambda: manager.get(first.id).status == RUNNING)
+        manager.submit(_PARAMS, use_cache=False)             # единственное место в очереди
+        with pytest.raises(JobQueueFull) as rejected:
+            manager.submit(_PARAMS, use_cache=False)
+        # (1 в очереди + 1) × 10 с / 1 воркер
+        assert rejected.value.retry_after == 20
+        manager.job_ewma = 100
+        assert manager.retry_after() == 200
+        await manager.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_full_job_queue_answers_503_with_retry_after(monkeypatch):
+    monkeypatch.setattr(jobs_module, "generate_image_async", _stuck_generate)
+    manager = JobManager(workers=1, queue_size=1, ttl=60, job_time=10)
+    monkeypatch.setattr(image_router, "image_jobs", manager)
+    app = FastAPI()
+    app.include_router(image_router.router, prefix="/api/image")
+
+    def submit(client):
+        return client.post("/api/image/jobs", params={"prompt": "cat", "cache": "false"},
+                           headers={"x-token": "test-key"})
+
+    with TestClient(app) as client:
+        first = submit(client)
+        assert first.status_code == 202
+        client.portal.call(_wait_for, lambda: manager.get(first.json()["job_id"]).status == RUNNING)
+        assert submit(client).status_code == 202
+
+        rejected = submit(client)
+        assert rejected.status_code == 503
+        assert rejected.headers["Retry-After"] == "20"
+        assert manager.stats()["queued"] == 1
+        client.portal.call(manager.shutdown)
+
+
+def test_idle_manager_forgets_expired_results(monkeypatch):
+    async def generate(**params):
+        return b"png"
+
+    monkeypatch.setattr(jobs_module, "generate_image_async", generate)
+
+    async def scenario():
+        manager = JobManager(workers=1, queue_size=10, ttl=0.1)
+        job = manager.submit(_PARAMS, use_cache=False)
+        await _wait_for(lambda: job.status == DONE)
+        assert manager.get(job.id) is job
+        # Новых задач нет — результат всё равно забывается по таймеру
+        await _wait_for(lambda: manager.get(job.id) is None)
+        assert manager.stats()["result_bytes"] == 0
+        await manager.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_results_over_the_byte_limit_drop_the_oldest_jobs(monkeypatch):
+    async def generate(**params):
+        return b"1234"
+
+    monkeypatch.setattr(jobs_module, "generate_image_async", generate)
+
+    async def scenario():
+        manager = JobManager(workers=1, queue_size=10, ttl=3600, max_bytes=10)
+        jobs = [manager.submit(_PARAMS, use_cache=False) for _ in range(3)]
+        await _wait_for(lambda: all(job.status == DONE for job in jobs))
+        assert manager.get(jobs[0].id) is None
+        assert manager.get(jobs[1].id) is jobs[1] and manager.get(jobs[2].id) is jobs[2]
+        assert manager.stats()["result_bytes"] == 8
+        await manager.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,42 @@
+import time
+
+from app.services.image.limits import ProviderLimiter, TokenBucket
+
+
+class Narrow:
+    max_concurrency = 1
+
+
+class Throttled:
+    rate_per_minute = 60
+    rate_burst = 2
+
+
+def test_concurrency_limit_frees_a_slot_on_release():
+    limiter = ProviderLimiter()
+    assert limiter.try_acquire(Narrow)
+    assert not limiter.try_acquire(Narrow)
+    limiter.release(Narrow)
+    assert limiter.try_acquire(Narrow)
+    assert limiter.stats()["Narrow"]["rejected"] == 1
+
+
+def test_rate_limit_allows_a_burst_then_refills(monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    limiter = ProviderLimiter()
+    assert limiter.try_acquire(Throttled) and limiter.try_acquire(Throttled)
+    assert not limiter.try_acquire(Throttled)
+
+    # 60 в минуту — через секунду появляется ровно один токен
+    monkeypatch.setattr(time, "monotonic", lambda: now + 1.0)
+    assert limiter.try_acquire(Throttled)
+    assert not limiter.try_acquire(Throttled)
+
+
+def test_token_bucket_reports_wait_time(monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    bucket = TokenBucket(rate_per_minute=30, burst=1)
+    assert bucket.try_take()
+    assert bucket.wait_time() == 2.0
@@ -0,0 +1,56 @@
+import asyncio
+
+from app.services.image import orchestrator
+from app.services.image.base import ImageProvider
+from app.services.metrics import Registry, metrics
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    requests = registry.counter("demo_requests_total", "Requests", ["route"])
+    latency = registry.histogram("demo_seconds", "Latency", buckets=(0.1, 1.0))
+    registry.gauge("demo_queue", "Queue depth", collect=lambda: 3)
+
+    requests.inc(route='/a"b')
+    requests.inc(2, route='/a"b')
+    latency.observe(0.05)
+    latency.observe(0.5)
+    text = registry.render()
+
+    assert "# TYPE demo_requests_total counter" in text
+    assert 'demo_requests_total{route="/a\\"b"} 3' in text
+    assert 'demo_seconds_bucket{le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{le="+Inf"} 2' in text
+    assert "demo_seconds_count 2" in text
+    assert "demo_queue 3" in text
+
+
+def test_same_name_returns_the_registered_metric():
+    registry = Registry()
+    assert registry.counter("demo_total", "x") is registry.counter("demo_total", "x")
+
+
+class Counted(ImageProvider):
+    expected_latency = 0.01
+
+    @property
+    def name(self):
+        return "Counted"
+
+    def generate(self, prompt, negative_prompt, width, height, deadline=None):
+        return b"png"
+
+
+def _line(text: str, prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_provider_attempts_are_exported(monkeypatch):
+    monkeypatch.setattr(orchestrator, "_provider_chain", lambda: [Counted])
+    series = 'image_provider_attempts_total{provider="Counted",outcome="success"}'
+    before = _line(metrics.render(), series)
+    assert asyncio.run(orchestrator.generate_image_async("cat", "", 512, 512)) == b"png"
+    assert _line(metrics.render(), series) == before + 1
@@ -0,0 +1,36 @@
+import time
+
+import pytest
+
+from app.services.image.poller import PollScheduler
+
+
+class SchedulerBroken(BaseException):
+    """Не Exception — _poll её не перехватывает, как настоящую поломку планировщика"""
+
+
+def test_poll_tasks_are_tracked_and_released():
+    scheduler = PollScheduler()
+    polls = []
+
+    async def poll(client):
+        polls.append(time.monotonic())
+        return "https://example/image.png" if len(polls) >= 2 else None
+
+    future = scheduler.submit("Stub", poll, timeout=5, typical=0.01, min_interval=0.01)
+    assert future.result(timeout=5) == "https://example/image.png"
+    deadline = time.monotonic() + 2
+    while scheduler._tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not scheduler._tasks
+
+
+def test_crashed_poll_task_fails_the_job_instead_of_hanging():
+    scheduler = PollScheduler()
+
+    async def poll(client):
+        raise SchedulerBroken("boom")
+
+    future = scheduler.submit("Stub", poll, timeout=5, typical=0.01, min_interval=0.01)
+    with pytest.raises(SchedulerBroken):
+        future.result(timeout=5)
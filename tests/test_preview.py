@@ -0,0 +1,101 @@
+import asyncio
+import itertools
+
+from app.services.image.base import ImageProvider
+from app.services.image import jobs as jobs_module
+from app.services.image import orchestrator
+from app.services.image.jobs import JobManager, DONE
+
+_PARAMS = {"prompt": "cat", "negative_prompt": "", "width": 512, "height": 512}
+_names = itertools.count()
+
+
+async def _wait_for(predicate, timeout: float = 2.0) -> None:
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+def _stub(result: bytes):
+    class Stub(ImageProvider):
+        expected_latency = 1.0
+
+        @property
+        def name(self):
+            return type(self).__name__
+
+        def generate(self, prompt, negative_prompt, width, height, deadline=None):
+            return result
+
+    Stub.__name__ = Stub.__qualname__ = f"PreviewStub{next(_names)}"
+    return Stub
+
+
+def test_preview_arrives_before_the_final_image(monkeypatch):
+    release = asyncio.Event()
+
+    async def generate(**params):
+        await release.wait()
+        return b"final"
+
+    async def preview(**params):
+        return b"draft"
+
+    monkeypatch.setattr(jobs_module, "generate_image_async", generate)
+    monkeypatch.setattr(jobs_module, "generate_image_preview", preview)
+
+    async def scenario():
+        manager = JobManager(workers=1, queue_size=1, ttl=60)
+        job = manager.submit(_PARAMS, use_cache=False, preview=True)
+        await _wait_for(lambda: job.preview_result is not None)
+        assert job.summary()["preview"] == "ready" and job.status != DONE
+        release.set()
+        await _wait_for(lambda: job.status == DONE)
+        phases = [event["phase"] for event in job.events]
+        assert phases.index("preview") < phases.index(DONE)
+        assert job.result == b"final" and job.preview_result == b"draft"
+        await manager.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_late_preview_is_cancelled_by_the_final_image(monkeypatch):
+    started, cancelled = asyncio.Event(), []
+
+    async def generate(**params):
+        await started.wait()
+        return b"final"
+
+    async def preview(**params):
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    monkeypatch.setattr(jobs_module, "generate_image_async", generate)
+    monkeypatch.setattr(jobs_module, "generate_image_preview", preview)
+
+    async def scenario():
+        manager = JobManager(workers=1, queue_size=1, ttl=60)
+        job = manager.submit(_PARAMS, use_cache=False, preview=True)
+        await _wait_for(lambda: job.status == DONE and cancelled)
+        assert job.summary()["preview"] == "none"
+        assert "preview" not in [event["phase"] for event in job.events]
+        await manager.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_preview_skips_the_provider_busy_with_the_main_image(monkeypatch):
+    main, fast = _stub(b"final"), _stub(b"draft")
+    monkeypatch.setattr(orchestrator, "ADAPTIVE_RANKING", False)
+
+    monkeypatch.setattr(orchestrator, "_provider_chain", lambda: [main])
+    assert asyncio.run(orchestrator.generate_image_preview(**_PARAMS)) is None
+
+    monkeypatch.setattr(orchestrator, "_provider_chain", lambda: [main, fast])
+    assert asyncio.run(orchestrator.generate_image_preview(**_PARAMS)) == b"draft"
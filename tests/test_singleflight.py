@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from app.services.image.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"png"
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+        assert flight.in_flight() == 0
+        # Ключ освободился — следующий вызов запускает работу заново
+        await flight.do("k", work)
+        return results
+
+    assert asyncio.run(scenario()) == [b"png"] * 5
+    assert len(calls) == 2
+
+
+def test_error_is_shared_and_other_keys_are_independent():
+    flight = SingleFlight()
+    calls = []
+
+    async def fail():
+        calls.append("fail")
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+
+    async def ok():
+        calls.append("ok")
+        return b"png"
+
+    async def scenario():
+        return await asyncio.gather(flight.do("a", fail), flight.do("a", fail), flight.do("b", ok),
+                                    return_exceptions=True)
+
+    first, second, other = asyncio.run(scenario())
+    assert isinstance(first, RuntimeError) and second is first
+    assert other == b"png"
+    assert sorted(calls) == ["fail", "ok"]
+
+
+def test_shared_work_survives_one_waiter_and_stops_with_the_last():
+    flight = SingleFlight()
+
+    async def scenario():
+        gate = asyncio.Event()
+        cancelled = []
+
+        async def work():
+            try:
+                await gate.wait()
+                return b"png"
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        first = asyncio.create_task(flight.do("k", work))
+        second = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        assert not cancelled and flight.in_flight() == 1
+        gate.set()
+        assert await second == b"png"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+        # Все ожидающие ушли — общая работа отменяется
+        gate.clear()
+        lone = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        lone.cancel()
+        await asyncio.sleep(0.01)
+        assert cancelled == [True] and flight.in_flight() == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import asyncio
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from app.services import speech
+from app.services.speech import NeuroKeyStore, NeuroKeys
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_app_import_leaves_heavy_modules_unloaded(tmp_path):
+    # Чистый интерпретатор: в процессе тестов эти модули мог загрузить кто-то ещё
+    code = ("import sys, json, app.main\n"
+            "from app.services.startup import LAZY_MODULES\n"
+            "print(json.dumps([m for m in LAZY_MODULES if m in sys.modules]))")
+    env = dict(os.environ, PYTHONPATH=str(ROOT), API_KEY="test-key", IMAGE_PREWARM="0")
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
+
+
+def test_key_store_keeps_old_key_when_refresh_fails(monkeypatch):
+    store = NeuroKeyStore(ttl=60)
+    loads = []
+
+    async def load():
+        loads.append(1)
+        if len(loads) > 1:
+            raise OSError("network down")
+        return NeuroKeys("client", "server")
+
+    monkeypatch.setattr(store, "_load", load)
+
+    async def scenario():
+        first = await store.get()
+        # Повторный запрос — из кэша, без похода в сеть
+        assert await store.get() is first
+        assert len(loads) == 1
+        # Обновление после отказа авторизации упало — остаётся прежний ключ
+        assert await store.get(refresh=True) is first
+        assert len(loads) == 2
+
+    asyncio.run(scenario())
+
+
+def test_key_store_without_keys_reports_unavailable(monkeypatch):
+    monkeypatch.setitem(speech.key_data, "private_key", None)
+    with pytest.raises(RuntimeError, match="unavailable"):
+        asyncio.run(NeuroKeyStore().get())
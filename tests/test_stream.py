@@ -0,0 +1,61 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services.image import orchestrator, stream as stream_module
+from app.services.image.base import ImageProvider
+from app.services.image.stream import ImageStream, ImageTooLarge
+
+
+def _client(body: bytes, headers: dict = None) -> httpx.AsyncClient:
+    def handler(request):
+        return httpx.Response(200, headers=headers or {}, stream=httpx.ByteStream(body))
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_open_streams_the_body_and_keeps_the_content_type():
+    async def scenario():
+        async with _client(b"x" * 10, {"content-type": "image/webp", "content-length": "10"}) as client:
+            image = await ImageStream.open(client, "https://cdn.example.com/a.webp", "Test")
+            return image.content_type, image.size, await image.read(), image.received
+
+    assert asyncio.run(scenario()) == ("image/webp", 10, b"x" * 10, 10)
+
+
+def test_oversized_download_is_refused_up_front(monkeypatch):
+    monkeypatch.setattr(stream_module, "MAX_IMAGE_BYTES", 5)
+
+    async def scenario():
+        async with _client(b"x" * 10, {"content-length": "10"}) as client:
+            await ImageStream.open(client, "https://cdn.example.com/a.png", "Test")
+
+    with pytest.raises(ImageTooLarge):
+        asyncio.run(scenario())
+
+
+def test_body_over_the_limit_without_content_length_is_cut(monkeypatch):
+    monkeypatch.setattr(stream_module, "MAX_IMAGE_BYTES", 5)
+
+    async def chunks():
+        for _ in range(3):
+            yield b"xxx"
+
+    with pytest.raises(ImageTooLarge):
+        asyncio.run(ImageStream(chunks(), "Test").read())
+
+
+class StreamStub(ImageProvider):
+    @property
+    def name(self):
+        return "StreamStub"
+
+    def generate(self, prompt, negative_prompt, width, height, deadline=None):
+        return b"png"
+
+
+def test_provider_without_native_stream_is_served_as_one_chunk(monkeypatch):
+    monkeypatch.setattr(orchestrator, "_provider_chain", lambda: [StreamStub])
+    image = asyncio.run(orchestrator.generate_image_stream("cat", "", 512, 512))
+    assert image.source == "StreamStub" and image.size == 3
+    assert asyncio.run(image.read()) == b"png"
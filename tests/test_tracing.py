@@ -0,0 +1,62 @@
+import asyncio
+
+from app.services import tracing
+from app.services.image import jobs as jobs_module
+from app.services.image.jobs import JobManager, DONE
+
+
+def test_job_workers_do_not_write_into_the_submitting_request_trace(monkeypatch):
+    async def fake_generate(**params):
+        with tracing.span("queue", provider="Stub"):
+            await asyncio.sleep(0)
+        return b"png"
+
+    monkeypatch.setattr(jobs_module, "generate_image_async", fake_generate)
+    manager = JobManager(workers=1, queue_size=10, ttl=60)
+
+    async def scenario():
+        # Первый submit — внутри трассы запроса: воркеры создаются в его контексте
+        with tracing.traced("POST", "/api/image/jobs") as request_trace:
+            first = manager.submit({"prompt": "cat", "negative_prompt": "", "width": 512, "height": 512},
+                                   use_cache=False)
+        second = manager.submit({"prompt": "dog", "negative_prompt": "", "width": 512, "height": 512},
+                                use_cache=False)
+        while second.status != DONE or first.status != DONE:
+            await asyncio.sleep(0.01)
+        await manager.shutdown()
+        return request_trace, first, second
+
+    request_trace, first, second = asyncio.run(scenario())
+    assert request_trace.spans == []
+    assert first.trace_id and second.trace_id and first.trace_id != second.trace_id
+
+
+def test_trace_span_count_is_capped(monkeypatch):
+    monkeypatch.setattr(tracing, "_MAX_SPANS", 3)
+    trace = tracing.Trace()
+    for i in range(10):
+        trace.add("poll", 0.0, 0.1)
+    assert len(trace.spans) == 3
+    assert trace.as_dict()["dropped_spans"] == 7
+
+
+def test_metrics_and_traces_require_a_key(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.api.routers import metrics_router
+
+    app = FastAPI()
+    app.include_router(metrics_router.router)
+    client = TestClient(app)
+    monkeypatch.setattr(tracing, "TRACE_DEBUG", True)
+
+    # Без METRICS_TOKEN открытыми они не становятся
+    monkeypatch.setattr(metrics_router, "_TOKEN", "")
+    for path in ("/metrics", "/debug/traces"):
+        assert client.get(path).status_code == 401
+        assert client.get(path, headers={"x-token": "wrong"}).status_code == 401
+        assert client.get(path, headers={"x-token": "test-key"}).status_code == 200
+
+    monkeypatch.setattr(metrics_router, "_TOKEN", "scrape")
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape"}).status_code == 200
+    assert client.get("/metrics", headers={"Authorization": "Bearer nope"}).status_code == 401
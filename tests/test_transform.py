@@ -0,0 +1,32 @@
+import asyncio
+
+from app.services.image import transform as transform_module
+from app.services.image.cache import ImageCache
+from app.services.image.transform import OutputSpec, cached_transform
+
+PNG = b"\x89PNG\r\n\x1a\n"
+
+
+def test_variant_is_keyed_by_source_bytes(tmp_path, monkeypatch):
+    cache = ImageCache(1024 * 1024, str(tmp_path), 1024 * 1024, ttl=60)
+    monkeypatch.setattr(transform_module, "image_cache", cache)
+    calls = []
+
+    async def fake_transform(data, spec):
+        calls.append(data)
+        return b"RIFF\x00\x00\x00\x00WEBP" + data, "image/webp"
+
+    monkeypatch.setattr(transform_module, "transform", fake_transform)
+    spec = OutputSpec("webp", 80, "none", 512, 512)
+
+    async def scenario():
+        first, _ = await cached_transform(PNG + b"first", spec)
+        again, _ = await cached_transform(PNG + b"first", spec)
+        # Та же генерация перегенерирована с другим результатом — вариант должен быть новым
+        second, _ = await cached_transform(PNG + b"second", spec)
+        return first, again, second
+
+    first, again, second = asyncio.run(scenario())
+    assert first == again
+    assert second.endswith(b"second")
+    assert calls == [PNG + b"first", PNG + b"second"]